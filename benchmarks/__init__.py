@@ -0,0 +1,5 @@
+"""
+Benchmarks of the interpreters, the memory and the explorer on synthetic programs.
+
+Run them with `python -m benchmarks.runner`, see runner.py.
+"""
@@ -0,0 +1,190 @@
+"""
+Synthetic workloads. Every generator returns a Workload, whose run() builds fresh inputs (GetInput sources are
+consumed by a run), executes the program once and returns the number of units of work done (statements or
+paths) and any extra metrics.
+
+A workload given runs > 1 builds its program once and runs it that many times with the same interpreter, on a new
+context each time: the case the caches kept per Program (compiled code, block rules, the static taint analysis)
+are meant for. Only programs without GetInput can be run again.
+"""
+from symbolic_engine import (Program, Assign, AddOp, MulOp, Value, GetInput, IF, Var, UInt32, Store, Load, Goto, EQ,
+                             Context, Memory, Interpreter, ConcolicInterpreter, IdProvider, DefaultTaintPolicy,
+                             DefaultTaintCheckHandler)
+from symbolic_engine.cfg import BlockInterpreter
+from symbolic_engine.compiler import CompiledInterpreter
+from symbolic_engine.static_taint import StaticTaintInterpreter
+from symbolic_engine.explorer import Explorer
+
+
+def new_context(program):
+    return Context(Memory(), {}, UInt32(0), program)
+
+
+class Workload(object):
+    """A program together with the way it is run"""
+    unit = 'statements'
+
+    def __init__(self, name, build, units, interpreter_class=Interpreter, runs=1):
+        """
+        @param build: callable returning a new Program
+        @param units: units of work done by one run of the program
+        @param interpreter_class: class of the interpreter running it, built with the default taint policy and
+        handler
+        @param runs: times the program is run
+        """
+        self.name = name
+        self.build = build
+        self.units = units * runs
+        self.interpreter_class = interpreter_class
+        self.runs = runs
+
+    def interpreter(self):
+        return self.interpreter_class(DefaultTaintPolicy(), DefaultTaintCheckHandler())
+
+    def run_program(self):
+        """
+        @return: the context of the last run
+        """
+        program = self.build()
+        interpreter = self.interpreter()
+        for _ in range(self.runs):
+            context = interpreter.run(new_context(program))
+        return context
+
+    def run(self):
+        """
+        @return: units of work done and a dict of extra metrics
+        """
+        self.run_program()
+        return self.units, {}
+
+
+class MemoryWorkload(Workload):
+    def run(self):
+        context = self.run_program()
+        pages = context.memory.pages.values()
+        return self.units, {'pages': len(pages), 'bytes_per_page': sum(page.nbytes() for page in pages) / len(pages)}
+
+
+class ExplorationWorkload(Workload):
+    unit = 'paths'
+
+    def run(self):
+        explorer = Explorer(DefaultTaintPolicy(), DefaultTaintCheckHandler(), processes=0)
+        paths = len(list(explorer.explore(new_context(self.build()))))
+        assert paths == self.units, "explored %d paths instead of %d" % (paths, self.units)
+        return paths, {}
+
+
+def straight_line(statements, interpreter_class=Interpreter):
+    """
+    Long arithmetic basic block: every statement combines the two previous variables
+    """
+
+    def build():
+        stmts = [Assign("X0", GetInput([UInt32(3)])), Assign("X1", Value(UInt32(5)))]
+        for index in range(2, statements):
+            previous = Var("X%d" % (index - 1))
+            stmts.append(Assign("X%d" % index, AddOp(MulOp(previous, Value(UInt32(3))), Var("X%d" % (index - 2)))))
+        return Program(stmts)
+
+    return Workload("straight_line_%s" % interpreter_class.__name__, build, statements, interpreter_class)
+
+
+def workload_name(name, interpreter_class, runs):
+    if runs > 1:
+        name = "%s_x%d" % (name, runs)
+    return "%s_%s" % (name, interpreter_class.__name__)
+
+
+def tight_loop(iterations, interpreter_class=Interpreter, runs=1):
+    """
+    Counter loop closed by an IF and a Goto
+    """
+
+    def build():
+        return Program([
+            Assign("I", Value(0)),
+            Assign("I", AddOp(Var("I"), Value(1))),
+            IF(EQ(Var("I"), Value(iterations)), Value(UInt32(4)), Value(UInt32(3))),
+            Goto(Value(UInt32(1))),
+            Assign("DONE", Var("I"))
+        ])
+
+    return Workload(workload_name("tight_loop", interpreter_class, runs), build, 3 * iterations + 1,
+                    interpreter_class, runs)
+
+
+def memory_sweep(pages, cells_per_page=64, page_size=4096, interpreter_class=Interpreter, runs=1):
+    """
+    Stores spread over many pages, then loads of every stored cell
+    """
+    addresses = [page * page_size + cell * (page_size / cells_per_page)
+                 for page in range(pages) for cell in range(cells_per_page)]
+
+    def build():
+        stmts = [Store(Value(UInt32(address)), Value(UInt32(address & 0xffff))) for address in addresses]
+        stmts.extend(Assign("L", Load(Value(UInt32(address)))) for address in addresses)
+        return Program(stmts)
+
+    return MemoryWorkload(workload_name("memory_sweep", interpreter_class, runs), build, 2 * len(addresses),
+                          interpreter_class, runs)
+
+
+def taint_chain(length, interpreter_class=Interpreter):
+    """
+    A tainted input mixed into every value, and stored at tainted addresses
+    """
+
+    def build():
+        stmts = [Assign("T0", GetInput([UInt32(7)]))]
+        for index in range(1, length):
+            previous = Var("T%d" % (index - 1))
+            if index % 4:
+                stmts.append(Assign("T%d" % index, AddOp(previous, Value(UInt32(index)))))
+            else:
+                stmts.append(Store(AddOp(Var("T0"), Value(UInt32(index * 4))), previous))
+                stmts.append(Assign("T%d" % index, Load(AddOp(Var("T0"), Value(UInt32(index * 4))))))
+        return Program(stmts)
+
+    statements = length + (length - 1) / 4
+    return Workload("taint_chain_%s" % interpreter_class.__name__, build, statements, interpreter_class)
+
+
+def branch_tree(depth):
+    """
+    depth symbolic IFs in a row; every one of the 2 ** depth paths is feasible
+    """
+
+    def build():
+        stmts = []
+        for index in range(depth):
+            base = len(stmts)
+            stmts += [
+                Assign("X%d" % index, GetInput([])),
+                IF(EQ(Var("X%d" % index), Value(UInt32(index))), Value(UInt32(base + 2)), Value(UInt32(base + 4))),
+                Assign("F%d" % index, Value(UInt32(1))),
+                Goto(Value(UInt32(base + 5))),
+                Assign("F%d" % index, Value(UInt32(0)))
+            ]
+        return Program(stmts)
+
+    return ExplorationWorkload("branch_tree", build, 2 ** depth, ConcolicInterpreter)
+
+
+def default_workloads(scale=1):
+    """
+    @param scale: multiplies the size of every workload
+    @return: list of Workload
+    """
+    workloads = []
+    for interpreter_class in (Interpreter, BlockInterpreter, StaticTaintInterpreter, CompiledInterpreter):
+        workloads += [
+            straight_line(2000 * scale, interpreter_class),
+            tight_loop(5000 * scale, interpreter_class),
+            memory_sweep(16 * scale, interpreter_class=interpreter_class),
+            memory_sweep(4 * scale, interpreter_class=interpreter_class, runs=8),
+            taint_chain(2000 * scale, interpreter_class)
+        ]
+    workloads.append(branch_tree(6 + scale / 2))
+    return workloads
@@ -0,0 +1,153 @@
+"""
+Runs the workloads of benchmarks.generators, each in its own process so its peak memory can be measured, and
+writes the results as JSON. Given a baseline (a previous results file) it flags every workload whose throughput
+dropped, or whose peak memory grew, by more than the tolerance, and exits with status 1 if there is any.
+
+    python -m benchmarks.runner --output results.json --baseline benchmarks/baseline.json
+    python -m benchmarks.runner --quick straight_line_Interpreter tight_loop_Interpreter
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import Queue
+import resource
+import sys
+import time
+
+from benchmarks.generators import default_workloads
+
+
+def measure(workload, repeat):
+    """
+    Runs a workload repeat times in this process
+    @return: dict of metrics, with the best time of the runs
+    """
+    best = None
+    extra = {}
+    units = 0
+    for _ in range(repeat):
+        start = time.time()
+        units, extra = workload.run()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    result = {
+        'unit': workload.unit,
+        'units': units,
+        'seconds': best,
+        'throughput': units / best if best else float('inf'),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+    result.update(extra)
+    return result
+
+
+def _measure_in_child(workload, repeat, results):
+    try:
+        results.put(measure(workload, repeat))
+    except Exception, e:
+        results.put({'error': "%s: %s" % (e.__class__.__name__, e)})
+
+
+def measure_isolated(workload, repeat, poll=1.0):
+    """
+    Same as measure, in a new process so that peak_rss_kb belongs to this workload only. A child that dies
+    without putting its result (killed, out of memory, os._exit) gives an error result instead of a hang.
+    @param poll: seconds between two checks that the child is still alive
+    """
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure_in_child, args=(workload, repeat, results))
+    process.start()
+    result = None
+    while result is None:
+        try:
+            result = results.get(timeout=poll)
+        except Queue.Empty:
+            if process.exitcode is not None:
+                # the result may have been put just before the exit
+                try:
+                    result = results.get(timeout=poll)
+                except Queue.Empty:
+                    result = {'error': "the benchmark process exited with code %s" % process.exitcode}
+    process.join()
+    return result
+
+
+def run_benchmarks(workloads, repeat=3, isolated=True):
+    """
+    @return: the results document, see compare
+    """
+    measure_workload = measure_isolated if isolated else measure
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'benchmarks': dict((workload.name, measure_workload(workload, repeat)) for workload in workloads)
+    }
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    @param results: document returned by run_benchmarks
+    @param baseline: an earlier such document
+    @param tolerance: relative change allowed
+    @return: list of messages, one per regression
+    """
+    regressions = []
+    for name, result in sorted(results['benchmarks'].iteritems()):
+        if 'error' in result:
+            regressions.append("%s failed: %s" % (name, result['error']))
+            continue
+        expected = baseline['benchmarks'].get(name)
+        if expected is None or 'error' in expected:
+            continue
+        if result['throughput'] < expected['throughput'] * (1 - tolerance):
+            regressions.append("%s: %.0f %s/s, baseline %.0f" % (name, result['throughput'], result['unit'],
+                                                                 expected['throughput']))
+        if result['peak_rss_kb'] > expected['peak_rss_kb'] * (1 + tolerance):
+            regressions.append("%s: peak memory %d KB, baseline %d KB" % (name, result['peak_rss_kb'],
+                                                                          expected['peak_rss_kb']))
+    return regressions
+
+
+def format_results(results):
+    lines = []
+    for name, result in sorted(results['benchmarks'].iteritems()):
+        if 'error' in result:
+            lines.append("%-40s failed: %s" % (name, result['error']))
+        else:
+            lines.append("%-40s %12.0f %s/s %8d KB" % (name, result['throughput'], result['unit'],
+                                                       result['peak_rss_kb']))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the symbolic_engine benchmarks")
+    parser.add_argument('names', nargs='*', help="workloads to run, all by default")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="JSON results to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="relative slowdown or growth allowed")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per workload, the best one counts")
+    parser.add_argument('--scale', type=int, default=1, help="size multiplier of the workloads")
+    parser.add_argument('--quick', action='store_true', help="one run per workload, all in this process")
+    args = parser.parse_args(argv)
+
+    workloads = default_workloads(args.scale)
+    if args.names:
+        workloads = [workload for workload in workloads if workload.name in args.names]
+    results = run_benchmarks(workloads, 1 if args.quick else args.repeat, isolated=not args.quick)
+    print format_results(results)
+    if args.output:
+        with open(args.output, 'w') as stream:
+            json.dump(results, stream, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as stream:
+            regressions = compare(results, json.load(stream), args.tolerance)
+        for regression in regressions:
+            print "REGRESSION", regression
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,70 +3,348 @@ try:
     from exceptions import Exception, NotImplementedError
 except Exception:
     pass
+import mmap
+import os
+import struct
+import sys
+import weakref
+import cPickle
+from array import array
+from symbolic_engine.persistent import PersistentMap
+from symbolic_engine.intervals import IntervalSet
+
+SMALL_CONSTANTS = 256
+
+
+class BitVector(object):
+    """
+    Unsigned machine word of WIDTH bits. The width is fixed by the subclass (BitVec8, BitVec16, UInt32, BitVec64,
+    or any width through bitvector_class). Instances are immutable: arithmetic wraps modulo 2 ** WIDTH and returns
+    a new word, and of() returns shared instances for the small constants.
+    Comparisons and division are unsigned; signed() and the s* methods read the word as two's complement.
+    Plain ints are accepted as the other operand and are reduced to the width of the word.
+    """
+    __slots__ = ('value',)
+    WIDTH = None
+    MASK = None
+    _small = ()
 
-class UInt32(object):
     def __init__(self, value):
         """
         @type value: int
         """
-        assert type(value) == int or type(value) == long, "UInt32 expects int, received %s" % type(value)
-        assert value < (2 ** 32), "Initial value of UInt32 can't be greater than word size (32 bits)"
+        assert type(value) == int or type(value) == long, "%s expects int, received %s" % (
+            self.__class__.__name__, type(value))
+        assert 0 <= value <= self.MASK, "Initial value of %s can't be greater than word size (%d bits)" % (
+            self.__class__.__name__, self.WIDTH)
         self.value = value
 
-    def __div__(self, other):
+    @classmethod
+    def of(cls, value):
         """
-        @type other: UInt32
+        Word holding value modulo 2 ** WIDTH, shared for small values
+        @type value: int
         """
-        return UInt32(self.value / other.value)
+        value &= cls.MASK
+        if value < SMALL_CONSTANTS:
+            return cls._small[value]
+        return cls(value)
 
-    def __divmod__(self, other):
+    def __reduce__(self):
+        return _bitvector, (self.WIDTH, self.value)
+
+    def signed(self):
         """
-        @type other: UInt32
+        @return: the word read as a two's complement int
         """
-        return UInt32(self.value % other.value)
+        value = self.value
+        return value - (1 << self.WIDTH) if value >> (self.WIDTH - 1) else value
 
     def __eq__(self, other):
         """
-        @type other: UInt32
+        @type other: BitVector | int
         """
-        return self.value == other.value
+        return self.value == as_int(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __lt__(self, other):
+        return self.value < (as_int(other) & self.MASK)
+
+    def __le__(self, other):
+        return self.value <= (as_int(other) & self.MASK)
+
+    def __gt__(self, other):
+        return self.value > (as_int(other) & self.MASK)
+
+    def __ge__(self, other):
+        return self.value >= (as_int(other) & self.MASK)
+
+    def slt(self, other):
+        return self.signed() < self.of(as_int(other)).signed()
+
+    def sle(self, other):
+        return self.signed() <= self.of(as_int(other)).signed()
+
+    def sgt(self, other):
+        return self.signed() > self.of(as_int(other)).signed()
+
+    def sge(self, other):
+        return self.signed() >= self.of(as_int(other)).signed()
 
     def __add__(self, other):
         """
-        @type other: UInt32
+        @type other: BitVector | int
         """
-        return UInt32((self.value + other.value) % 32)
+        return self.of(self.value + as_int(other))
 
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self.of(self.value - as_int(other))
+
+    def __rsub__(self, other):
+        return self.of(as_int(other) - self.value)
 
     def __mul__(self, other):
-        return UInt32((self.value * other.value) % 32)
+        return self.of(self.value * as_int(other))
+
+    __rmul__ = __mul__
+
+    def __div__(self, other):
+        """
+        Unsigned division, rounding down
+        @type other: BitVector | int
+        """
+        return self.of(self.value // (as_int(other) & self.MASK))
+
+    __floordiv__ = __truediv__ = __div__
 
+    def __mod__(self, other):
+        return self.of(self.value % (as_int(other) & self.MASK))
+
+    def __divmod__(self, other):
+        return self / other, self % other
+
+    def __lshift__(self, other):
+        shift = as_int(other)
+        return self.of(self.value << shift if shift < self.WIDTH else 0)
+
+    def __rshift__(self, other):
+        """
+        Logical shift, see ashr for the arithmetic one
+        """
+        return self.of(self.value >> as_int(other))
+
+    def ashr(self, other):
+        return self.of(self.signed() >> min(as_int(other), self.WIDTH))
+
+    def __and__(self, other):
+        return self.of(self.value & as_int(other))
+
+    __rand__ = __and__
+
+    def __or__(self, other):
+        return self.of(self.value | as_int(other))
+
+    __ror__ = __or__
+
+    def __xor__(self, other):
+        return self.of(self.value ^ as_int(other))
+
+    __rxor__ = __xor__
+
+    def __invert__(self):
+        return self.of(~self.value)
+
+    def __neg__(self):
+        return self.of(-self.value)
+
+    def __int__(self):
+        return self.value
+
+    __long__ = __index__ = __int__
+
+    def __nonzero__(self):
+        return self.value != 0
 
     def __str__(self):
         return "%d" % (self.value)
-        #return "<%s 0x%08x>" % (self.__class__.__name__, self.value)
+
+    def __repr__(self):
+        return "%s(%d)" % (self.__class__.__name__, self.value)
 
     def isAligned(self):
         return (self.value % 32) == 0
 
 
+_bitvector_classes = {}
+
+
+def bitvector_class(width, name=None):
+    """
+    @return: the BitVector subclass of the given width, created the first time it is asked for
+    @type width: int
+    """
+    cls = _bitvector_classes.get(width)
+    if cls is None:
+        cls = type(name or "BitVec%d" % width, (BitVector,), {'__slots__': (), 'WIDTH': width,
+                                                              'MASK': (1 << width) - 1})
+        cls._small = tuple(cls(value) for value in range(min(SMALL_CONSTANTS, 1 << width)))
+        _bitvector_classes[width] = cls
+    return cls
+
+
+def _bitvector(width, value):
+    return bitvector_class(width)(value)
+
+
+BitVec8 = bitvector_class(8)
+BitVec16 = bitvector_class(16)
+UInt32 = bitvector_class(32, "UInt32")
+BitVec64 = bitvector_class(64)
+
+WORD_MASK = 2 ** 32 - 1
+
+
+def as_int(value):
+    """
+    Unwraps the inner value of a Value into a plain python int
+    @type value: BitVector | int
+    @rtype int
+    """
+    if isinstance(value, BitVector):
+        return value.value
+    return value
+
+
+_STATELESS_SLOTS = frozenset(['_hash', '_factory', '__weakref__', '__dict__'])
+_state_slots = {}
+
+
+def _slot_names(cls):
+    """
+    @return: the slots of a class and its bases that make up the state of its instances
+    """
+    names = _state_slots.get(cls)
+    if names is None:
+        names = []
+        for klass in cls.__mro__:
+            slots = klass.__dict__.get('__slots__', ())
+            if isinstance(slots, str):
+                slots = (slots,)
+            names.extend(name for name in slots if name not in _STATELESS_SLOTS and name not in names)
+        names = _state_slots[cls] = tuple(names)
+    return names
+
+
+def _get_slots_state(self):
+    """
+    Pickled state of a slotted node: its slots, without the cached hash and the owning factory
+    """
+    state = dict((name, getattr(self, name)) for name in _slot_names(self.__class__) if hasattr(self, name))
+    state.update(getattr(self, '__dict__', ()))
+    return state
+
+
+def _set_slots_state(self, state):
+    for name, value in state.iteritems():
+        setattr(self, name, value)
+
+
 class Instruction(object):
+    __slots__ = ()
+
     def get_name(self):
         return self.__class__.__name__
 
+    __getstate__ = _get_slots_state
+    __setstate__ = _set_slots_state
 
-class MemoryPage(object):
-    """"""
 
-    def __init__(self, size, base_address):
+def _cell_typecodes():
+    """
+    Unsigned array typecodes for 1, 2 and 4 bytes cells
+    """
+    codes = []
+    for size in (1, 2, 4):
+        codes.append([code for code in 'BHIL' if array(code).itemsize == size][0])
+    return codes
+
+
+_zero_bitmaps = {}
+
+
+def _zero_bitmap(size):
+    """
+    @return: str of size zero bytes, compared with the bitmaps of pages to tell whether any bit is set
+    """
+    bitmap = _zero_bitmaps.get(size)
+    if bitmap is None:
+        bitmap = _zero_bitmaps[size] = '\0' * size
+    return bitmap
+
+
+class MemoryPage(object):
+    """
+    Compact page storage.
+    Concrete cells live in an unsigned array that starts one byte wide and is widened only when a bigger value is
+    stored; the taint of the stored values, whether they wrap a UInt32 and the taint shadow of the addresses are
+    bitmaps. Cells holding anything else (e.g. symbolic expressions) are kept in an overflow dict.
+    Taint that is a label mask (see symbolic_engine.labels) rather than True or 1 sets the bit as well, and the
+    mask is kept in a dict by offset, so pages without labels pay nothing for them.
+    """
+    CELL_TYPECODES = _cell_typecodes()
+    CELL_LIMITS = [2 ** 8, 2 ** 16, 2 ** 32]
+
+    def __init__(self, size, base_address, owner=None):
         """Constructor for MemoryPage
         @type size: int
         @type base_address: int
+        @param owner: token of the memory allowed to write this page in place
         """
         self.base_address = base_address
         self.size = size
-        self.__contents = [Value(0)] * self.size
-        self.__tainting = [0] * self.size
+        self.owner = owner
+        bitmap_size = (size + 7) / 8
+        self.__width = 0
+        self.__cells = array(self.CELL_TYPECODES[0], [0]) * size
+        self.__boxed = bytearray(bitmap_size)
+        self.__value_taint = bytearray(bitmap_size)
+        self.__tainting = bytearray(bitmap_size)
+        self.__overflow = {}
+        self.__labels = {}
+        self.__shadow_labels = {}
+
+    def copy(self, owner):
+        """
+        Private copy of the page for the memory owning the given token
+        @rtype MemoryPage
+        """
+        page = MemoryPage.__new__(MemoryPage)
+        page.base_address = self.base_address
+        page.size = self.size
+        page.owner = owner
+        page.__width = self.__width
+        page.__cells = self.__cells[:]
+        page.__boxed = bytearray(self.__boxed)
+        page.__value_taint = bytearray(self.__value_taint)
+        page.__tainting = bytearray(self.__tainting)
+        page.__overflow = dict(self.__overflow)
+        page.__labels = dict(self.__labels)
+        page.__shadow_labels = dict(self.__shadow_labels)
+        return page
+
+    def nbytes(self):
+        """
+        @return: bytes used by the cells and bitmaps of the page
+        """
+        return (len(self.__cells) * self.__cells.itemsize + len(self.__boxed) + len(self.__value_taint) +
+                len(self.__tainting))
 
     def validate_address(self, address):
         """
@@ -75,100 +353,704 @@ class MemoryPage(object):
         if not self.base_address <= address < (self.base_address + self.size):
             raise Exception("address %s outside page" % address)
 
+    def load_cells(self, cells):
+        """
+        Fills the page with untainted UInt32 values
+        @param cells: unsigned array with at most size cells, the rest of the page is zero
+        @type cells: array
+        """
+        width = [array(code).itemsize for code in self.CELL_TYPECODES].index(cells.itemsize)
+        self.__cells = array(self.CELL_TYPECODES[width], cells)
+        if len(cells) < self.size:
+            self.__cells.extend(array(self.CELL_TYPECODES[width], [0]) * (self.size - len(cells)))
+        self.__width = width
+        self.__boxed = bytearray('\xff' * len(self.__boxed))
+        self.__value_taint = bytearray(len(self.__value_taint))
+        self.__overflow = {}
+        self.__labels = {}
+
+    def dump(self, stream):
+        """
+        Writes the cells, bitmaps, overflow and labels of the page, see Memory.snapshot
+        @type stream: file
+        """
+        extra = (self.__overflow, self.__labels, self.__shadow_labels)
+        overflow = cPickle.dumps(extra, cPickle.HIGHEST_PROTOCOL) if any(extra) else ''
+        stream.write(struct.pack('<BI', self.__width, len(overflow)))
+        cells = self.__cells
+        if sys.byteorder == 'big' and cells.itemsize > 1:
+            cells = cells[:]
+            cells.byteswap()
+        stream.write(cells.tostring())
+        stream.write(self.__boxed)
+        stream.write(self.__value_taint)
+        stream.write(self.__tainting)
+        stream.write(overflow)
+
+    def load(self, stream):
+        """
+        Reads back what dump wrote
+        @type stream: file
+        """
+        width, overflow_size = struct.unpack('<BI', stream.read(struct.calcsize('<BI')))
+        cells = array(self.CELL_TYPECODES[width])
+        cells.fromstring(stream.read(self.size * cells.itemsize))
+        if sys.byteorder == 'big' and cells.itemsize > 1:
+            cells.byteswap()
+        self.__width = width
+        self.__cells = cells
+        bitmap_size = len(self.__boxed)
+        self.__boxed = bytearray(stream.read(bitmap_size))
+        self.__value_taint = bytearray(stream.read(bitmap_size))
+        self.__tainting = bytearray(stream.read(bitmap_size))
+        if overflow_size:
+            self.__overflow, self.__labels, self.__shadow_labels = cPickle.loads(stream.read(overflow_size))
+        else:
+            self.__overflow, self.__labels, self.__shadow_labels = {}, {}, {}
+
+    def __widen(self, raw):
+        width = self.__width
+        while raw >= self.CELL_LIMITS[width]:
+            width += 1
+        self.__cells = array(self.CELL_TYPECODES[width], self.__cells)
+        self.__width = width
+
     def set_value(self, address, value):
         """
         @type address: int
         @type value: Value
         """
         self.validate_address(address)
-        self.__contents[address - self.base_address] = value
+        offset = address - self.base_address
+        raw = None
+        if value.__class__ is Value:
+            inner = value.value
+            if inner.__class__ is UInt32:
+                raw = inner.value
+                boxed = True
+            elif (inner.__class__ is int or inner.__class__ is long) and 0 <= inner <= WORD_MASK:
+                raw = inner
+                boxed = False
+        if raw is None:
+            self.__overflow[offset] = value
+            return
+        if self.__overflow:
+            self.__overflow.pop(offset, None)
+        if raw >= self.CELL_LIMITS[self.__width]:
+            self.__widen(raw)
+        self.__cells[offset] = raw
+        index = offset >> 3
+        bit = 1 << (offset & 7)
+        if boxed:
+            self.__boxed[index] |= bit
+        else:
+            self.__boxed[index] &= ~bit
+        tainted = value.tainted
+        if tainted:
+            self.__value_taint[index] |= bit
+            if tainted is not True and tainted != 1:
+                self.__labels[offset] = tainted
+            elif self.__labels:
+                self.__labels.pop(offset, None)
+        else:
+            self.__value_taint[index] &= ~bit
+            if self.__labels:
+                self.__labels.pop(offset, None)
 
     def get_value(self, address):
         """
         @type address: int
         """
         self.validate_address(address)
-        return self.__contents[address - self.base_address]
+        offset = address - self.base_address
+        if self.__overflow:
+            value = self.__overflow.get(offset)
+            if value is not None:
+                return value
+        raw = int(self.__cells[offset])
+        index = offset >> 3
+        bit = 1 << (offset & 7)
+        tainted = bool(self.__value_taint[index] & bit)
+        if tainted and self.__labels:
+            tainted = self.__labels.get(offset, True)
+        if self.__boxed[index] & bit:
+            return Value.of(UInt32.of(raw), tainted)
+        return Value.of(raw, tainted)
 
     def get_taint(self, address):
-        return self.__tainting[address - self.base_address]
+        """
+        @return: the taint shadow of the address, 0, 1 or a label mask
+        """
+        offset = address - self.base_address
+        taint = (self.__tainting[offset >> 3] >> (offset & 7)) & 1
+        if taint and self.__shadow_labels:
+            return self.__shadow_labels.get(offset, 1)
+        return taint
 
     def set_taint(self, address, taint):
         """
         @type address: int
+        @param taint: 0, 1 or a label mask
         @type taint: int
         """
-        self.__tainting[address - self.base_address] = taint
+        offset = address - self.base_address
+        if taint:
+            self.__tainting[offset >> 3] |= 1 << (offset & 7)
+            if taint != 1:
+                self.__shadow_labels[offset] = taint
+            elif self.__shadow_labels:
+                self.__shadow_labels.pop(offset, None)
+        else:
+            self.__tainting[offset >> 3] &= ~(1 << (offset & 7))
+            if self.__shadow_labels:
+                self.__shadow_labels.pop(offset, None)
+
+    def __taint_masks(self, start, stop):
+        first = start - self.base_address
+        last = stop - 1 - self.base_address
+        return first >> 3, last >> 3, 0xff & (0xff << (first & 7)), (2 << (last & 7)) - 1
+
+    def any_tainted(self, start, stop):
+        """
+        @return: whether the shadow of any address in [start, stop) is set, the range must be inside the page
+        """
+        first, last, head, tail = self.__taint_masks(start, stop)
+        tainting = self.__tainting
+        if first == last:
+            return bool(tainting[first] & head & tail)
+        return bool(tainting[first] & head or tainting[last] & tail or any(tainting[first + 1:last]))
+
+    def clear_taint(self, start, stop):
+        """
+        Clears the shadow of the addresses in [start, stop), the range must be inside the page
+        """
+        first, last, head, tail = self.__taint_masks(start, stop)
+        tainting = self.__tainting
+        if first == last:
+            tainting[first] &= ~(head & tail)
+        else:
+            tainting[first] &= ~head
+            tainting[last] &= ~tail
+            tainting[first + 1:last] = bytearray(last - first - 1)
+        if self.__shadow_labels:
+            low = start - self.base_address
+            high = stop - self.base_address
+            for offset in [offset for offset in self.__shadow_labels if low <= offset < high]:
+                del self.__shadow_labels[offset]
+
+    def any_tainted_values(self):
+        """
+        @return: whether some cell holds a tainted value or something that is not a Value
+        """
+        return bool(self.__overflow) or self.__value_taint != _zero_bitmap(len(self.__value_taint))
+
+    def any_tainted_addresses(self):
+        """
+        @return: whether the shadow of some address of the page is set
+        """
+        return self.__tainting != _zero_bitmap(len(self.__tainting))
+
+    def differing_offsets(self, other):
+        """
+        Offsets whose value may differ from the other page: cells, boxing and value taint are compared as raw
+        arrays, a chunk at a time, and only the chunks that differ are looked at cell by cell
+        @type other: MemoryPage
+        @return: sorted list of offsets, a superset of the offsets whose get_value differ
+        """
+        cells, other_cells = self.__cells, other.__cells
+        if cells.itemsize != other_cells.itemsize:
+            typecode = (cells if cells.itemsize > other_cells.itemsize else other_cells).typecode
+            cells, other_cells = array(typecode, cells), array(typecode, other_cells)
+        offsets = set()
+        data, other_data = cells.tostring(), other_cells.tostring()
+        if data != other_data:
+            itemsize = cells.itemsize
+            chunk = 64 * itemsize
+            for start in xrange(0, len(data), chunk):
+                if data[start:start + chunk] != other_data[start:start + chunk]:
+                    first = start / itemsize
+                    for offset in xrange(first, min(first + 64, self.size)):
+                        if cells[offset] != other_cells[offset]:
+                            offsets.add(offset)
+        for bitmap, other_bitmap in ((self.__boxed, other.__boxed), (self.__value_taint, other.__value_taint)):
+            if bitmap != other_bitmap:
+                for index in xrange(len(bitmap)):
+                    if bitmap[index] != other_bitmap[index]:
+                        offsets.update(xrange(index * 8, min(index * 8 + 8, self.size)))
+        offsets.update(self.__overflow)
+        offsets.update(other.__overflow)
+        offsets.update(self.__labels)
+        offsets.update(other.__labels)
+        return sorted(offsets)
+
+    def tainted_runs(self):
+        """
+        @return: list of the [start, stop) address ranges whose shadow is set
+        """
+        runs = []
+        start = None
+        for index, byte in enumerate(self.__tainting):
+            if byte == (0 if start is None else 0xff):
+                continue
+            for bit in range(8):
+                if (byte >> bit) & 1:
+                    if start is None:
+                        start = index * 8 + bit
+                elif start is not None:
+                    runs.append((self.base_address + start, self.base_address + index * 8 + bit))
+                    start = None
+        if start is not None:
+            runs.append((self.base_address + start, self.base_address + self.size))
+        return runs
+
+
+class _FileMapping(object):
+    """
+    Read only mmap of a region of a file. Pickling it pickles the location, so it is mapped again on the other
+    side.
+    """
+
+    def __init__(self, path, offset, length):
+        """
+        @type path: str
+        @type offset: int
+        @type length: int
+        """
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.__map()
+
+    def __map(self):
+        start = self.offset - self.offset % mmap.ALLOCATIONGRANULARITY
+        self.delta = self.offset - start
+        with open(self.path, 'rb') as image:
+            self.data = mmap.mmap(image.fileno(), self.length + self.delta, access=mmap.ACCESS_READ, offset=start)
+
+    def __getstate__(self):
+        return self.path, self.offset, self.length
+
+    def __setstate__(self, state):
+        self.path, self.offset, self.length = state
+        self.__map()
+
+
+class MappedPage(object):
+    """
+    Read only page whose cells are words of a memory mapped file. It has no owner, so the first write to it
+    makes the memory replace it with a private MemoryPage holding the decoded words.
+    """
+    owner = None
+    FORMATS = {1: '<B', 2: '<H', 4: '<I'}
+
+    def __init__(self, size, base_address, mapping, start, word_size):
+        """
+        @type size: int
+        @type base_address: int
+        @type mapping: _FileMapping
+        @param start: offset of the first cell in the mapping
+        @param word_size: bytes per cell, 1, 2 or 4 (little endian)
+        """
+        self.size = size
+        self.base_address = base_address
+        self.mapping = mapping
+        self.start = mapping.delta + start
+        self.end = min(self.start + size * word_size, mapping.delta + mapping.length)
+        self.word_size = word_size
+
+    def validate_address(self, address):
+        if not self.base_address <= address < (self.base_address + self.size):
+            raise Exception("address %s outside page" % address)
+
+    def get_value(self, address):
+        """
+        @type address: int
+        """
+        self.validate_address(address)
+        position = self.start + (address - self.base_address) * self.word_size
+        if position + self.word_size > self.end:
+            return Value(UInt32(0))
+        return Value(UInt32(struct.unpack_from(self.FORMATS[self.word_size], self.mapping.data, position)[0]))
+
+    def get_taint(self, address):
+        return 0
+
+    def any_tainted(self, start, stop):
+        return False
+
+    def any_tainted_values(self):
+        return False
+
+    def any_tainted_addresses(self):
+        return False
+
+    def tainted_runs(self):
+        return []
+
+    def cells(self):
+        """
+        @return: the words of the page as an unsigned array
+        """
+        typecode = MemoryPage.CELL_TYPECODES[[1, 2, 4].index(self.word_size)]
+        cells = array(typecode)
+        usable = (self.end - self.start) / self.word_size * self.word_size
+        cells.fromstring(self.mapping.data[self.start:self.start + usable])
+        if sys.byteorder == 'big' and self.word_size > 1:
+            cells.byteswap()
+        return cells
+
+    def copy(self, owner):
+        """
+        @rtype MemoryPage
+        """
+        page = MemoryPage(self.size, self.base_address, owner)
+        page.load_cells(self.cells())
+        return page
+
+
+_zero_pages = {}
+
+
+def zero_page(page_size):
+    """
+    Page of zeros shared by every memory with the given page size, used to answer reads of pages never written.
+    It has no owner, so nobody can write it in place.
+    @rtype MemoryPage
+    """
+    page = _zero_pages.get(page_size)
+    if page is None:
+        page = _zero_pages[page_size] = MemoryPage(page_size, 0)
+    return page
 
 
 class Memory(object):
+    """
+    Paged memory. Pages are shared copy-on-write between forked memories: fork() is O(1) and a page is copied
+    only the first time a fork writes to it. Reads of pages that were never written are answered from a shared
+    zero page without allocating anything. Files can be mapped read only as initial contents (map_file) and the
+    written pages saved and loaded again (snapshot, restore).
+
+    The taint shadow of single addresses is kept in the pages; ranges tainted in bulk (taint_range) are kept as
+    sorted intervals next to it, so tainting, clearing and querying a buffer costs a bisection instead of a call
+    per address.
+    """
+
     def __init__(self, page_size=None):
         """
         @type page_size: int
         """
         if page_size is None: page_size = 1024 * 4
         self.page_size = page_size
-        self.pages = {}
+        self.pages = PersistentMap()
+        self.zero_page = zero_page(page_size)
+        self.taint_ranges = IntervalSet()
+        self.taint_ranges_owner = self.pages.owner
+        self.pages_allocated = 0
+        self.read_touches = 0
+        self.write_touches = 0
+
+    def fork(self):
+        """
+        @rtype Memory
+        """
+        other = Memory.__new__(Memory)
+        other.__dict__.update(self.__dict__)
+        other.pages = self.pages.fork()
+        return other
 
     def set_value(self, address, value):
         """
         @type address: UInt32
         @type value: Value
         """
-        page = self.get_page(address)
+        page = self.get_writable_page(address)
         page.set_value(address.value, value)
 
     def get_page(self, v1):
         """
+        Page holding an address, allocated if it does not exist yet
         @type v1: UInt32
         @rtype MemoryPage
         """
         page_nr = v1.value / self.page_size
-        if not page_nr in self.pages:
-            self.pages[page_nr] = MemoryPage(self.page_size, (page_nr * self.page_size))
-        return self.pages[page_nr]
+        page = self.pages.get(page_nr)
+        if page is None:
+            page = self.pages[page_nr] = MemoryPage(self.page_size, (page_nr * self.page_size), self.pages.owner)
+            self.pages_allocated += 1
+        return page
+
+    def get_writable_page(self, v1):
+        """
+        Same as get_page, but the page is made private to this memory first
+        @type v1: UInt32
+        @rtype MemoryPage
+        """
+        self.write_touches += 1
+        page = self.get_page(v1)
+        owner = self.pages.owner
+        if page.owner is not owner:
+            page = self.pages[v1.value / self.page_size] = page.copy(owner)
+            self.pages_allocated += 1
+        return page
 
     def get_page_numbers(self):
         return len(self.pages)
 
+    def map_file(self, path, base_address, offset=0, length=None, word_size=1):
+        """
+        Maps a region of a file read only as the initial contents of a range of pages. Each cell gets one little
+        endian word of the file; pages are decoded and copied only when written.
+        @type path: str
+        @param base_address: address of the first cell, must be page aligned
+        @param offset: offset of the region in the file
+        @param length: bytes to map, up to the end of the file by default
+        @param word_size: bytes per cell, 1, 2 or 4
+        @return: number of pages mapped
+        """
+        if base_address % self.page_size:
+            raise Exception("base address %s is not page aligned" % base_address)
+        if word_size not in MappedPage.FORMATS:
+            raise Exception("unsupported word size %s" % word_size)
+        if length is None:
+            length = max(0, os.path.getsize(path) - offset)
+        if not length:
+            return 0
+        mapping = _FileMapping(path, offset, length)
+        page_bytes = self.page_size * word_size
+        first_page = base_address / self.page_size
+        count = (length + page_bytes - 1) / page_bytes
+        for index in range(count):
+            page_nr = first_page + index
+            self.pages[page_nr] = MappedPage(self.page_size, page_nr * self.page_size, mapping, index * page_bytes,
+                                             word_size)
+        return count
+
+    SNAPSHOT_MAGIC = 'SEMS'
+    SNAPSHOT_VERSION = 3
+    SNAPSHOT_HEADER = '<4sHII'
+    SNAPSHOT_PAGE_HEADER = '<Q'
+    SNAPSHOT_INTERVAL = '<QQ'
+
+    def snapshot(self, path):
+        """
+        Writes the dirty pages (every page that is neither mapped from a file nor unwritten) with their taint
+        shadow, and the tainted ranges, to a file, see restore
+        @type path: str
+        @return: number of pages written
+        """
+        dirty = sorted((page_nr, page) for page_nr, page in self.pages.iteritems() if isinstance(page, MemoryPage))
+        with open(path, 'wb') as stream:
+            stream.write(struct.pack(self.SNAPSHOT_HEADER, self.SNAPSHOT_MAGIC, self.SNAPSHOT_VERSION,
+                                     self.page_size, len(dirty)))
+            for page_nr, page in dirty:
+                stream.write(struct.pack(self.SNAPSHOT_PAGE_HEADER, page_nr))
+                page.dump(stream)
+            stream.write(struct.pack('<I', len(self.taint_ranges)))
+            for interval in self.taint_ranges:
+                stream.write(struct.pack(self.SNAPSHOT_INTERVAL, *interval))
+        return len(dirty)
+
+    def restore(self, path):
+        """
+        Loads the pages of a snapshot on top of the current contents
+        @type path: str
+        @return: number of pages loaded
+        """
+        with open(path, 'rb') as stream:
+            magic, version, page_size, count = struct.unpack(
+                self.SNAPSHOT_HEADER, stream.read(struct.calcsize(self.SNAPSHOT_HEADER)))
+            if magic != self.SNAPSHOT_MAGIC or version != self.SNAPSHOT_VERSION:
+                raise Exception("%s is not a memory snapshot" % path)
+            if page_size != self.page_size:
+                raise Exception("snapshot page size %d differs from %d" % (page_size, self.page_size))
+            for _ in range(count):
+                page_nr, = struct.unpack(self.SNAPSHOT_PAGE_HEADER,
+                                         stream.read(struct.calcsize(self.SNAPSHOT_PAGE_HEADER)))
+                page = MemoryPage(self.page_size, page_nr * self.page_size, self.pages.owner)
+                page.load(stream)
+                self.pages[page_nr] = page
+                self.pages_allocated += 1
+            intervals, = struct.unpack('<I', stream.read(4))
+            interval_size = struct.calcsize(self.SNAPSHOT_INTERVAL)
+            taint_ranges = self.writable_taint_ranges()
+            for _ in range(intervals):
+                taint_ranges.add(*struct.unpack(self.SNAPSHOT_INTERVAL, stream.read(interval_size)))
+        return count
+
+    def get_private_page_numbers(self):
+        """
+        @return: number of pages this memory has written since it was last forked
+        """
+        owner = self.pages.owner
+        return sum(1 for page in self.pages.values() if page.owner is owner)
+
+    def get_shared_page_numbers(self):
+        """
+        @return: number of pages still shared with other forks
+        """
+        return self.get_page_numbers() - self.get_private_page_numbers()
+
+    def get_page_counters(self):
+        """
+        @return: dict with the pages allocated (including copies made on write) and the page accesses for reading
+        and for writing
+        """
+        return {
+            'allocated': self.pages_allocated,
+            'touched_for_read': self.read_touches,
+            'touched_for_write': self.write_touches
+        }
+
     def get_value(self, mem_pos):
         """
         @type mem_pos: UInt32
         """
-        page = self.get_page(mem_pos)
-        return page.get_value(mem_pos.value)
+        self.read_touches += 1
+        address = mem_pos.value
+        page = self.pages.get(address / self.page_size)
+        if page is None:
+            return self.zero_page.get_value(address % self.page_size)
+        return page.get_value(address)
 
     def get_taint(self, address):
         """
         @type address: UInt32
         """
-        page = self.get_page(address)
-        assert isinstance(page, MemoryPage)
-        return page.get_taint(address.value)
+        self.read_touches += 1
+        address = address.value
+        page = self.pages.get(address / self.page_size)
+        if page is None:
+            taint = self.zero_page.get_taint(address % self.page_size)
+        else:
+            taint = page.get_taint(address)
+        if self.taint_ranges.starts and address in self.taint_ranges:
+            return taint | 1
+        return taint
 
     def set_taint(self, address, taint):
         """
         @type address: UInt32
         @type taint: int
         """
-        page = self.get_page(address)
+        if not taint and self.taint_ranges.overlaps(address.value, address.value + 1):
+            self.writable_taint_ranges().remove(address.value, address.value + 1)
+        page = self.get_writable_page(address)
         assert isinstance(page, MemoryPage)
-        page.set_taint(address.value, int(taint))
+        page.set_taint(address.value, taint)
+
+    def writable_taint_ranges(self):
+        """
+        @return: the taint intervals, copied first if they are still shared with another fork
+        @rtype IntervalSet
+        """
+        if self.taint_ranges_owner is not self.pages.owner:
+            self.taint_ranges = self.taint_ranges.copy()
+            self.taint_ranges_owner = self.pages.owner
+        return self.taint_ranges
+
+    def __pages_in(self, start, stop):
+        """
+        @return: (page_nr, page) of the pages holding addresses in [start, stop)
+        """
+        first = start / self.page_size
+        last = (stop - 1) / self.page_size
+        if last - first >= len(self.pages):
+            return sorted((page_nr, page) for page_nr, page in self.pages.iteritems() if first <= page_nr <= last)
+        return [(page_nr, self.pages[page_nr]) for page_nr in xrange(first, last + 1) if page_nr in self.pages]
+
+    def __clip(self, page_nr, start, stop):
+        return max(start, page_nr * self.page_size), min(stop, (page_nr + 1) * self.page_size)
+
+    def taint_range(self, start, stop):
+        """
+        Sets the taint shadow of every address in [start, stop)
+        @type start: UInt32 | int
+        @type stop: UInt32 | int
+        """
+        self.writable_taint_ranges().add(as_int(start), as_int(stop))
+
+    def clear_range(self, start, stop):
+        """
+        Clears the taint shadow of every address in [start, stop), pages are copied only if they have some taint
+        in the range
+        @type start: UInt32 | int
+        @type stop: UInt32 | int
+        """
+        start, stop = as_int(start), as_int(stop)
+        if start >= stop:
+            return
+        if self.taint_ranges.overlaps(start, stop):
+            self.writable_taint_ranges().remove(start, stop)
+        for page_nr, page in self.__pages_in(start, stop):
+            low, high = self.__clip(page_nr, start, stop)
+            if page.any_tainted(low, high):
+                self.get_writable_page(UInt32(low)).clear_taint(low, high)
+
+    def any_tainted(self, start, stop):
+        """
+        @return: whether the taint shadow of any address in [start, stop) is set
+        @type start: UInt32 | int
+        @type stop: UInt32 | int
+        """
+        start, stop = as_int(start), as_int(stop)
+        if start >= stop:
+            return False
+        if self.taint_ranges.overlaps(start, stop):
+            return True
+        for page_nr, page in self.__pages_in(start, stop):
+            if page.any_tainted(*self.__clip(page_nr, start, stop)):
+                return True
+        return False
+
+    def any_tainted_values(self):
+        """
+        @return: whether some cell holds a tainted value or something that is not a Value
+        """
+        return any(page.any_tainted_values() for page in self.pages.values())
+
+    def any_tainted_addresses(self):
+        """
+        @return: whether the taint shadow of some address is set, same as any_tainted over every address
+        """
+        return bool(self.taint_ranges.starts) or any(page.any_tainted_addresses() for page in self.pages.values())
+
+    def tainted_intervals(self, start=0, stop=None):
+        """
+        Generator of the maximal [start, stop) intervals of tainted addresses, in order
+        @type start: UInt32 | int
+        @type stop: UInt32 | int
+        """
+        start = as_int(start)
+        stop = WORD_MASK + 1 if stop is None else as_int(stop)
+        if start >= stop:
+            return
+        tainted = IntervalSet(self.taint_ranges.intervals(start, stop))
+        for page_nr, page in self.__pages_in(start, stop):
+            for low, high in page.tainted_runs():
+                tainted.add(low, high)
+        for interval in tainted.intervals(start, stop):
+            yield interval
 
 
 class Context(object):
     """"""
+    __slots__ = ('variables', 'memory', 'pc', 'program')
 
     def __init__(self, memory, variables, pc, program):
         """Constructor for Context
         @type program: Program
-        @type pc: UInt32
-        @type variables: dict
+        @param pc: index of the next statement, kept as a plain int
+        @type pc: int | UInt32
+        @param variables: a PersistentMap is used as is; a dict is copied into a new one, so the assignments of a
+        run are not seen through that dict: read them from context.variables
+        @type variables: dict | PersistentMap
         @type memory: Memory
         """
+        if not isinstance(variables, PersistentMap):
+            variables = PersistentMap(variables)
         self.variables = variables
         self.memory = memory
-        self.pc = pc
+        self.pc = as_int(pc)
         self.program = program
 
     def current_instr(self):
@@ -190,7 +1072,14 @@ class Context(object):
         return self.variables[name]
 
     def copy(self):
-        return Context(self.memory, self.variables, self.pc, self.program)
+        return self.fork()
+
+    def fork(self):
+        """
+        Independent copy of this context. Variables and memory pages are shared until either side writes them.
+        @rtype Context
+        """
+        return Context(self.memory.fork(), self.variables.fork(), self.pc, self.program)
 
     def set_mem_value(self, v1, v2):
         """
@@ -205,15 +1094,47 @@ class Context(object):
         """
         return bool(self.memory.get_taint(address))
 
+    def get_mem_address_labels(self, address):
+        """
+        @type address: UInt32
+        @return: the taint shadow of the address as a label mask, 0 when untainted
+        """
+        return self.memory.get_taint(address)
+
     def set_mem_address_taint(self, address, is_tainted):
         """
         @type address: UInt32
-        @type is_tainted: bool
+        @param is_tainted: bool or label mask
         """
         self.memory.set_taint(address, int(is_tainted))
 
+    def set_mem_range_taint(self, start, stop, is_tainted):
+        """
+        Sets or clears the taint of the addresses in [start, stop)
+        @type start: UInt32
+        @type stop: UInt32
+        @type is_tainted: bool
+        """
+        if is_tainted:
+            self.memory.taint_range(start, stop)
+        else:
+            self.memory.clear_range(start, stop)
+
+    def is_mem_range_tainted(self, start, stop):
+        """
+        @type start: UInt32
+        @type stop: UInt32
+        @rtype bool
+        """
+        return self.memory.any_tainted(start, stop)
+
+    __getstate__ = _get_slots_state
+    __setstate__ = _set_slots_state
+
 
 class Assign(Instruction):
+    __slots__ = ('expression', 'var_name')
+
     def __init__(self, var_name, expression):
         """Constructor for Assign
         @type var_name: str
@@ -237,17 +1158,30 @@ class Program(object):
         """
 
         try:
-            return self.stmts[pc.value]
+            return self.stmts[as_int(pc)]
         except IndexError:
             return None
 
 
 class Expression(Instruction):
-    pass
+    # _hash caches structural_hash(), _factory is the SymbolFactory that made the node unique
+    __slots__ = ('_hash', '_factory', '__weakref__')
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            h = self._hash = self.structural_hash()
+            return h
+
+    def structural_hash(self):
+        return object.__hash__(self)
 
 
 class BinOp(Expression):
+    __slots__ = ('left', 'right')
     SYM = "ERROR"
+    OPERATION = None
 
     def __init__(self, left, right):
         """
@@ -262,28 +1196,49 @@ class BinOp(Expression):
     def __str__(self):
         return "(%s) %s (%s)" % (str(self.left), self.SYM, str(self.right))
 
+    def structural_hash(self):
+        return hash((self.__class__.__name__, hash(self.left), hash(self.right)))
+
 
 class AddOp(BinOp):
+    __slots__ = ()
     SYM = "+"
+    OPERATION = staticmethod(lambda a, b: a + b)
 
 
 class MulOp(BinOp):
+    __slots__ = ()
     SYM = "*"
+    OPERATION = staticmethod(lambda a, b: a * b)
 
 
 class SubOp(BinOp):
+    __slots__ = ()
     SYM = "-"
+    OPERATION = staticmethod(lambda a, b: a - b)
 
 
 class EQ(BinOp):
+    __slots__ = ()
     SYM = "=="
+    OPERATION = staticmethod(lambda a, b: 1 if a == b else 0)
 
 
 class GT(BinOp):
+    __slots__ = ()
     SYM = ">"
+    OPERATION = staticmethod(lambda a, b: 1 if a > b else 0)
+
+
+BINOPS = frozenset(['AddOp', 'MulOp', 'SubOp', 'EQ', 'GT'])
 
 
 class TaintPolicy(object):
+    # True when taint only comes from inputs and flows the way the interpreter propagates it, so that
+    # tainted_address and goto_check never report untainted operands; interpreters may then skip them where
+    # symbolic_engine.static_taint proves the operands untainted. Subclasses changing those checks must reset it.
+    static_taint = False
+
     def input_policy(self, src):
         raise NotImplementedError
 
@@ -304,6 +1259,25 @@ class TaintPolicy(object):
         """
         raise NotImplementedError
 
+    def goto_check_lanes(self, targets, taints):
+        """
+        goto_check for many lanes at once, see symbolic_engine.lanes
+        @param targets: sequence of target pcs
+        @param taints: sequence of taint masks, see symbolic_engine.labels
+        @return: sequence of bools
+        """
+        return [self.goto_check(Value(UInt32(int(target)), int(tainted))) for target, tainted in zip(targets, taints)]
+
+    def tainted_address_lanes(self, addresses, address_taints, values, value_taints):
+        """
+        tainted_address for many lanes at once, see symbolic_engine.lanes
+        @return: sequence of bools
+        """
+        return [self.tainted_address(Value(UInt32(int(address)), int(address_tainted)),
+                                     Value(UInt32(int(value)), int(value_tainted)))
+                for address, address_tainted, value, value_tainted in zip(addresses, address_taints, values,
+                                                                          value_taints)]
+
 
 class AttackException(Exception):
     pass
@@ -320,6 +1294,8 @@ class DefaultTaintCheckHandler(TaintCheckHandler):
 
 
 class DefaultTaintPolicy(TaintPolicy):
+    static_taint = True
+
     def input_policy(self, src):
         return True
 
@@ -332,8 +1308,28 @@ class DefaultTaintPolicy(TaintPolicy):
     def tainted_address(self, address, value):
         return address.isTainted()
 
+    # the *_lanes shortcuts below only hold for the checks of this class, subclasses overriding them get the
+    # per-lane loop of TaintPolicy
+    def goto_check_lanes(self, targets, taints):
+        if getattr(self.goto_check, '__func__', None) is not DefaultTaintPolicy.goto_check.__func__:
+            return super(DefaultTaintPolicy, self).goto_check_lanes(targets, taints)
+        if hasattr(taints, 'dtype'):
+            return taints == 0
+        return [not tainted for tainted in taints]
+
+    def tainted_address_lanes(self, addresses, address_taints, values, value_taints):
+        if getattr(self.tainted_address, '__func__', None) is not DefaultTaintPolicy.tainted_address.__func__:
+            return super(DefaultTaintPolicy, self).tainted_address_lanes(addresses, address_taints, values,
+                                                                         value_taints)
+        return address_taints
+
 
 class BaseInterpreter(object):
+    # a symbolic_engine.trace.TraceRecorder to record the executed statements, None when not tracing
+    tracer = None
+    # a symbolic_engine.profiling.Profile collecting counters of every run, None when not profiling
+    profile = None
+
     def __init__(self, taint_policy, taint_check_handler, print_statements=False):
         """
         @type taint_policy: TaintPolicy
@@ -349,59 +1345,113 @@ class BaseInterpreter(object):
         self.taint_check_handler = taint_check_handler
         self.print_statements = print_statements
 
-    def eval_if(self, context):
+    def eval_if(self, context, instr=None):
         """
         @type context: Context
+        @param instr: the statement at context.pc, fetched from the context when not given
         """
-        instr = context.current_instr()
+        if instr is None:
+            instr = context.current_instr()
         assert isinstance(instr, IF)
         e = instr.e
         e1 = instr.e1
         e2 = instr.e2
         cond = self.eval_expression(e, context)
-        if cond.value == UInt32(1):
+        taken = self.branch_condition(cond, context)
+        if taken:
             v1 = self.eval_expression(e1, context)
-        elif cond.value == UInt32(0):
-            v1 = self.eval_expression(e2, context)
         else:
-            raise Exception("Invalid value: expected boolean (0 or 1)")
-        context.pc = v1.value
+            v1 = self.eval_expression(e2, context)
+        if self.tracer is not None:
+            self.tracer.branch(context.pc, taken, v1)
+        context.pc = as_int(v1.value)
         return context
 
-    def goto_rule(self, context):
-        instr = context.current_instr()
+    def branch_condition(self, cond, context):
+        """
+        Decides which side of an IF is taken
+        @type cond: Value
+        @type context: Context
+        @return: True to jump to e1, False to jump to e2
+        """
+        if cond.value == UInt32(1):
+            return True
+        elif cond.value == UInt32(0):
+            return False
+        raise Exception("Invalid value: expected boolean (0 or 1)")
+
+    def goto_rule(self, context, instr=None):
+        if instr is None:
+            instr = context.current_instr()
         assert isinstance(instr, Goto)
         v1 = self.eval_expression(instr.pc, context)
         if not self.taint_policy.goto_check(v1):
             self.taint_check_handler.handle_goto(context.pc, instr)
-        context.pc = v1.value
+        if self.tracer is not None:
+            self.tracer.goto(context.pc, v1)
+        context.pc = as_int(v1.value)
         return context
 
-    def store_rule(self, context):
+    def store_rule(self, context, instr=None):
         """
 
         @param context: context
         @type context: Context
+        @param instr: see eval_if
 
         @return:
         """
-        instr = context.current_instr()
+        if instr is None:
+            instr = context.current_instr()
         assert isinstance(instr, Store)
         v1 = self.eval_expression(instr.address, context)
         v2 = self.eval_expression(instr.value, context)
-        context.pc += UInt32(1)
+        address_tainted = self.taint_policy.tainted_address(v1, v2) # v1.isTainted()
+        if self.tracer is not None:
+            self.tracer.store(context.pc, v1, v2, address_tainted)
+        context.pc += 1
         context.set_mem_value(v1.value, v2)
-        context.set_mem_address_taint(v1.value, self.taint_policy.tainted_address(v1, v2)) # v1.isTainted()
+        context.set_mem_address_taint(v1.value, address_tainted)
         return context
 
-    def assign_rule(self, context):
+    def clean_store_rule(self, context, instr=None):
         """
+        store_rule for a Store whose operands are untainted while no address shadow is set: the taint policy is
+        not asked and the shadow is left alone
         @type context: Context
+        @param instr: see eval_if
         """
-        instr = context.current_instr()
+        if instr is None:
+            instr = context.current_instr()
+        v1 = self.eval_expression(instr.address, context)
+        v2 = self.eval_expression(instr.value, context)
+        context.pc += 1
+        context.set_mem_value(v1.value, v2)
+        return context
+
+    def clean_goto_rule(self, context, instr=None):
+        """
+        goto_rule for a Goto whose target is untainted: the taint policy is not asked
+        @type context: Context
+        @param instr: see eval_if
+        """
+        if instr is None:
+            instr = context.current_instr()
+        context.pc = as_int(self.eval_expression(instr.pc, context).value)
+        return context
+
+    def assign_rule(self, context, instr=None):
+        """
+        @type context: Context
+        @param instr: see eval_if
+        """
+        if instr is None:
+            instr = context.current_instr()
         assert isinstance(instr, Assign)
-        context.variables[instr.var_name] = self.eval_expression(instr.expression, context)
-        context.pc += UInt32(1)
+        value = context.variables[instr.var_name] = self.eval_expression(instr.expression, context)
+        if self.tracer is not None:
+            self.tracer.assign(context.pc, instr.var_name, value)
+        context.pc += 1
         return context
 
     def run(self, context):
@@ -409,17 +1459,31 @@ class BaseInterpreter(object):
         Fetch-execute loop
         @type context: Context
         """
-        next_instr = context.current_instr()
-        assert isinstance(next_instr, Instruction)
-        while next_instr:
-            if self.print_statements:
-                print context.pc.value, ": ", str(next_instr)
-            name = next_instr.get_name()
-            rule = self.rules.get(name)
-            if rule is None:
-                raise Exception("No rule for %s" % name)
-            context = rule(context)
+        profile = self.profile
+        if profile is not None:
+            timer = profile.timer
+            profile.start(self, context)
+        try:
             next_instr = context.current_instr()
+            assert isinstance(next_instr, Instruction)
+            while next_instr:
+                if self.print_statements:
+                    print context.pc, ": ", str(next_instr)
+                name = next_instr.get_name()
+                rule = self.rules.get(name)
+                if rule is None:
+                    raise Exception("No rule for %s" % name)
+                if profile is None:
+                    context = rule(context)
+                else:
+                    pc = context.pc
+                    start = timer()
+                    context = rule(context)
+                    profile.statement(pc, next_instr, rule.__name__, timer() - start)
+                next_instr = context.current_instr()
+        finally:
+            if profile is not None:
+                profile.stop(self, context)
         return context
 
     def eval_binop(self, expression, context):
@@ -432,32 +1496,30 @@ class BaseInterpreter(object):
         @type expression: BinOp
         @rtype int
         """
-        # TODO: the rest of the binary operations (MUL, DIV, SUB, etc.)
-        name = expression.get_name()
         left_value = self.eval_expression(expression.left, context)
         right_value = self.eval_expression(expression.right, context)
         if not (isinstance(left_value, Value) and isinstance(right_value, Value)):
-            return expression.__class__(self.eval_expression(left_value, context),
-                self.eval_expression(right_value, context))
-        else:
-            if name == 'AddOp':
-                inner_value = left_value.value + right_value.value
-            elif name == 'MulOp':
-                inner_value = left_value.value * right_value.value
-            elif name == 'SubOp':
-                inner_value = left_value.value - right_value.value
-            elif name == 'EQ':
-                inner_value = 1 if left_value.value == right_value.value else 0
-            elif name == 'GT':
-                inner_value = 1 if left_value.value > right_value.value else 0
-            else:
-                raise Exception("Operation not implemented")
-            return Value(inner_value, right_value.isTainted() or left_value.isTainted())
+            return self.symbolic_binop(expression.__class__, left_value, right_value)
+        operation = expression.OPERATION
+        if operation is None:
+            raise Exception("Operation not implemented")
+        return Value.of(operation(left_value.value, right_value.value), left_value.tainted | right_value.tainted)
+
+    def symbolic_binop(self, op_class, left, right):
+        """
+        Builds the result of a binary operation when at least one operand is symbolic
+        @type op_class: type
+        @type left: Expression
+        @type right: Expression
+        @rtype BinOp
+        """
+        return op_class(left, right)
 
     def eval_expression(self, expression, context):
         name = expression.get_name()
-        binops = set(['AddOp', 'MulOp', 'SubOp', 'EQ', 'GT'])
-        if name in binops:
+        if self.profile is not None:
+            self.profile.expression_counts[name] += 1
+        if name in BINOPS:
             return self.eval_binop(expression, context)
         elif name == 'Value':
             return self.eval_value(expression, context)
@@ -506,30 +1568,60 @@ class Interpreter(BaseInterpreter):
 
 
 class SymExpression(object):
-    pass
+    __slots__ = ('_hash', '_factory', '__weakref__')
+
+    def __hash__(self):
+        try:
+            return self._hash
+        except AttributeError:
+            h = self._hash = self.structural_hash()
+            return h
+
+    def structural_hash(self):
+        return object.__hash__(self)
+
+    __getstate__ = _get_slots_state
+    __setstate__ = _set_slots_state
 
 
 class _SymTrue(SymExpression):
+    __slots__ = ()
+
     def __str__(self):
         return "True"
 
+    def __reduce__(self):
+        return "SymTrue"
+
 
 class _SymFalse(SymExpression):
+    __slots__ = ()
+
     def __str__(self):
         return "False"
 
+    def __reduce__(self):
+        return "SymFalse"
+
 SymTrue = _SymTrue()
 SymFalse = _SymFalse()
 
 class SymInput(Expression):
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
     def __str__(self):
         return self.name
 
+    def structural_hash(self):
+        return hash(('SymInput', self.name))
+
 
 class And(SymExpression):
+    __slots__ = ('left', 'right')
+
     def __init__(self, left, right):
         self.right = right
         self.left = left
@@ -537,6 +1629,61 @@ class And(SymExpression):
     def __str__(self):
         return "%s AND %s" % (str(self.right), str(self.left))
 
+    def structural_hash(self):
+        return hash(('And', hash(self.left), hash(self.right)))
+
+
+class Or(SymExpression):
+    __slots__ = ('left', 'right')
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def __str__(self):
+        return "(%s) OR (%s)" % (str(self.left), str(self.right))
+
+    def structural_hash(self):
+        return hash(('Or', hash(self.left), hash(self.right)))
+
+
+class Ite(Expression):
+    """Word that is then when cond holds and otherwise when it doesn't, built when paths are merged"""
+    __slots__ = ('cond', 'then', 'otherwise')
+
+    def __init__(self, cond, then, otherwise):
+        self.cond = cond
+        self.then = then
+        self.otherwise = otherwise
+
+    @property
+    def tainted(self):
+        """Taint of either side, so a merge keeps the taint of the values it merges"""
+        then = getattr(self.then, 'tainted', False) or False
+        return then | (getattr(self.otherwise, 'tainted', False) or False)
+
+    def isTainted(self):
+        return self.tainted
+
+    def __str__(self):
+        return "ite(%s, %s, %s)" % (str(self.cond), str(self.then), str(self.otherwise))
+
+    def structural_hash(self):
+        return hash(('Ite', hash(self.cond), hash(self.then), hash(self.otherwise)))
+
+
+class Not(SymExpression):
+    __slots__ = ('expression',)
+
+    def __init__(self, expression):
+        self.expression = expression
+
+    def __str__(self):
+        return "NOT (%s)" % str(self.expression)
+
+    def structural_hash(self):
+        return hash(('Not', hash(self.expression)))
+
 
 class IdProvider(object):
     def __init__(self):
@@ -547,52 +1694,504 @@ class IdProvider(object):
         self.__last_id += 1
         return "%s_%d" % (self.base_name, self.__last_id)
 
+    def fork(self):
+        """
+        Provider that continues the numbering of this one independently
+        @rtype IdProvider
+        """
+        other = IdProvider()
+        other.base_name = self.base_name
+        other.__last_id = self.__last_id
+        return other
+
+    def join(self, other):
+        """
+        Provider for a state merged from the states of both providers: it continues after the names of both
+        @rtype IdProvider
+        """
+        return (self if self.__last_id >= other.__last_id else other).fork()
+
+
+class SymbolFactory(object):
+    """
+    Hash-consing factory for symbolic nodes.
+    Structurally equal terms built through the same factory are the same object, so they can be compared by
+    identity and used as keys of caches, and a path constraint is stored as a DAG instead of a tree.
+    Nodes are kept only while something else references them.
+    """
+
+    def __init__(self):
+        self.table = weakref.WeakValueDictionary()
+
+    def __len__(self):
+        return len(self.table)
+
+    def _unique(self, key, build):
+        node = self.table.get(key)
+        if node is None:
+            node = build()
+            node._hash = node.structural_hash()
+            node._factory = self
+            self.table[key] = node
+        return node
+
+    def value(self, value, tainted=False):
+        """
+        @type value: UInt32 | int
+        @rtype Value
+        """
+        return self._unique(('Value', value.__class__, as_int(value), tainted or 0), lambda: Value(value, tainted))
+
+    def input(self, name):
+        """
+        @type name: str
+        @rtype SymInput
+        """
+        return self._unique(('SymInput', name), lambda: SymInput(name))
+
+    def binop(self, op_class, left, right):
+        """
+        @type op_class: type
+        @type left: Expression
+        @type right: Expression
+        @rtype BinOp
+        """
+        left = self.intern(left)
+        right = self.intern(right)
+        # children are unique, so their identities are enough to identify the node
+        return self._unique((op_class, id(left), id(right)), lambda: op_class(left, right))
+
+    def conj(self, left, right):
+        """
+        @rtype And
+        """
+        left = self.intern(left)
+        right = self.intern(right)
+        return self._unique((And, id(left), id(right)), lambda: And(left, right))
+
+    def negate(self, expression):
+        """
+        @rtype Not
+        """
+        expression = self.intern(expression)
+        return self._unique((Not, id(expression)), lambda: Not(expression))
+
+    def disj(self, left, right):
+        """
+        @rtype Or
+        """
+        left = self.intern(left)
+        right = self.intern(right)
+        return self._unique((Or, id(left), id(right)), lambda: Or(left, right))
+
+    def ite(self, cond, then, otherwise):
+        """
+        @rtype Ite
+        """
+        cond = self.intern(cond)
+        then = self.intern(then)
+        otherwise = self.intern(otherwise)
+        return self._unique((Ite, id(cond), id(then), id(otherwise)), lambda: Ite(cond, then, otherwise))
+
+    def intern(self, node):
+        """
+        Unique representative of a node built elsewhere (e.g. a program constant or an unpickled constraint)
+        """
+        if getattr(node, '_factory', None) is self or node is SymTrue or node is SymFalse:
+            return node
+        if isinstance(node, Value):
+            return self.value(node.value, node.tainted)
+        if isinstance(node, SymInput):
+            return self.input(node.name)
+        if isinstance(node, BinOp):
+            return self.binop(node.__class__, node.left, node.right)
+        if isinstance(node, And):
+            return self.conj(node.left, node.right)
+        if isinstance(node, Not):
+            return self.negate(node.expression)
+        if isinstance(node, Or):
+            return self.disj(node.left, node.right)
+        if isinstance(node, Ite):
+            return self.ite(node.cond, node.then, node.otherwise)
+        return node
+
+
+symbols = SymbolFactory()
+
+
+def _constant(node):
+    """
+    @return: the int held by an untainted Value, None for anything else
+    """
+    if isinstance(node, Value) and not node.tainted:
+        return as_int(node.value)
+    return None
+
+
+class Simplifier(object):
+    """
+    Rewrites symbolic nodes as they are built: folds constants and applies algebraic identities (x + 0, x * 1,
+    x - x, nested constant additions, ...) under 32 bits modular arithmetic.
+    Results are memoized per interned node.
+    """
+    SIGN_BIT = 2 ** 31
+
+    def __init__(self, factory):
+        """
+        @type factory: SymbolFactory
+        """
+        self.factory = factory
+        self.memo = weakref.WeakKeyDictionary()
+
+    def const(self, value, tainted=False):
+        return self.factory.value(UInt32(value & WORD_MASK), tainted)
+
+    def binop(self, op_class, left, right):
+        """
+        Simplified equivalent of op_class(left, right)
+        @type op_class: type
+        """
+        node = self.factory.binop(op_class, left, right)
+        simplified = self.memo.get(node, node)
+        if simplified is node:
+            simplified = self.rewrite(node)
+            # the memo must not keep its own keys alive
+            self.memo[node] = None if simplified is node else simplified
+        return node if simplified is None else simplified
+
+    def rewrite(self, node):
+        """
+        @type node: BinOp
+        """
+        op_class = node.__class__
+        left, right = node.left, node.right
+        if isinstance(left, Value) and isinstance(right, Value) and op_class.OPERATION is not None:
+            return self.const(op_class.OPERATION(as_int(left.value), as_int(right.value)),
+                              left.tainted | right.tainted)
+        left_constant = _constant(left)
+        right_constant = _constant(right)
+        if op_class is AddOp:
+            if left_constant is not None:
+                return self.add_constant(right, left_constant)
+            if right_constant is not None:
+                return self.add_constant(left, right_constant)
+        elif op_class is SubOp:
+            if left is right:
+                return self.const(0)
+            if right_constant is not None:
+                return self.add_constant(left, -right_constant)
+        elif op_class is MulOp:
+            if left_constant is not None:
+                return self.mul_constant(right, left_constant, node)
+            if right_constant is not None:
+                return self.mul_constant(left, right_constant, node)
+        elif op_class is EQ:
+            if left is right:
+                return self.const(1)
+            if right_constant is not None:
+                base, offset = self.split_addition(left)
+                if offset:
+                    return self.factory.binop(EQ, base, self.const(right_constant - offset))
+            if left_constant is not None:
+                base, offset = self.split_addition(right)
+                if offset:
+                    return self.factory.binop(EQ, self.const(left_constant - offset), base)
+        elif op_class is GT:
+            if left is right:
+                return self.const(0)
+        return node
+
+    def split_addition(self, node):
+        """
+        @return: (x, k) such that node == x + k
+        """
+        if isinstance(node, AddOp):
+            constant = _constant(node.right)
+            if constant is not None:
+                return node.left, constant
+            constant = _constant(node.left)
+            if constant is not None:
+                return node.right, constant
+        elif isinstance(node, SubOp):
+            constant = _constant(node.right)
+            if constant is not None:
+                return node.left, -constant
+        return node, 0
+
+    def add_constant(self, node, constant):
+        base, offset = self.split_addition(node)
+        offset = (offset + constant) & WORD_MASK
+        if offset == 0:
+            return base
+        if offset >= self.SIGN_BIT:
+            return self.factory.binop(SubOp, base, self.const(-offset))
+        return self.factory.binop(AddOp, base, self.const(offset))
+
+    def mul_constant(self, node, constant, original):
+        constant &= WORD_MASK
+        if constant == 0:
+            return self.const(0)
+        if constant == 1:
+            return node
+        if isinstance(node, MulOp):
+            inner = _constant(node.left)
+            other = node.right
+            if inner is None:
+                inner = _constant(node.right)
+                other = node.left
+            if inner is not None:
+                return self.factory.binop(MulOp, self.const(inner * constant), other)
+        return original
+
+    def conj(self, left, right):
+        """
+        Simplified equivalent of And(left, right)
+        """
+        if left is SymFalse or right is SymFalse:
+            return SymFalse
+        for node, other in ((left, right), (right, left)):
+            if node is SymTrue:
+                return self.factory.intern(other)
+            constant = _constant(node)
+            if constant is not None:
+                return self.factory.intern(other) if constant else SymFalse
+        return self.factory.conj(left, right)
+
+    def negate(self, expression):
+        """
+        Simplified equivalent of Not(expression)
+        """
+        if expression is SymTrue:
+            return SymFalse
+        if expression is SymFalse:
+            return SymTrue
+        if isinstance(expression, Not):
+            return self.factory.intern(expression.expression)
+        constant = _constant(expression)
+        if constant is not None:
+            return self.const(0 if constant else 1)
+        return self.factory.negate(expression)
+
+    def disj(self, left, right):
+        """
+        Simplified equivalent of Or(left, right)
+        """
+        if left is SymFalse:
+            return right
+        if right is SymFalse or left is right:
+            return left
+        if left is SymTrue or right is SymTrue:
+            return SymTrue
+        if self.negate(left) is self.factory.intern(right):
+            return SymTrue
+        return self.factory.disj(left, right)
+
+    def ite(self, cond, then, otherwise):
+        """
+        Simplified equivalent of Ite(cond, then, otherwise)
+        """
+        if cond is SymTrue:
+            return self.factory.intern(then)
+        if cond is SymFalse:
+            return self.factory.intern(otherwise)
+        constant = _constant(cond)
+        if constant is not None:
+            return self.factory.intern(then if constant else otherwise)
+        then = self.factory.intern(then)
+        otherwise = self.factory.intern(otherwise)
+        if then is otherwise:
+            return then
+        return self.factory.ite(cond, then, otherwise)
+
 
 class ConcolicInterpreter(BaseInterpreter):
-    def __init__(self, taint_policy, taint_check_handler, id_provider, print_statements=False):
+    """
+    Runs a program on concrete inputs while building the symbolic expression of every value that depends on them.
+    An input read from a GetInput whose source still holds values is a ConcolicValue: its concrete value decides
+    branches, addresses and jump targets, and the symbolic one only goes into the path constraint when a branch
+    depends on it. Operations on Values stay concrete. An input without a concrete value is a plain SymInput, and
+    branches on it are followed as long as the solver can't prove them infeasible.
+    """
+
+    def __init__(self, taint_policy, taint_check_handler, id_provider, print_statements=False, factory=None,
+                 solver=None):
+        """
+        @type id_provider: IdProvider
+        @param factory: factory for the symbolic nodes, the module wide one by default
+        @type factory: SymbolFactory
+        @param solver: solver used to decide the feasibility of branches, see symbolic_engine.solver
+        """
         super(ConcolicInterpreter, self).__init__(taint_policy, taint_check_handler, print_statements)
         self.constraints = SymTrue
         self.id_provider = id_provider
+        self.factory = factory if factory is not None else symbols
+        self.simplifier = Simplifier(self.factory)
+        if solver is None:
+            from symbolic_engine.solver import Solver
+            solver = Solver(factory=self.factory)
+        self.solver = solver
+
+    def concrete_input(self, expression, name):
+        """
+        @type expression: GetInput
+        @param name: name of the symbol of the input
+        @return: the concrete value of the input (UInt32), None to keep the input symbolic only
+        """
+        if expression.source:
+            return expression.get_input()
+        return None
 
     def eval_input(self, expression, context):
-        return SymInput(self.id_provider.get_next_name())
-
-    def eval_if(self, context):
-        if_instr = context.current_instr()
-        assert isinstance(if_instr, IF)
-        e = if_instr.e
-        e1 = if_instr.e1
-        #e2 = if_instr.e2
-        e_v = self.eval_expression(e, context)
-        self.constraints = And(self.constraints, e_v)
-        e1_v = self.eval_expression(e1, context)
-        context.pc = e1_v.value
-        return context
+        symbol = self.factory.input(self.id_provider.get_next_name())
+        concrete = self.concrete_input(expression, symbol.name)
+        if concrete is None:
+            return symbol
+        return ConcolicValue(concrete, symbol, self.taint_policy.input_policy(expression.input_name))
+
+    def symbolic_binop(self, op_class, left, right):
+        if left.__class__ is ConcolicValue:
+            if right.__class__ is ConcolicValue:
+                symbolic = self.simplifier.binop(op_class, left.symbolic, right.symbolic)
+            elif right.__class__ is Value:
+                symbolic = self.simplifier.binop(op_class, left.symbolic, right)
+            else:
+                return self.simplifier.binop(op_class, left.symbolic, right)
+        elif right.__class__ is ConcolicValue:
+            if left.__class__ is not Value:
+                return self.simplifier.binop(op_class, left, right.symbolic)
+            symbolic = self.simplifier.binop(op_class, left, right.symbolic)
+        else:
+            return self.simplifier.binop(op_class, left, right)
+        operation = op_class.OPERATION
+        if operation is None:
+            raise Exception("Operation not implemented")
+        value = operation(left.value, right.value)
+        tainted = left.tainted | right.tainted
+        if isinstance(symbolic, Value):
+            # the inputs cancel out, e.g. x - x
+            return Value.of(value, tainted)
+        return ConcolicValue(value, symbolic, tainted)
+
+    def branch_condition(self, cond, context):
+        """
+        Decides a concrete or concolic condition by its value, recording the side taken of a concolic one in the
+        path constraint. A symbolic condition is followed unless the solver proves it can't hold.
+        """
+        if cond.__class__ is Value:
+            return BaseInterpreter.branch_condition(self, cond, context)
+        if cond.__class__ is ConcolicValue:
+            taken = BaseInterpreter.branch_condition(self, cond, context)
+            self.assume(cond.symbolic if taken else self.simplifier.negate(cond.symbolic))
+            return taken
+        taken = self.solver.may_be_true(cond)
+        self.assume(cond if taken else self.simplifier.negate(cond))
+        return taken
+
+    def assume(self, constraint):
+        """
+        Adds a constraint to the path constraint
+        """
+        self.constraints = self.simplifier.conj(self.constraints, constraint)
+        self.solver.add(constraint)
+
+    def set_constraints(self, constraints):
+        """
+        Replaces the path constraint
+        """
+        self.constraints = constraints
+        self.solver.reset()
+        self.solver.add(constraints)
 
     def eval_expression(self, expression, context):
         name = expression.get_name()
         if name == "SymInput":
+            if self.profile is not None:
+                self.profile.expression_counts[name] += 1
             return expression
         return super(ConcolicInterpreter, self).eval_expression(expression, context)
 
 
 class Value(Expression):
-    """"""
+    """
+    Concrete value. Values are never modified once built, so the untainted small constants are shared: use
+    Value.of to get them.
+    """
+    __slots__ = ('value', 'tainted')
 
     def __init__(self, value, tainted=False):
         """Constructor for Value"""
         self.value = value
         self.tainted = tainted
 
+    @staticmethod
+    def of(value, tainted=False):
+        """
+        Same as Value(value, tainted), returning the shared flyweight for untainted ints and UInt32 below
+        SMALL_CONSTANTS
+        @type value: UInt32 | int
+        @rtype Value
+        """
+        if not tainted:
+            cls = value.__class__
+            if cls is UInt32:
+                if value.value < SMALL_CONSTANTS:
+                    return _untainted_words[value.value]
+            elif cls is int and 0 <= value < SMALL_CONSTANTS:
+                return _untainted_ints[value]
+        return Value(value, tainted)
+
     def isTainted(self):
         return self.tainted
 
+    def __eq__(self, other):
+        return isinstance(other, Value) and self.value == other.value and (self.tainted or 0) == (other.tainted or 0)
+
+    def __ne__(self, other):
+        return not self == other
+
     def __str__(self):
         return str(self.value)
 
+    def structural_hash(self):
+        return hash(('Value', as_int(self.value), self.tainted or 0))
+
+
+_untainted_words = tuple(Value(UInt32.of(value)) for value in range(SMALL_CONSTANTS))
+_untainted_ints = tuple(Value(value) for value in range(SMALL_CONSTANTS))
+
+
+class ConcolicValue(Expression):
+    """
+    Value that depends on inputs, see ConcolicInterpreter: value and tainted are those of the run, as in a Value,
+    symbolic is the expression of the value over the inputs
+    """
+    __slots__ = ('value', 'tainted', 'symbolic')
+
+    def __init__(self, value, symbolic, tainted=False):
+        """
+        @type value: UInt32
+        @type symbolic: Expression
+        """
+        self.value = value
+        self.symbolic = symbolic
+        self.tainted = tainted
+
+    def isTainted(self):
+        return self.tainted
+
+    def concrete(self):
+        """
+        @rtype Value
+        """
+        return Value(self.value, self.tainted)
+
+    def __str__(self):
+        return str(self.symbolic)
+
 
 class GetInput(Expression):
     """"""
+    __slots__ = ('source', 'input_name')
 
     def __init__(self, source, input_name="default"):
         """Constructor for GetInput"""
@@ -612,6 +2211,7 @@ class AlignmentException(Exception):
 
 class Store(Instruction):
     """"""
+    __slots__ = ('address', 'value')
 
     def __init__(self, address, value):
         """Constructor for Store
@@ -624,6 +2224,7 @@ class Store(Instruction):
 
 class Load(Expression):
     """"""
+    __slots__ = ('address',)
 
     def __init__(self, address):
         """Constructor for Load
@@ -634,6 +2235,7 @@ class Load(Expression):
 
 class Goto(Instruction):
     """"""
+    __slots__ = ('pc',)
 
     def __init__(self, pc):
         """Constructor for Goto
@@ -644,6 +2246,7 @@ class Goto(Instruction):
 
 class Var(Expression):
     """"""
+    __slots__ = ('var_name',)
 
     def __init__(self, var_name):
         """Constructor for Var
@@ -657,6 +2260,7 @@ class Var(Expression):
 
 class IF(Expression):
     """"""
+    __slots__ = ('e', 'e1', 'e2')
 
     def __init__(self, e, e1, e2):
         """Constructor for IF
@@ -0,0 +1,258 @@
+"""
+Control flow graph of a Program and block-at-a-time execution.
+
+A basic block is a run of statements entered only at its first one and left only after its last one: blocks
+start at pc 0, at every constant target of a Goto or IF and after every Goto or IF. Targets that are computed
+(anything but a constant Value) are not known statically; the block ending in such a jump is marked computed and
+any pc may follow it, which the engine handles by entering a block in the middle when it has to.
+
+control_flow_graph() builds the graph of a program once and caches it for as long as the program lives, so
+interpreters and analyses share it.
+"""
+import bisect
+import weakref
+
+from symbolic_engine import BaseInterpreter, Interpreter, ConcolicInterpreter, Instruction, Value, as_int
+
+# statements that always continue at the next pc
+FALL_THROUGH = frozenset(['Assign', 'Store'])
+
+_graphs = weakref.WeakKeyDictionary()
+
+
+def static_targets(stmt):
+    """
+    @type stmt: Instruction
+    @return: (targets, computed): the constant targets of a jump and whether some target is computed
+    """
+    name = stmt.get_name()
+    if name == 'Goto':
+        expressions = [stmt.pc]
+    elif name == 'IF':
+        expressions = [stmt.e1, stmt.e2]
+    else:
+        return [], True
+    targets = []
+    computed = False
+    for expression in expressions:
+        if isinstance(expression, Value):
+            targets.append(as_int(expression.value))
+        else:
+            computed = True
+    return targets, computed
+
+
+class BasicBlock(object):
+    """Statements [start, stop) of a program"""
+
+    def __init__(self, index, start, stop):
+        self.index = index
+        self.start = start
+        self.stop = stop
+        # pcs of the blocks that may follow this one
+        self.successors = []
+        self.predecessors = []
+        # the block ends in a jump with a target that is only known at run time
+        self.computed = False
+        # the program may end after this block
+        self.exit = False
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __str__(self):
+        return "block %d [%d, %d) -> %s%s%s" % (self.index, self.start, self.stop, self.successors,
+                                                 " computed" if self.computed else "", " exit" if self.exit else "")
+
+
+class ControlFlowGraph(object):
+    """Basic blocks of a program and the edges between them"""
+
+    def __init__(self, program):
+        """
+        @type program: Program
+        """
+        stmts = program.stmts
+        size = self.size = len(stmts)
+        leaders = set([0]) if size else set()
+        jumps = {}
+        for pc, stmt in enumerate(stmts):
+            if stmt.get_name() in FALL_THROUGH:
+                continue
+            targets, computed = jumps[pc] = static_targets(stmt)
+            leaders.update(target for target in targets if 0 <= target < size)
+            if pc + 1 < size:
+                leaders.add(pc + 1)
+        self.starts = sorted(leaders)
+        self.blocks = [BasicBlock(index, start, self.starts[index + 1] if index + 1 < len(self.starts) else size)
+                       for index, start in enumerate(self.starts)]
+        self.computed_blocks = []
+        for block in self.blocks:
+            last = block.stop - 1
+            if last in jumps:
+                targets, block.computed = jumps[last]
+            else:
+                targets = [block.stop]
+            for target in targets:
+                if 0 <= target < size:
+                    if target not in block.successors:
+                        block.successors.append(target)
+                else:
+                    block.exit = True
+            if block.computed:
+                block.exit = True
+                self.computed_blocks.append(block)
+        # some block may run more than once: an edge goes back to a block at or before its source, since edges to
+        # later blocks alone can't close a cycle, or a jump is computed
+        self.loops = bool(self.computed_blocks)
+        for block in self.blocks:
+            for target in block.successors:
+                self.block_at(target).predecessors.append(block.start)
+                self.loops = self.loops or target <= block.start
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def block_at(self, pc):
+        """
+        @type pc: int
+        @return: the block holding the statement at pc
+        @rtype BasicBlock
+        """
+        if not 0 <= pc < self.size:
+            raise IndexError(pc)
+        return self.blocks[bisect.bisect_right(self.starts, pc) - 1]
+
+    def reachable(self):
+        """
+        @return: set of the start pcs of the blocks reachable from pc 0; every block counts as reachable when a
+        reachable block has a computed jump
+        """
+        if not self.blocks:
+            return set()
+        seen = set([0])
+        pending = [0]
+        while pending:
+            block = self.block_at(pending.pop())
+            if block.computed:
+                return set(self.starts)
+            for target in block.successors:
+                if target not in seen:
+                    seen.add(target)
+                    pending.append(target)
+        return seen
+
+    def __str__(self):
+        return "\n".join(str(block) for block in self.blocks)
+
+
+def control_flow_graph(program):
+    """
+    The graph of a program, built the first time it is asked for. A program whose number of statements changed
+    gets a new graph; programs are otherwise expected not to change once run.
+    @type program: Program
+    @rtype ControlFlowGraph
+    """
+    graph = _graphs.get(program)
+    if graph is None or graph.size != len(program.stmts):
+        graph = _graphs[program] = ControlFlowGraph(program)
+    return graph
+
+
+def context_rule(rule):
+    """
+    @return: rule taking a statement like the STATEMENT_RULES of BlockExecution, for a rule taking the context only
+    """
+    def call(context, _):
+        return rule(context)
+
+    return call
+
+
+class BlockExecution(object):
+    """
+    Mixin that replaces the fetch-execute loop of an interpreter with one dispatch per basic block: the rules of
+    the statements of a block and the statements themselves are looked up once, and a run calls the rules in a
+    row, handing each one its statement so it doesn't fetch it from the context again. Statements whose rule the
+    interpreter overrides may jump anywhere, so they end the run of rules they are in, and get the context only.
+    Profiling and print_statements use the statement loop of the interpreter.
+    """
+
+    # rules that always continue at the next pc, unless the interpreter overrides them
+    FALL_THROUGH_RULES = frozenset([BaseInterpreter.assign_rule.__func__, BaseInterpreter.store_rule.__func__,
+                                    BaseInterpreter.clean_store_rule.__func__])
+    # rules taking the statement they run after the context
+    STATEMENT_RULES = FALL_THROUGH_RULES | frozenset([BaseInterpreter.goto_rule.__func__,
+                                                      BaseInterpreter.clean_goto_rule.__func__,
+                                                      BaseInterpreter.eval_if.__func__])
+
+    def entry_key(self, context):
+        """
+        @return: what the rules chosen for the statements of the program of the context depend on; the rules are
+        chosen again when it changes
+        """
+        return control_flow_graph(context.program)
+
+    def statement_rule(self, key, pc, stmt):
+        """
+        @param key: see entry_key
+        @return: the rule that runs the statement at pc, None if there is none
+        """
+        return self.rules.get(stmt.get_name())
+
+    def block_rules(self, program, pc, key):
+        """
+        @return: the (rule, statement) pairs of the statements from pc up to the end of its block
+        """
+        stmts = program.stmts
+        rules = []
+        for index in xrange(pc, control_flow_graph(program).block_at(pc).stop):
+            stmt = stmts[index]
+            rule = self.statement_rule(key, index, stmt)
+            if rule is None:
+                rules.append((self.missing_rule, stmt))
+                break
+            function = getattr(rule, '__func__', None)
+            rules.append((rule if function in self.STATEMENT_RULES else context_rule(rule), stmt))
+            if function not in self.FALL_THROUGH_RULES:
+                break
+        return tuple(rules)
+
+    def missing_rule(self, context, instr):
+        raise Exception("No rule for %s" % instr.get_name())
+
+    def run(self, context):
+        """
+        @type context: Context
+        """
+        if self.profile is not None or self.print_statements:
+            return super(BlockExecution, self).run(context)
+        assert isinstance(context.current_instr(), Instruction)
+        program = context.program
+        try:
+            cache = self.__entries
+        except AttributeError:
+            cache = self.__entries = weakref.WeakKeyDictionary()
+        key = self.entry_key(context)
+        entries = cache.get(program)
+        if entries is None or entries[None] != key:
+            entries = cache[program] = {None: key}
+        end = len(program.stmts)
+        while 0 <= context.pc < end:
+            rules = entries.get(context.pc)
+            if rules is None:
+                rules = entries[context.pc] = self.block_rules(program, context.pc, key)
+            for rule, stmt in rules:
+                context = rule(context, stmt)
+        return context
+
+
+class BlockInterpreter(BlockExecution, Interpreter):
+    pass
+
+
+class BlockConcolicInterpreter(BlockExecution, ConcolicInterpreter):
+    pass
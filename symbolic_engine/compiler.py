@@ -0,0 +1,379 @@
+"""
+Compilation of a Program into threaded code.
+
+Every statement is decoded once into a python closure that takes the context and returns the next pc, and every
+expression tree is folded into nested closures. Running a program is then a plain loop over a list of callables,
+with no name lookups or rule dispatch per step.
+
+Compiling a statement costs more than interpreting it once, so a fresh program would run slower compiled than
+interpreted. Statements are therefore compiled lazily: the first time a statement runs it goes through the
+interpreter's rule, and only when it runs again - inside a loop, or when the same Program is run another time by the
+same interpreter - is it compiled in its place in the code list. Straight-line code pays for a stub call per
+statement and nothing else, while loops and re-runs get the compiled closures.
+"""
+import weakref
+
+from symbolic_engine import (BaseInterpreter, Interpreter, ConcolicInterpreter, Instruction, BinOp, Value,
+                             BINOPS, as_int)
+
+
+class Code(list):
+    """
+    The closures of a program, one per statement. Unlike a plain list it can be referred to weakly, so that the stubs
+    it holds do not keep it, and the statements they hold, alive in a reference cycle once the program is gone.
+    """
+    __slots__ = ('__weakref__',)
+
+
+class ProgramCompiler(object):
+    """
+    Turns the statements of a Program into closures bound to the semantics of an interpreter.
+    Statements or expressions the compiler does not know about, or whose rule or eval_* method the interpreter
+    overrides, are compiled into closures that delegate to the interpreter itself, so the result is always the same
+    as running the program with that interpreter.
+    """
+    # eval_expression implementations that dispatch program expressions the way BaseInterpreter does
+    # (ConcolicInterpreter's only adds SymInput, which never appears in a program)
+    STANDARD_DISPATCH = frozenset([BaseInterpreter.eval_expression.__func__,
+                                   ConcolicInterpreter.eval_expression.__func__])
+
+    def __init__(self, interpreter):
+        """
+        @type interpreter: BaseInterpreter
+        """
+        self.interpreter = interpreter
+        self.tracer = interpreter.tracer
+        self.profile = interpreter.profile
+        self.statement_compilers = {
+            'Assign': (BaseInterpreter.assign_rule, self.compile_assign),
+            'Store': (BaseInterpreter.store_rule, self.compile_store),
+            'Goto': (BaseInterpreter.goto_rule, self.compile_goto),
+            'IF': (BaseInterpreter.eval_if, self.compile_if)
+        }
+        self.expression_compilers = {
+            'Value': ('eval_value', self.compile_value),
+            'Var': ('eval_var', self.compile_var),
+            'Load': ('eval_load', self.compile_load),
+            'GetInput': (None, self.compile_input)
+        }
+        self.dispatch_overridden = self.method_function('eval_expression') not in self.STANDARD_DISPATCH
+        self.binop_overridden = self.overrides('eval_binop')
+
+    def method_function(self, name):
+        return getattr(getattr(self.interpreter, name), '__func__', None)
+
+    def overrides(self, name):
+        """
+        @return: whether the interpreter replaces the BaseInterpreter method name, in its class or on itself
+        """
+        return self.method_function(name) is not getattr(BaseInterpreter, name).__func__
+
+    def compile(self, program):
+        """
+        @type program: Program
+        @return: a list with one closure per statement
+        """
+        return [self.compile_statement(stmt, pc) for pc, stmt in enumerate(program.stmts)]
+
+    def compile_lazily(self, program):
+        """
+        @type program: Program
+        @return: a list with one stub per statement, that runs the statement with the interpreter's rule and replaces
+        itself in the list with the compiled statement once the statement runs again
+        """
+        code = Code()
+        slots = weakref.proxy(code)
+        ran = set()
+        for pc, stmt in enumerate(program.stmts):
+            code.append(self.stub_statement(slots, ran, stmt, pc))
+        return code
+
+    def stub_statement(self, code, ran, stmt, pc):
+        """
+        @param code: a weak proxy of the code the stub is part of
+        @param ran: the pcs of the statements of the code that ran once already
+        @type ran: set
+        @type stmt: Instruction
+        @type pc: int
+        """
+        rules = self.interpreter.rules
+        compile_statement = self.compile_statement
+
+        def run_once(context):
+            if pc in ran:
+                compiled = code[pc] = compile_statement(stmt, pc)
+                return compiled(context)
+            ran.add(pc)
+            name = stmt.get_name()
+            rule = rules.get(name)
+            if rule is None:
+                raise Exception("No rule for %s" % name)
+            context.pc = pc
+            rule(context)
+            return context.pc
+
+        return run_once
+
+    def compile_statement(self, stmt, pc):
+        """
+        @type stmt: Instruction
+        @type pc: int
+        """
+        name = stmt.get_name()
+        rule = self.interpreter.rules.get(name)
+        base_rule, compiler = self.statement_compilers.get(name, (None, None))
+        if rule is None or base_rule is None or getattr(rule, '__func__', None) is not base_rule.__func__:
+            return self.compile_rule_call(stmt, pc, rule)
+        return compiler(stmt, pc)
+
+    def compile_rule_call(self, stmt, pc, rule):
+        name = stmt.get_name()
+
+        def call_rule(context):
+            if rule is None:
+                raise Exception("No rule for %s" % name)
+            context.pc = pc
+            rule(context)
+            return context.pc
+
+        return call_rule
+
+    def compile_assign(self, stmt, pc):
+        var_name = stmt.var_name
+        expression = self.compile_expression(stmt.expression)
+        next_pc = pc + 1
+
+        tracer = self.tracer
+
+        def assign(context):
+            context.variables[var_name] = expression(context)
+            return next_pc
+
+        def traced_assign(context):
+            value = context.variables[var_name] = expression(context)
+            tracer.assign(pc, var_name, value)
+            return next_pc
+
+        return assign if tracer is None else traced_assign
+
+    def compile_store(self, stmt, pc):
+        address = self.compile_expression(stmt.address)
+        value = self.compile_expression(stmt.value)
+        tainted_address = self.interpreter.taint_policy.tainted_address
+        next_pc = pc + 1
+
+        tracer = self.tracer
+
+        def store(context):
+            v1 = address(context)
+            v2 = value(context)
+            address_tainted = tainted_address(v1, v2)
+            if tracer is not None:
+                tracer.store(pc, v1, v2, address_tainted)
+            context.set_mem_value(v1.value, v2)
+            context.set_mem_address_taint(v1.value, address_tainted)
+            return next_pc
+
+        return store
+
+    def compile_goto(self, stmt, pc):
+        target = self.compile_expression(stmt.pc)
+        goto_check = self.interpreter.taint_policy.goto_check
+        taint_check_handler = self.interpreter.taint_check_handler
+
+        tracer = self.tracer
+
+        def goto(context):
+            v1 = target(context)
+            if not goto_check(v1):
+                taint_check_handler.handle_goto(pc, stmt)
+            if tracer is not None:
+                tracer.goto(pc, v1)
+            return as_int(v1.value)
+
+        return goto
+
+    def compile_if(self, stmt, pc):
+        cond = self.compile_expression(stmt.e)
+        e1 = self.compile_expression(stmt.e1)
+        e2 = self.compile_expression(stmt.e2)
+        branch_condition = self.interpreter.branch_condition
+
+        tracer = self.tracer
+
+        def branch(context):
+            if branch_condition(cond(context), context):
+                return as_int(e1(context).value)
+            return as_int(e2(context).value)
+
+        def traced_branch(context):
+            taken = branch_condition(cond(context), context)
+            v1 = e1(context) if taken else e2(context)
+            tracer.branch(pc, taken, v1)
+            return as_int(v1.value)
+
+        return branch if tracer is None else traced_branch
+
+    def compile_expression(self, expression):
+        """
+        @type expression: Expression
+        @return: a closure that evaluates the expression in a context
+        """
+        name = expression.get_name()
+        if name in BINOPS:
+            delegated = self.dispatch_overridden or self.binop_overridden
+            compiler = self.compile_binop
+        else:
+            method, compiler = self.expression_compilers.get(name, (None, None))
+            delegated = (self.dispatch_overridden or compiler is None or
+                         method is not None and self.overrides(method))
+        if delegated:
+            # eval_expression counts the evaluations of the expression and of everything below it itself
+            return self.compile_eval_call(expression)
+        code = compiler(expression)
+        if self.profile is None:
+            return code
+        return self.count_evaluations(name, code)
+
+    def count_evaluations(self, name, code):
+        expression_counts = self.profile.expression_counts
+
+        def counted(context):
+            expression_counts[name] += 1
+            return code(context)
+
+        return counted
+
+    def compile_eval_call(self, expression):
+        eval_expression = self.interpreter.eval_expression
+
+        def evaluate(context):
+            return eval_expression(expression, context)
+
+        return evaluate
+
+    def compile_binop(self, expression):
+        """
+        @type expression: BinOp
+        """
+        left = self.compile_expression(expression.left)
+        right = self.compile_expression(expression.right)
+        op_class = expression.__class__
+        operation = expression.OPERATION
+        symbolic_binop = self.interpreter.symbolic_binop
+
+        def binop(context):
+            left_value = left(context)
+            right_value = right(context)
+            if not (isinstance(left_value, Value) and isinstance(right_value, Value)):
+                return symbolic_binop(op_class, left_value, right_value)
+            return Value.of(operation(left_value.value, right_value.value),
+                            left_value.tainted | right_value.tainted)
+
+        return binop
+
+    def compile_value(self, expression):
+        def value(_):
+            return expression
+
+        return value
+
+    def compile_var(self, expression):
+        var_name = expression.var_name
+
+        def var(context):
+            return context.variables[var_name]
+
+        return var
+
+    def compile_load(self, expression):
+        address = self.compile_expression(expression.address)
+
+        def load(context):
+            return context.get_mem_value(address(context).value)
+
+        return load
+
+    def compile_input(self, expression):
+        eval_input = self.interpreter.eval_input
+
+        def get_input(context):
+            return eval_input(expression, context)
+
+        return get_input
+
+
+class CompiledExecution(object):
+    """
+    Mixin that replaces the fetch-execute loop of an interpreter with the execution of compiled code.
+    Compiled code is cached per Program for the lifetime of the interpreter, and compiled again when the tracer
+    or the profile changes. Statements are compiled lazily, on their second execution (see the module docstring).
+    """
+    compiler_class = ProgramCompiler
+
+    def compile(self, program):
+        """
+        @type program: Program
+        @return: the list of closures for the program
+        """
+        try:
+            cache = self.__compiled
+        except AttributeError:
+            cache = self.__compiled = weakref.WeakKeyDictionary()
+        instruments, code = cache.get(program, (None, None))
+        if code is None or instruments != (self.tracer, self.profile):
+            code = self.compiler_class(self).compile_lazily(program)
+            cache[program] = ((self.tracer, self.profile), code)
+        return code
+
+    def run(self, context):
+        """
+        @type context: Context
+        """
+        assert isinstance(context.current_instr(), Instruction)
+        code = self.compile(context.program)
+        stmts = context.program.stmts
+        end = len(code)
+        pc = context.pc
+        if self.profile is not None:
+            return self.run_compiled_profiled(context, code, stmts)
+        try:
+            if self.print_statements:
+                while pc < end:
+                    print pc, ": ", str(stmts[pc])
+                    pc = code[pc](context)
+            else:
+                while pc < end:
+                    pc = code[pc](context)
+        finally:
+            context.pc = pc
+        return context
+
+    def run_compiled_profiled(self, context, code, stmts):
+        profile = self.profile
+        timer = profile.timer
+        rule_names = [self.rules[stmt.get_name()].__name__ if stmt.get_name() in self.rules else stmt.get_name()
+                      for stmt in stmts]
+        end = len(code)
+        pc = context.pc
+        profile.start(self, context)
+        try:
+            while pc < end:
+                if self.print_statements:
+                    print pc, ": ", str(stmts[pc])
+                start = timer()
+                next_pc = code[pc](context)
+                profile.statement(pc, stmts[pc], rule_names[pc], timer() - start)
+                pc = next_pc
+        finally:
+            context.pc = pc
+            profile.stop(self, context)
+        return context
+
+
+class CompiledInterpreter(CompiledExecution, Interpreter):
+    pass
+
+
+class CompiledConcolicInterpreter(CompiledExecution, ConcolicInterpreter):
+    pass
@@ -0,0 +1,272 @@
+"""
+Multi-path symbolic exploration.
+
+Every IF whose condition is symbolic forks the state: the running path follows e1 with the condition added to its
+path constraint, and a sibling state that will jump to e2 with the negated condition is put in a worklist.
+Pending states wait in a Frontier whose scheduler decides which runs next, see scheduling; they are run in this
+process or spread over a multiprocessing pool, and results are yielded as soon as each path finishes.
+"""
+import functools
+import multiprocessing
+import Queue
+
+from symbolic_engine import BaseInterpreter, ConcolicInterpreter, Value, SymTrue, IdProvider, as_int
+from symbolic_engine.scheduling import Frontier, DFSScheduler
+from symbolic_engine.solver import Solver, QueryCache
+
+
+class PathState(object):
+    """A pending path: a context together with its own path constraint and symbol numbering"""
+
+    def __init__(self, context, constraint, id_provider, jump=None, depth=0):
+        """
+        @type context: Context
+        @type constraint: SymExpression
+        @type id_provider: IdProvider
+        @param jump: expression for the pc the path resumes at, None to resume at context.pc
+        @param depth: number of forks on the path so far
+        """
+        self.context = context
+        self.constraint = constraint
+        self.id_provider = id_provider
+        self.jump = jump
+        self.depth = depth
+
+
+class PathResult(object):
+    """Outcome of one explored path"""
+
+    def __init__(self, constraint, summary, exception=None):
+        """
+        @type constraint: SymExpression
+        @param summary: see summarize()
+        @type exception: Exception
+        """
+        self.constraint = constraint
+        self.summary = summary
+        self.exception = exception
+
+    def __str__(self):
+        return "%s -> %s%s" % (self.constraint, self.summary,
+                               "" if self.exception is None else " (%s)" % self.exception)
+
+
+def summarize(context):
+    """
+    Picklable summary of a final context
+    @type context: Context
+    """
+    return {
+        'pc': context.pc,
+        'variables': dict((name, (str(value), bool(getattr(value, 'tainted', False))))
+                          for name, value in context.variables.iteritems()),
+        'pages': context.memory.get_page_numbers()
+    }
+
+
+class ExplorationInterpreter(ConcolicInterpreter):
+    """
+    Follows e1 at every symbolic IF and leaves the e2 side in self.pending
+    """
+
+    def __init__(self, taint_policy, taint_check_handler, id_provider, depth=0, max_depth=None, solver=None,
+                 coverage=None):
+        """
+        @param coverage: dict of pc to the number of times it was executed, counted into when given
+        """
+        super(ExplorationInterpreter, self).__init__(taint_policy, taint_check_handler, id_provider, solver=solver)
+        self.depth = depth
+        self.max_depth = max_depth
+        self.pending = []
+        if coverage is not None:
+            for name, rule in self.rules.items():
+                self.rules[name] = self.counting_rule(rule, coverage)
+
+    def concrete_input(self, expression, name):
+        # the concrete values of one run would be wrong on the sides of its branches that are forked
+        return None
+
+    @staticmethod
+    def counting_rule(rule, coverage):
+        @functools.wraps(rule)
+        def counted(context):
+            coverage[context.pc] = coverage.get(context.pc, 0) + 1
+            return rule(context)
+        return counted
+
+    def branch_condition(self, cond, context):
+        if isinstance(cond, Value):
+            return BaseInterpreter.branch_condition(self, cond, context)
+        negated = self.simplifier.negate(cond)
+        if not self.solver.may_be_true(cond):
+            self.assume(negated)
+            return False
+        if (self.max_depth is None or self.depth < self.max_depth) and self.solver.may_be_true(negated):
+            self.depth += 1
+            self.pending.append(PathState(context.fork(), self.simplifier.conj(self.constraints, negated),
+                                          self.id_provider.fork(), context.current_instr().e2, self.depth))
+        self.assume(cond)
+        return True
+
+
+def explore_path(state, taint_policy, taint_check_handler, max_depth=None, cache=None, coverage=None):
+    """
+    Runs a state until its path ends
+    @type state: PathState
+    @param cache: query cache shared by the solvers of the paths explored in this process
+    @type cache: QueryCache
+    @param coverage: dict of pc to hit count the statements run are counted into, None not to count
+    @return: the PathResult and the states forked along the way
+    """
+    interpreter = ExplorationInterpreter(taint_policy, taint_check_handler, state.id_provider, state.depth,
+                                         max_depth, Solver(cache=cache), coverage)
+    # states coming from other processes hold copies of the nodes, not the interned ones
+    interpreter.set_constraints(interpreter.factory.intern(state.constraint))
+    context = state.context
+    exception = None
+    try:
+        if state.jump is not None:
+            context.pc = as_int(interpreter.eval_expression(state.jump, context).value)
+        if context.current_instr() is not None:
+            interpreter.run(context)
+    except Exception, e:
+        exception = e
+    return PathResult(interpreter.constraints, summarize(context), exception), interpreter.pending
+
+
+_worker = {}
+
+
+def _init_worker(program, taint_policy, taint_check_handler, max_depth):
+    _worker.update(program=program, taint_policy=taint_policy, taint_check_handler=taint_check_handler,
+                   max_depth=max_depth, cache=QueryCache())
+
+
+def _explore_in_worker(state, count_coverage):
+    state.context.program = _worker['program']
+    coverage = {} if count_coverage else None
+    result, pending = explore_path(state, _worker['taint_policy'], _worker['taint_check_handler'],
+                                   _worker['max_depth'], _worker['cache'], coverage)
+    for pending_state in pending:
+        pending_state.context.program = None
+    return result, pending, coverage
+
+
+class Explorer(object):
+    """
+    Explores every side of every symbolic branch of a program that the solver can't prove infeasible.
+    The program is sent once to each worker process; pending states travel without it. With a pool, states are
+    handed to the workers only as they free up, so the scheduler keeps choosing among all the pending ones.
+    """
+    poll_interval = 0.1
+    # jobs queued in the pool per worker
+    jobs_per_process = 2
+
+    def __init__(self, taint_policy, taint_check_handler, processes=None, max_paths=None, max_depth=None,
+                 scheduler=None, max_resident=None, spill_directory=None):
+        """
+        @type taint_policy: TaintPolicy
+        @type taint_check_handler: TaintCheckHandler
+        @param processes: size of the worker pool, None for one per core and 0 to explore in this process
+        @param max_paths: stop after this many paths have been started
+        @param max_depth: stop forking a path after this many symbolic branches
+        @param scheduler: a Scheduler called with no arguments (a class) for each exploration, DFSScheduler by
+        default; a CoverageScheduler gets the hit counts of the exploration
+        @param max_resident: pending states kept in memory, see Frontier
+        @param spill_directory: where the pending states over max_resident are written, None to drop them
+        """
+        self.taint_policy = taint_policy
+        self.taint_check_handler = taint_check_handler
+        self.processes = processes
+        self.max_paths = max_paths
+        self.max_depth = max_depth
+        self.scheduler = scheduler if scheduler is not None else DFSScheduler
+        self.max_resident = max_resident
+        self.spill_directory = spill_directory
+        self.coverage = None
+        self.frontier = None
+
+    def new_frontier(self):
+        """
+        A frontier with a new scheduler, and the hit counts it is given (None when it doesn't use them)
+        @rtype Frontier
+        """
+        scheduler = self.scheduler()
+        self.coverage = getattr(scheduler, 'coverage', None)
+        self.frontier = Frontier(scheduler, self.max_resident, self.spill_directory)
+        return self.frontier
+
+    def initial_state(self, context, id_provider=None):
+        return PathState(context, SymTrue, id_provider or IdProvider())
+
+    def explore(self, context, id_provider=None):
+        """
+        Generator yielding a PathResult for every path as soon as it finishes
+        @type context: Context
+        @type id_provider: IdProvider
+        """
+        state = self.initial_state(context, id_provider)
+        if self.processes == 0:
+            return self._explore_serial(state)
+        return self._explore_parallel(state)
+
+    def _explore_serial(self, state):
+        frontier = self.new_frontier()
+        frontier.push(state)
+        started = 0
+        cache = QueryCache()
+        try:
+            while frontier and (self.max_paths is None or started < self.max_paths):
+                started += 1
+                result, pending = explore_path(frontier.pop(), self.taint_policy, self.taint_check_handler,
+                                               self.max_depth, cache, self.coverage)
+                # the first state forked is the first popped by a DFSScheduler
+                for pending_state in reversed(pending):
+                    frontier.push(pending_state)
+                yield result
+        finally:
+            frontier.close()
+
+    def _explore_parallel(self, state):
+        program = state.context.program
+        state.context.program = None
+        pool = multiprocessing.Pool(self.processes, _init_worker,
+                                    (program, self.taint_policy, self.taint_check_handler, self.max_depth))
+        finished = Queue.Queue()
+        frontier = self.new_frontier()
+        frontier.push(state)
+        count_coverage = self.coverage is not None
+        slots = (self.processes or multiprocessing.cpu_count()) * self.jobs_per_process
+        try:
+            jobs = []
+            outstanding = started = 0
+            while True:
+                while frontier and outstanding < slots and (self.max_paths is None or started < self.max_paths):
+                    jobs.append(pool.apply_async(_explore_in_worker, (frontier.pop(), count_coverage),
+                                                 callback=finished.put))
+                    outstanding += 1
+                    started += 1
+                if not outstanding:
+                    break
+                try:
+                    result, pending, coverage = finished.get(True, self.poll_interval)
+                except Queue.Empty:
+                    # callbacks only run on success, a failed job has to be noticed here
+                    for job in jobs:
+                        if job.ready() and not job.successful():
+                            job.get()
+                    jobs = [job for job in jobs if not job.ready()]
+                    continue
+                outstanding -= 1
+                if coverage:
+                    for pc, hits in coverage.iteritems():
+                        self.coverage[pc] = self.coverage.get(pc, 0) + hits
+                for pending_state in reversed(pending):
+                    frontier.push(pending_state)
+                yield result
+            pool.close()
+        finally:
+            frontier.close()
+            pool.terminate()
+            pool.join()
+            state.context.program = program
@@ -0,0 +1,208 @@
+"""
+Generational search (SAGE): new inputs from the branch conditions of concrete runs.
+
+A test is a vector of input values, one per GetInput read in order (the names s_1, s_2, ... the ConcolicInterpreter
+gives them). GenerationalInterpreter runs a program on a test: inputs are ConcolicValues holding the values of the
+test, so every branch is decided by its concrete condition, and the symbolic branch conditions are recorded in the
+order they were met, each oriented the way the run went. No solver is involved in a run.
+
+From a run with conditions c_1 ... c_n, the test for negating c_j is a model of c_1 & ... & c_j-1 & NOT c_j.
+GenerationalSearch solves all of them in one solver session (push/pop around each negation, with the prefix added
+incrementally, so the solver runs without slicing and its backend keeps the prefix between queries), for every run
+of a generation, and runs the whole next generation afterwards. Inputs the model doesn't mention keep the values of
+the parent test. A child only negates the conditions after the one it was made for (its bound), so no test is
+generated twice from the same prefix, and runs whose branch sequence was already seen are not expanded again.
+"""
+from symbolic_engine import BaseInterpreter, ConcolicInterpreter, Value, ConcolicValue, IdProvider, UInt32
+from symbolic_engine.explorer import PathResult, summarize
+from symbolic_engine.solver import Solver, QueryCache, SAT, evaluate
+
+
+class GenerationalInterpreter(ConcolicInterpreter):
+    """
+    ConcolicInterpreter taking its inputs from a test instead of the GetInput sources, recording its branches
+    """
+
+    def __init__(self, taint_policy, taint_check_handler, id_provider, inputs, default_input=0, factory=None,
+                 solver=None):
+        """
+        @param inputs: dict from input name to int; the inputs read that are not in it get default_input and are
+        added to it
+        """
+        super(GenerationalInterpreter, self).__init__(taint_policy, taint_check_handler, id_provider,
+                                                      factory=factory, solver=solver)
+        self.inputs = inputs
+        self.default_input = default_input
+        # (pc, taken, condition as taken, its negation) for every symbolic branch
+        self.branches = []
+
+    def concrete_input(self, expression, name):
+        return UInt32(self.inputs.setdefault(name, self.default_input))
+
+    def branch_condition(self, cond, context):
+        if isinstance(cond, Value):
+            return BaseInterpreter.branch_condition(self, cond, context)
+        if isinstance(cond, ConcolicValue):
+            taken = BaseInterpreter.branch_condition(self, cond, context)
+            cond = cond.symbolic
+        else:
+            taken = bool(evaluate(cond, self.inputs))
+        negated = self.simplifier.negate(cond)
+        if taken:
+            self.branches.append((context.pc, True, cond, negated))
+        else:
+            self.branches.append((context.pc, False, negated, cond))
+        self.constraints = self.simplifier.conj(self.constraints, self.branches[-1][2])
+        return taken
+
+    def path_hash(self):
+        """
+        @return: hash of the sequence of symbolic branches taken
+        """
+        return hash(tuple((pc, taken) for pc, taken, _, _ in self.branches))
+
+
+class TestCase(object):
+    """Input vector of a run, and the first branch condition its run may negate"""
+
+    def __init__(self, inputs, bound=0, generation=0):
+        """
+        @param inputs: dict from input name to int
+        """
+        self.inputs = inputs
+        self.bound = bound
+        self.generation = generation
+
+    def key(self):
+        return tuple(sorted(self.inputs.iteritems()))
+
+
+class TestResult(PathResult):
+    """PathResult of a concrete run, with its test"""
+
+    def __init__(self, test, constraint, summary, exception=None, path=None, new=True):
+        """
+        @type test: TestCase
+        @param path: hash of the branches taken
+        @param new: whether no earlier run took the same branches
+        """
+        super(TestResult, self).__init__(constraint, summary, exception)
+        self.test = test
+        self.path = path
+        self.new = new
+
+
+class GenerationalSearch(object):
+    """
+    Runs a seed test, then generation after generation of the tests made by negating the branches of the runs
+    of the previous one
+    """
+
+    def __init__(self, taint_policy, taint_check_handler, max_runs=None, max_generations=None, default_input=0):
+        """
+        @type taint_policy: TaintPolicy
+        @type taint_check_handler: TaintCheckHandler
+        @param max_runs: stop after this many runs
+        @param max_generations: stop after running this many generations after the seed
+        @param default_input: value of the inputs a test doesn't set
+        """
+        self.taint_policy = taint_policy
+        self.taint_check_handler = taint_check_handler
+        self.max_runs = max_runs
+        self.max_generations = max_generations
+        self.default_input = default_input
+        self.cache = QueryCache()
+        # runs don't query their solver, they share this one instead of building their own
+        self.run_solver = Solver(cache=self.cache)
+        self.paths = set()
+        self.runs = 0
+        self.solver_sessions = 0
+
+    def seed_test(self, seed):
+        """
+        @param seed: list of the input values in the order they are read, or dict from input name to value
+        @rtype TestCase
+        """
+        if seed is None:
+            return TestCase({})
+        if isinstance(seed, dict):
+            return TestCase(dict(seed))
+        provider = IdProvider()
+        return TestCase(dict((provider.get_next_name(), value) for value in seed))
+
+    def run_test(self, context, test):
+        """
+        Runs a test on a fork of the context
+        @type context: Context
+        @type test: TestCase
+        @return: the TestResult and the branches of the run
+        """
+        self.runs += 1
+        run_context = context.fork()
+        interpreter = GenerationalInterpreter(self.taint_policy, self.taint_check_handler, IdProvider(),
+                                              test.inputs, self.default_input, solver=self.run_solver)
+        exception = None
+        try:
+            if run_context.current_instr() is not None:
+                interpreter.run(run_context)
+        except Exception, e:
+            exception = e
+        path = interpreter.path_hash()
+        new = path not in self.paths
+        self.paths.add(path)
+        return (TestResult(test, interpreter.constraints, summarize(run_context), exception, path, new),
+                interpreter.branches)
+
+    def expand(self, solver, test, branches):
+        """
+        Tests negating each branch of a run from the bound of its test on
+        @type solver: Solver
+        @return: list of TestCases
+        """
+        children = []
+        solver.reset()
+        for _, _, condition, _ in branches[:test.bound]:
+            solver.add(condition)
+        for index in xrange(test.bound, len(branches)):
+            _, _, condition, negated = branches[index]
+            solver.push()
+            solver.add(negated)
+            if solver.check() == SAT:
+                inputs = dict(test.inputs)
+                inputs.update(solver.model())
+                children.append(TestCase(inputs, index + 1, test.generation + 1))
+            solver.pop()
+            solver.add(condition)
+        return children
+
+    def search(self, context, seed=None):
+        """
+        Generator yielding a TestResult for every run
+        @type context: Context
+        @param seed: see seed_test
+        """
+        generation = [self.seed_test(seed)]
+        tried = set([generation[0].key()])
+        number = 0
+        while generation:
+            expansions = []
+            for test in generation:
+                if self.max_runs is not None and self.runs >= self.max_runs:
+                    return
+                result, branches = self.run_test(context, test)
+                if result.new and test.bound < len(branches):
+                    expansions.append((test, branches))
+                yield result
+            number += 1
+            if not expansions or self.max_generations is not None and number > self.max_generations:
+                return
+            # one solver session for the whole next generation
+            solver = Solver(cache=self.cache, slicing=False)
+            self.solver_sessions += 1
+            generation = []
+            for test, branches in expansions:
+                for child in self.expand(solver, test, branches):
+                    key = child.key()
+                    if key not in tried:
+                        tried.add(key)
+                        generation.append(child)
@@ -0,0 +1,100 @@
+"""
+Sets of integers stored as sorted, disjoint, half open intervals.
+"""
+from bisect import bisect_left, bisect_right
+
+
+class IntervalSet(object):
+    """
+    Disjoint intervals [start, stop) kept in two sorted lists. Lookups are a bisection; adding or removing a range
+    is a bisection plus one slice assignment, whatever the size of the range.
+    Touching intervals are merged, so the intervals are as few as possible.
+    """
+
+    def __init__(self, intervals=None):
+        """
+        @param intervals: (start, stop) pairs
+        """
+        self.starts = []
+        self.stops = []
+        for start, stop in intervals or ():
+            self.add(start, stop)
+
+    def copy(self):
+        """
+        @rtype IntervalSet
+        """
+        other = IntervalSet()
+        other.starts = self.starts[:]
+        other.stops = self.stops[:]
+        return other
+
+    def add(self, start, stop):
+        if start >= stop:
+            return
+        first = bisect_left(self.stops, start)
+        last = bisect_right(self.starts, stop)
+        if first < last:
+            start = min(start, self.starts[first])
+            stop = max(stop, self.stops[last - 1])
+        self.starts[first:last] = [start]
+        self.stops[first:last] = [stop]
+
+    def remove(self, start, stop):
+        if start >= stop:
+            return
+        first = bisect_right(self.stops, start)
+        last = bisect_left(self.starts, stop)
+        if first >= last:
+            return
+        starts = []
+        stops = []
+        if self.starts[first] < start:
+            starts.append(self.starts[first])
+            stops.append(start)
+        if self.stops[last - 1] > stop:
+            starts.append(stop)
+            stops.append(self.stops[last - 1])
+        self.starts[first:last] = starts
+        self.stops[first:last] = stops
+
+    def overlaps(self, start, stop):
+        """
+        @return: whether any integer in [start, stop) is in the set
+        """
+        index = bisect_right(self.stops, start)
+        return index < len(self.starts) and self.starts[index] < stop and start < stop
+
+    def __contains__(self, point):
+        index = bisect_right(self.stops, point)
+        return index < len(self.starts) and self.starts[index] <= point
+
+    def intervals(self, start=None, stop=None):
+        """
+        Generator of the intervals, clipped to [start, stop) when given
+        """
+        first = 0 if start is None else bisect_right(self.stops, start)
+        last = len(self.starts) if stop is None else bisect_left(self.starts, stop)
+        for index in xrange(first, last):
+            low = self.starts[index]
+            high = self.stops[index]
+            if start is not None and low < start:
+                low = start
+            if stop is not None and high > stop:
+                high = stop
+            yield low, high
+
+    def __iter__(self):
+        return self.intervals()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __eq__(self, other):
+        return isinstance(other, IntervalSet) and self.starts == other.starts and self.stops == other.stops
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __str__(self):
+        return ", ".join("[%d, %d)" % interval for interval in self)
@@ -0,0 +1,101 @@
+"""
+Multi-source taint: which inputs a value depends on, not only whether it depends on any.
+
+Taint stays a single int. Each input name registered in a LabelRegistry gets one bit, a value read from it is
+tainted with that bit, and the rules that already propagate taint (binops OR the taint of their operands, stores
+copy it to the memory cell and its shadow) carry every source at the cost of one integer operation. Plain True
+keeps meaning "tainted by an unnamed source" and is the UNLABELLED bit, so policies and tests using booleans
+work unchanged next to labelled ones.
+"""
+from symbolic_engine import DefaultTaintPolicy, DefaultTaintCheckHandler, AttackException
+
+UNLABELLED = 1
+
+
+class LabelRegistry(object):
+    """Gives every input name its own bit, in the order they are first seen"""
+
+    def __init__(self):
+        self.masks = {}
+        self.names = [None]
+
+    def __len__(self):
+        return len(self.names) - 1
+
+    def label(self, name):
+        """
+        @type name: str
+        @return: the mask of the single label of name, registered the first time it is asked for
+        """
+        mask = self.masks.get(name)
+        if mask is None:
+            mask = self.masks[name] = 1 << len(self.names)
+            self.names.append(name)
+        return mask
+
+    def mask(self, names):
+        """
+        @param names: iterable of input names
+        @return: the mask holding the labels of all of them
+        """
+        mask = 0
+        for name in names:
+            mask |= self.label(name)
+        return mask
+
+    def sources(self, taint):
+        """
+        @param taint: a Value's taint or a memory shadow, bool or mask
+        @return: sorted list of the input names in it; None stands for the unlabelled bit
+        """
+        taint = int(taint or 0)
+        sources = []
+        bit = 0
+        while taint:
+            if taint & 1:
+                sources.append(self.names[bit])
+            taint >>= 1
+            bit += 1
+        return sources
+
+
+class LabelTaintPolicy(DefaultTaintPolicy):
+    """
+    DefaultTaintPolicy whose inputs are tainted with the label of their name. The checks are the same; the labels
+    of the last failed goto check are kept for LabelTaintCheckHandler.
+    """
+
+    def __init__(self, registry=None):
+        """
+        @type registry: LabelRegistry
+        """
+        self.registry = registry if registry is not None else LabelRegistry()
+        self.failed_labels = 0
+
+    def input_policy(self, src):
+        return self.registry.label(src)
+
+    def goto_check(self, v1):
+        if v1.tainted:
+            self.failed_labels = v1.tainted
+            return False
+        return True
+
+
+class LabelTaintCheckHandler(DefaultTaintCheckHandler):
+    """Records which inputs reached every tainted Goto, then raises like DefaultTaintCheckHandler if fatal"""
+
+    def __init__(self, policy, fatal=True):
+        """
+        @type policy: LabelTaintPolicy
+        """
+        self.policy = policy
+        self.fatal = fatal
+        self.attributions = []
+
+    def handle_goto(self, pc, instr):
+        sources = self.policy.registry.sources(self.policy.failed_labels)
+        self.attributions.append((pc, sources))
+        if self.fatal:
+            raise AttackException("Probable attack detected, instruction %s at pc %s, tainted by %s" %
+                                  (pc, instr, ", ".join(str(source) for source in sources)))
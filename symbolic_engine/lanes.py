@@ -0,0 +1,347 @@
+"""
+Batched concrete execution: one Program run on many input vectors at once.
+
+Every input vector is a lane. Variables, memory cells and taint are NumPy arrays with one entry per lane, and the
+lanes that are at the same pc form a group that executes the statement together, so the python overhead of a
+step is paid once per group instead of once per lane. After an IF the lanes of a group are split by the side
+they take, and groups that reach the same pc are merged again. The next group to run is always the one with the
+lowest pc, so lanes that took the shorter side of a branch wait for the others at the join.
+
+Taint is kept as the masks of symbolic_engine.labels, in uint64 arrays; the first mask that doesn't fit in 64 bits
+turns every taint array into an object array of python ints, so label policies with many sources still work, only
+slower.
+
+Arithmetic wraps at 32 bits. Symbolic execution is not supported here; use ConcolicInterpreter for that.
+"""
+from symbolic_engine import Value, UInt32, BINOPS, as_int
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LANE_OPERATIONS = {
+    'AddOp': lambda a, b: a + b,
+    'SubOp': lambda a, b: a - b,
+    'MulOp': lambda a, b: a * b,
+    'EQ': lambda a, b: (a == b).astype(numpy.uint32),
+    'GT': lambda a, b: (a > b).astype(numpy.uint32)
+}
+
+
+class LaneError(Exception):
+    """Raised inside a step for the lanes in mask; only those lanes stop"""
+
+    def __init__(self, mask, exception):
+        """
+        @param mask: bool array over the lanes of the group
+        @type exception: Exception
+        """
+        super(LaneError, self).__init__(str(exception))
+        self.mask = mask
+        self.exception = exception
+
+
+def fits(mask):
+    """
+    @return: whether a taint mask fits in a uint64 taint array
+    """
+    return 0 <= mask < 2 ** 64
+
+
+class LaneMemory(object):
+    """
+    Memory of all the lanes: for every address that was written in some lane, the values, value taint and address
+    taint of every lane. Cells a lane never wrote read as an untainted 0, like Memory.
+    """
+
+    def __init__(self, lanes, taint_type=None):
+        """
+        @param lanes: number of lanes
+        @param taint_type: dtype of the taint arrays
+        """
+        self.lanes = lanes
+        self.taint_type = taint_type or numpy.uint64
+        self.cells = {}
+
+    def cell(self, address):
+        cell = self.cells.get(address)
+        if cell is None:
+            cell = self.cells[address] = (numpy.zeros(self.lanes, numpy.uint32),
+                                          numpy.zeros(self.lanes, self.taint_type),
+                                          numpy.zeros(self.lanes, self.taint_type))
+        return cell
+
+    def widen(self):
+        """Turns the taint arrays into object arrays, for masks over 64 bits"""
+        self.taint_type = object
+        for address, (values, taints, address_taints) in self.cells.items():
+            self.cells[address] = values, taints.astype(object), address_taints.astype(object)
+
+    def store(self, lanes, addresses, values, taints, address_taints):
+        """
+        @param lanes: indexes of the lanes storing
+        @param addresses, values, taints, address_taints: one entry per lane in lanes
+        """
+        for address in numpy.unique(addresses):
+            mask = addresses == address
+            cell_values, cell_taints, cell_address_taints = self.cell(int(address))
+            selected = lanes[mask]
+            cell_values[selected] = values[mask]
+            cell_taints[selected] = taints[mask]
+            cell_address_taints[selected] = address_taints[mask]
+
+    def load(self, lanes, addresses):
+        """
+        @return: values and taints read by the lanes
+        """
+        values = numpy.zeros(len(lanes), numpy.uint32)
+        taints = numpy.zeros(len(lanes), self.taint_type)
+        for address in numpy.unique(addresses):
+            cell = self.cells.get(int(address))
+            if cell is not None:
+                mask = addresses == address
+                values[mask] = cell[0][lanes[mask]]
+                taints[mask] = cell[1][lanes[mask]]
+        return values, taints
+
+    def get_value(self, lane, address):
+        """
+        @type address: UInt32 | int
+        @rtype Value
+        """
+        cell = self.cells.get(as_int(address))
+        if cell is None:
+            return Value(UInt32(0))
+        return Value(UInt32(int(cell[0][lane])), int(cell[1][lane]))
+
+    def get_taint(self, lane, address):
+        cell = self.cells.get(as_int(address))
+        return 0 if cell is None else int(cell[2][lane])
+
+
+class LaneResults(object):
+    """Final state of every lane of a batched run"""
+
+    def __init__(self, pc, variables, memory, errors):
+        """
+        @param pc: array with the final pc of every lane
+        @param variables: dict of name to (values, taints, defined) arrays
+        @type memory: LaneMemory
+        @param errors: dict of lane to the exception that stopped it
+        """
+        self.pc = pc
+        self.variables = variables
+        self.memory = memory
+        self.errors = errors
+
+    def __len__(self):
+        return len(self.pc)
+
+    def lane_variables(self, lane):
+        """
+        @return: dict of name to Value, as the context of a scalar run would hold
+        """
+        return dict((name, Value(UInt32(int(values[lane])), int(taints[lane])))
+                    for name, (values, taints, defined) in self.variables.iteritems() if defined[lane])
+
+
+class LaneInterpreter(object):
+    """
+    Runs a Program on many input vectors in lock-step. The same taint policy and handler as the scalar
+    interpreters are used; goto_check and tainted_address are asked through their *_lanes variants.
+    GetInput reads the inputs given to run, not its own source list.
+    """
+
+    def __init__(self, taint_policy, taint_check_handler):
+        """
+        @type taint_policy: TaintPolicy
+        @type taint_check_handler: TaintCheckHandler
+        """
+        if numpy is None:
+            raise Exception("NumPy is needed for lane execution")
+        self.taint_policy = taint_policy
+        self.taint_check_handler = taint_check_handler
+        self.statement_rules = {
+            'Assign': self.assign_rule,
+            'Store': self.store_rule,
+            'Goto': self.goto_rule,
+            'IF': self.if_rule
+        }
+
+    def run(self, program, inputs):
+        """
+        @type program: Program
+        @param inputs: the input vectors of every lane, either a sequence of sequences (one per lane) read by
+        GetInput("default"), or a dict of input name to such sequences
+        @rtype LaneResults
+        """
+        if not isinstance(inputs, dict):
+            inputs = {'default': inputs}
+        self.inputs = {}
+        lane_count = None
+        for name, vectors in inputs.iteritems():
+            lengths = numpy.array([len(vector) for vector in vectors], numpy.int64)
+            matrix = numpy.zeros((len(vectors), max(lengths.max() if len(lengths) else 0, 1)), numpy.uint32)
+            for lane, vector in enumerate(vectors):
+                matrix[lane, :len(vector)] = [as_int(value) for value in vector]
+            self.inputs[name] = (matrix, lengths, numpy.zeros(len(vectors), numpy.int64))
+            if lane_count is not None and lane_count != len(vectors):
+                raise Exception("every input needs the same number of lanes")
+            lane_count = len(vectors)
+        lane_count = lane_count or 0
+        self.lane_count = lane_count
+        self.variables = {}
+        self.taint_type = numpy.uint64
+        self.memory = LaneMemory(lane_count)
+        self.errors = {}
+        pc = numpy.zeros(lane_count, numpy.int64)
+        groups = {0: numpy.arange(lane_count)} if lane_count else {}
+        stmts = program.stmts
+        while groups:
+            current = min(groups)
+            lanes = groups.pop(current)
+            if not 0 <= current < len(stmts):
+                pc[lanes] = current
+                continue
+            stmt = stmts[current]
+            rule = self.statement_rules.get(stmt.get_name())
+            if rule is None:
+                raise Exception("No rule for %s" % stmt.get_name())
+            while True:
+                cursors = [(cursor, cursor[lanes]) for _, _, cursor in self.inputs.itervalues()]
+                try:
+                    targets = rule(stmt, current, lanes)
+                    break
+                except LaneError, e:
+                    # the statement is run again for the other lanes, so the inputs it read are put back
+                    for cursor, saved in cursors:
+                        cursor[lanes] = saved
+                    for lane in lanes[e.mask]:
+                        self.errors[int(lane)] = e.exception
+                    pc[lanes[e.mask]] = current
+                    lanes = lanes[~e.mask]
+                    if not len(lanes):
+                        targets = None
+                        break
+            if targets is None:
+                continue
+            for target in numpy.unique(targets):
+                selected = lanes[targets == target]
+                target = int(target)
+                if target in groups:
+                    selected = numpy.concatenate((groups[target], selected))
+                groups[target] = selected
+        return LaneResults(pc, self.variables, self.memory, self.errors)
+
+    def assign_rule(self, stmt, pc, lanes):
+        values, taints = self.eval_expression(stmt.expression, lanes)
+        variable = self.variables.get(stmt.var_name)
+        if variable is None:
+            variable = self.variables[stmt.var_name] = (numpy.zeros(self.lane_count, numpy.uint32),
+                                                        numpy.zeros(self.lane_count, self.taint_type),
+                                                        numpy.zeros(self.lane_count, bool))
+        variable[0][lanes] = values
+        variable[1][lanes] = taints
+        variable[2][lanes] = True
+        return numpy.full(len(lanes), pc + 1, numpy.int64)
+
+    def store_rule(self, stmt, pc, lanes):
+        addresses, address_taints = self.eval_expression(stmt.address, lanes)
+        values, taints = self.eval_expression(stmt.value, lanes)
+        shadow = numpy.asarray(self.taint_policy.tainted_address_lanes(addresses, address_taints, values, taints),
+                               self.taint_type)
+        self.memory.store(lanes, addresses, values, taints, shadow)
+        return numpy.full(len(lanes), pc + 1, numpy.int64)
+
+    def goto_rule(self, stmt, pc, lanes):
+        targets, taints = self.eval_expression(stmt.pc, lanes)
+        allowed = numpy.asarray(self.taint_policy.goto_check_lanes(targets, taints), bool)
+        if not allowed.all():
+            failed = numpy.zeros(len(lanes), bool)
+            for index in numpy.flatnonzero(~allowed):
+                # the check is asked again for the lane alone, so a policy keeping what made it fail (like
+                # LabelTaintPolicy) holds the lane the handler is called for
+                self.taint_policy.goto_check(Value(UInt32(int(targets[index])), int(taints[index])))
+                try:
+                    self.taint_check_handler.handle_goto(pc, stmt)
+                except Exception, e:
+                    failed[index] = True
+                    exception = e
+            if failed.any():
+                raise LaneError(failed, exception)
+        return targets.astype(numpy.int64)
+
+    def if_rule(self, stmt, pc, lanes):
+        cond, _ = self.eval_expression(stmt.e, lanes)
+        invalid = cond > 1
+        if invalid.any():
+            raise LaneError(invalid, Exception("Invalid value: expected boolean (0 or 1)"))
+        taken = cond == 1
+        targets = numpy.empty(len(lanes), numpy.int64)
+        for side, expression in ((taken, stmt.e1), (~taken, stmt.e2)):
+            if not side.any():
+                continue
+            try:
+                targets[side] = self.eval_expression(expression, lanes[side])[0]
+            except LaneError, e:
+                # the mask covers the lanes of one side, run needs it over the whole group
+                failed = numpy.zeros(len(lanes), bool)
+                failed[numpy.flatnonzero(side)[e.mask]] = True
+                raise LaneError(failed, e.exception)
+        return targets
+
+    def eval_expression(self, expression, lanes):
+        """
+        @param lanes: indexes of the lanes evaluating the expression
+        @return: (values, taints) arrays with one entry per lane
+        """
+        name = expression.get_name()
+        if name in BINOPS:
+            left, left_taints = self.eval_expression(expression.left, lanes)
+            right, right_taints = self.eval_expression(expression.right, lanes)
+            return LANE_OPERATIONS[name](left, right), left_taints | right_taints
+        elif name == 'Value':
+            return (numpy.full(len(lanes), as_int(expression.value), numpy.uint32),
+                    self.taints(len(lanes), int(expression.tainted or 0)))
+        elif name == 'Var':
+            variable = self.variables.get(expression.var_name)
+            if variable is None:
+                raise LaneError(numpy.ones(len(lanes), bool), KeyError(expression.var_name))
+            undefined = ~variable[2][lanes]
+            if undefined.any():
+                raise LaneError(undefined, KeyError(expression.var_name))
+            return variable[0][lanes], variable[1][lanes]
+        elif name == 'GetInput':
+            return self.eval_input(expression, lanes)
+        elif name == 'Load':
+            addresses, _ = self.eval_expression(expression.address, lanes)
+            return self.memory.load(lanes, addresses)
+        raise NotImplementedError(name)
+
+    def eval_input(self, expression, lanes):
+        if expression.input_name not in self.inputs:
+            raise LaneError(numpy.ones(len(lanes), bool), IndexError("no input %s" % expression.input_name))
+        matrix, lengths, cursors = self.inputs[expression.input_name]
+        positions = cursors[lanes]
+        exhausted = positions >= lengths[lanes]
+        if exhausted.any():
+            raise LaneError(exhausted, IndexError("pop from empty list"))
+        cursors[lanes] += 1
+        tainted = int(self.taint_policy.input_policy(expression.input_name) or 0)
+        return matrix[lanes, positions], self.taints(len(lanes), tainted)
+
+    def taints(self, count, mask):
+        """
+        @return: taint array of count lanes tainted with mask
+        """
+        if self.taint_type is not object and not fits(mask):
+            self.widen()
+        return numpy.full(count, mask, self.taint_type)
+
+    def widen(self):
+        """Turns every taint array into an object array"""
+        self.taint_type = object
+        self.memory.widen()
+        for name, (values, taints, defined) in self.variables.items():
+            self.variables[name] = values, taints.astype(object), defined
@@ -0,0 +1,413 @@
+"""
+State merging: exploring a program with one state per join point instead of one state per path.
+
+MergingExplorer runs the states of a program a segment at a time: a state stops whenever it reaches a join point
+of the control flow graph (a block with more than one predecessor), and the state with the lowest pc runs next,
+so the states that will meet at a join point get there before it is passed. States waiting at the same join
+point are merged: the path constraints c & a and c & b become c & (a OR b), and every variable or memory cell
+that differs becomes ite(a, value in the first state, value in the second).
+
+A merged value is only symbolic until the program needs it as a concrete word. SegmentInterpreter splits it there
+into the words it can be, each with the condition under which it is that word: a Load reads every cell it may
+address and merges them, a Store writes each cell under its condition, and a jump forks one state per target.
+
+Merging trades paths for formulas. A MergeHeuristic refuses merges that would cost more than they save: states
+whose constraints don't tell them apart, states with different variables, and states that differ in too many
+values, a concrete value turning symbolic counting double since it makes later branches on it symbolic.
+"""
+import heapq
+
+from symbolic_engine import (SymTrue, Value, BinOp, Ite, IdProvider, UInt32, Simplifier, MemoryPage, as_int,
+                             symbols)
+from symbolic_engine.cfg import control_flow_graph
+from symbolic_engine.explorer import ExplorationInterpreter, PathState, PathResult, summarize
+from symbolic_engine.solver import Solver, QueryCache, conjuncts
+
+
+class MergeHeuristic(object):
+    """Decides whether two states waiting at the same pc are merged"""
+
+    def __init__(self, max_cost=16, concrete_weight=2):
+        """
+        @param max_cost: largest cost of a merge that is done
+        @param concrete_weight: cost of a difference between two concrete values, other differences cost 1
+        """
+        self.max_cost = max_cost
+        self.concrete_weight = concrete_weight
+
+    def cost(self, differences):
+        """
+        @param differences: see differences()
+        """
+        return sum(self.concrete_weight if isinstance(first, Value) and isinstance(second, Value) else 1
+                   for _, _, first, second in differences)
+
+    def should_merge(self, differences):
+        return self.cost(differences) <= self.max_cost
+
+
+def guards(first, second, simplifier):
+    """
+    Splits two path constraints into the conjuncts they share and the conjuncts only each of them has
+    @return: (common, first guard, second guard) as lists of conjuncts, or None when the guards are not exclusive
+    (no conjunct of one is the negation of a conjunct of the other), i.e. when they don't tell the states apart
+    """
+    first_conjuncts = conjuncts(first)
+    second_conjuncts = conjuncts(second)
+    shared = set(first_conjuncts) & set(second_conjuncts)
+    first_guard = [conjunct for conjunct in first_conjuncts if conjunct not in shared]
+    second_guard = [conjunct for conjunct in second_conjuncts if conjunct not in shared]
+    second_set = set(second_guard)
+    if not any(simplifier.negate(conjunct) in second_set for conjunct in first_guard):
+        return None
+    return [conjunct for conjunct in first_conjuncts if conjunct in shared], first_guard, second_guard
+
+
+def differences(first, second):
+    """
+    @type first: Context
+    @type second: Context
+    @return: list of (kind, key, first value, second value) for the variables ('variable', name) and memory cells
+    ('memory', address) holding different values, None if the states don't have the same variables
+    """
+    if len(first.variables) != len(second.variables):
+        return None
+    result = []
+    for name, value in first.variables.iteritems():
+        if name not in second.variables:
+            return None
+        other = second.variables[name]
+        if value is not other and value != other:
+            result.append(('variable', name, value, other))
+    first_memory, second_memory = first.memory, second.memory
+    page_size = first_memory.page_size
+    for page_nr in sorted(set(first_memory.pages.keys()) | set(second_memory.pages.keys())):
+        first_page = first_memory.pages.get(page_nr)
+        second_page = second_memory.pages.get(page_nr)
+        if first_page is second_page:
+            continue
+        first_page = first_page if first_page is not None else first_memory.zero_page
+        second_page = second_page if second_page is not None else second_memory.zero_page
+        if isinstance(first_page, MemoryPage) and isinstance(second_page, MemoryPage):
+            offsets = first_page.differing_offsets(second_page)
+        else:
+            offsets = xrange(page_size)
+        for offset in offsets:
+            address = page_nr * page_size + offset
+            value = first_memory.get_value(UInt32(address))
+            other = second_memory.get_value(UInt32(address))
+            if value is not other and value != other:
+                result.append(('memory', address, value, other))
+    return result
+
+
+def merge_contexts(first, second, guard, changes, simplifier):
+    """
+    @param guard: condition that holds on the path of first and not on the path of second
+    @param changes: differences(first, second)
+    @return: a context holding ite(guard, first value, second value) wherever they differ
+    @rtype Context
+    """
+    merged = first.fork()
+    for kind, key, value, other in changes:
+        merged_value = simplifier.ite(guard, value, other)
+        if kind == 'variable':
+            merged.variables[key] = merged_value
+        else:
+            merged.memory.set_value(UInt32(key), merged_value)
+    memory = merged.memory
+    for page_nr, page in second.memory.pages.iteritems():
+        if page is first.memory.pages.get(page_nr):
+            continue
+        for low, high in page.tainted_runs():
+            memory.taint_range(low, high)
+    for low, high in second.memory.taint_ranges:
+        memory.taint_range(low, high)
+    return merged
+
+
+class SegmentInterpreter(ExplorationInterpreter):
+    """ExplorationInterpreter that stops at the pcs it is given, and splits merged values needed as words"""
+
+    def run_segment(self, context, stops):
+        """
+        Runs at least one statement, then stops before the first statement whose pc is in stops
+        @type context: Context
+        @param stops: set of pcs
+        """
+        while True:
+            instr = context.current_instr()
+            if instr is None:
+                return context
+            name = instr.get_name()
+            rule = self.rules.get(name)
+            if rule is None:
+                raise Exception("No rule for %s" % name)
+            context = rule(context)
+            if context.pc in stops:
+                return context
+
+    def cases(self, value):
+        """
+        The words a value built by merges can be
+        @return: list of (condition, Value) whose conditions are exclusive and may hold on this path, None when the
+        value depends on inputs other than through the guards of merges
+        """
+        if value.__class__ is Value:
+            return [(SymTrue, value)]
+        simplifier = self.simplifier
+        if isinstance(value, Ite):
+            sides = ((value.cond, value.then), (simplifier.negate(value.cond), value.otherwise))
+        elif isinstance(value, BinOp) and value.OPERATION is not None:
+            left_cases = self.cases(value.left)
+            right_cases = self.cases(value.right)
+            if left_cases is None or right_cases is None:
+                return None
+            return [(simplifier.conj(left_condition, right_condition), simplifier.binop(value.__class__, left, right))
+                    for left_condition, left in left_cases for right_condition, right in right_cases
+                    if self.possible(simplifier.conj(left_condition, right_condition))]
+        else:
+            return None
+        result = []
+        for guard, side in sides:
+            if not self.possible(guard):
+                continue
+            side_cases = self.cases(side)
+            if side_cases is None:
+                return None
+            result.extend((simplifier.conj(guard, condition), word) for condition, word in side_cases)
+        return result
+
+    def possible(self, condition):
+        return condition is SymTrue or self.solver.may_be_true(condition)
+
+    def words(self, value):
+        """
+        @return: cases(value), or the value alone when it is not made of words
+        """
+        if value.__class__ is Value:
+            return [(SymTrue, value)]
+        cases = self.cases(value)
+        # other symbolic values fail as they do without merging
+        return cases if cases else [(SymTrue, value)]
+
+    def eval_load(self, expression, context):
+        cases = self.words(self.eval_expression(expression.address, context))
+        result = context.get_mem_value(cases[-1][1].value)
+        for condition, address in reversed(cases[:-1]):
+            result = self.simplifier.ite(condition, context.get_mem_value(address.value), result)
+        return result
+
+    def store_rule(self, context, instr=None):
+        if instr is None:
+            instr = context.current_instr()
+        cases = self.words(self.eval_expression(instr.address, context))
+        v2 = self.eval_expression(instr.value, context)
+        context.pc += 1
+        for condition, address in cases:
+            address_tainted = self.taint_policy.tainted_address(address, v2)
+            if self.tracer is not None:
+                self.tracer.store(context.pc - 1, address, v2, address_tainted)
+            if len(cases) == 1:
+                context.set_mem_value(address.value, v2)
+                context.set_mem_address_taint(address.value, address_tainted)
+                continue
+            context.set_mem_value(address.value,
+                                  self.simplifier.ite(condition, v2, context.get_mem_value(address.value)))
+            # the shadow has no condition: it keeps the taint of either side
+            if address_tainted:
+                context.set_mem_address_taint(address.value, address_tainted)
+        return context
+
+    def goto_rule(self, context, instr=None):
+        if instr is None:
+            instr = context.current_instr()
+        # the forks run the Goto again, so its check sees their own target
+        target = self.jump_target(self.eval_expression(instr.pc, context), context, True)
+        if not self.taint_policy.goto_check(target):
+            self.taint_check_handler.handle_goto(context.pc, instr)
+        if self.tracer is not None:
+            self.tracer.goto(context.pc, target)
+        context.pc = as_int(target.value)
+        return context
+
+    def eval_if(self, context, instr=None):
+        if instr is None:
+            instr = context.current_instr()
+        cond = self.eval_expression(instr.e, context)
+        taken = self.branch_condition(cond, context)
+        target = self.jump_target(self.eval_expression(instr.e1 if taken else instr.e2, context), context, False)
+        if self.tracer is not None:
+            self.tracer.branch(context.pc, taken, target)
+        context.pc = as_int(target.value)
+        return context
+
+    def jump_target(self, target, context, rerun):
+        """
+        Follows the first word a jump target can be and forks a state for each of the others
+        @param rerun: whether the forks run the statement again, where they only have their own target, rather
+        than jump to their word
+        @rtype Value
+        """
+        cases = self.words(target)
+        for condition, word in cases[1:]:
+            if self.max_depth is not None and self.depth >= self.max_depth:
+                break
+            self.depth += 1
+            self.pending.append(PathState(context.fork(), self.simplifier.conj(self.constraints, condition),
+                                          self.id_provider.fork(), None if rerun else word, self.depth))
+        condition, word = cases[0]
+        # a single case is implied by the path already
+        if len(cases) > 1:
+            self.assume(condition)
+        return word
+
+
+class MergingExplorer(object):
+    """
+    Explores the paths of a program in this process, merging the states that meet at join points when the
+    heuristic agrees. Yields a PathResult per state that finishes; the constraint of a merged state is the
+    disjunction of the paths it stands for.
+    """
+
+    def __init__(self, taint_policy, taint_check_handler, heuristic=None, max_paths=None, max_depth=None):
+        """
+        @type taint_policy: TaintPolicy
+        @type taint_check_handler: TaintCheckHandler
+        @type heuristic: MergeHeuristic
+        @param max_paths: stop forking after this many states have been started
+        @param max_depth: stop forking a state after this many symbolic branches
+        """
+        self.taint_policy = taint_policy
+        self.taint_check_handler = taint_check_handler
+        self.heuristic = heuristic if heuristic is not None else MergeHeuristic()
+        self.max_paths = max_paths
+        self.max_depth = max_depth
+        self.simplifier = Simplifier(symbols)
+        self.merges = 0
+
+    def join_points(self, program):
+        """
+        @return: set of the pcs where states wait for each other
+        """
+        graph = control_flow_graph(program)
+        if graph.computed_blocks:
+            return set(graph.starts)
+        return set(block.start for block in graph if len(block.predecessors) > 1)
+
+    def interpreter(self, state, cache):
+        interpreter = SegmentInterpreter(self.taint_policy, self.taint_check_handler, state.id_provider, state.depth,
+                                         self.max_depth, Solver(cache=cache))
+        interpreter.set_constraints(state.constraint)
+        return interpreter
+
+    def merge(self, first, second):
+        """
+        @type first: PathState
+        @type second: PathState
+        @return: the merged PathState, None if they are not merged
+        """
+        simplifier = self.simplifier
+        split = guards(first.constraint, second.constraint, simplifier)
+        if split is None:
+            return None
+        changes = differences(first.context, second.context)
+        if changes is None or not self.heuristic.should_merge(changes):
+            return None
+        common, first_guard, second_guard = split
+        constraint = SymTrue
+        for conjunct in common:
+            constraint = simplifier.conj(constraint, conjunct)
+        first_condition = SymTrue
+        for conjunct in first_guard:
+            first_condition = simplifier.conj(first_condition, conjunct)
+        second_condition = SymTrue
+        for conjunct in second_guard:
+            second_condition = simplifier.conj(second_condition, conjunct)
+        constraint = simplifier.conj(constraint, simplifier.disj(first_condition, second_condition))
+        context = merge_contexts(first.context, second.context, first_condition, changes, simplifier)
+        self.merges += 1
+        return PathState(context, constraint, first.id_provider.join(second.id_provider),
+                         depth=max(first.depth, second.depth))
+
+    def explore(self, context, id_provider=None):
+        """
+        Generator yielding a PathResult for every state as soon as it finishes
+        @type context: Context
+        @type id_provider: IdProvider
+        """
+        program = context.program
+        joins = self.join_points(program)
+        cache = QueryCache()
+        waiting = {context.pc: [PathState(context, SymTrue, id_provider or IdProvider())]}
+        pcs = [context.pc]
+        started = 1
+        while pcs:
+            pc = heapq.heappop(pcs)
+            states = waiting.pop(pc)
+            for state in self.merge_all(states):
+                interpreter = self.interpreter(state, cache)
+                state_context = state.context
+                exception = None
+                try:
+                    interpreter.run_segment(state_context, joins)
+                except Exception, e:
+                    exception = e
+                forks = interpreter.pending
+                if self.max_paths is not None:
+                    forks = forks[:max(self.max_paths - started, 0)]
+                started += len(forks)
+                for fork in forks:
+                    try:
+                        resumed = self.resume(fork, cache)
+                    except Exception, e:
+                        yield PathResult(fork.constraint, summarize(fork.context), e)
+                        continue
+                    for resumed_state in resumed:
+                        self.wait(waiting, pcs, resumed_state)
+                if exception is not None or state_context.current_instr() is None:
+                    yield PathResult(interpreter.constraints, summarize(state_context), exception)
+                else:
+                    self.wait(waiting, pcs, PathState(state_context, interpreter.constraints, state.id_provider,
+                                                      depth=interpreter.depth))
+
+    def resume(self, state, cache):
+        """
+        Sets the pc of a forked state to where it jumps
+        @type state: PathState
+        @return: list of the states to run, more than one when the jump goes to a merged value
+        """
+        if state.jump is None:
+            return [state]
+        interpreter = self.interpreter(state, cache)
+        context = state.context
+        target = interpreter.jump_target(interpreter.eval_expression(state.jump, context), context, False)
+        context.pc = as_int(target.value)
+        states = [PathState(context, interpreter.constraints, state.id_provider, depth=interpreter.depth)]
+        for fork in interpreter.pending:
+            states.extend(self.resume(fork, cache))
+        return states
+
+    def wait(self, waiting, pcs, state):
+        pc = state.context.pc
+        if pc not in waiting:
+            waiting[pc] = []
+            heapq.heappush(pcs, pc)
+        waiting[pc].append(state)
+
+    def merge_all(self, states):
+        """
+        @return: the states left after merging every state into the first one it can be merged with
+        """
+        if len(states) < 2:
+            return states
+        merged = []
+        for state in states:
+            for index, other in enumerate(merged):
+                result = self.merge(other, state)
+                if result is not None:
+                    merged[index] = result
+                    break
+            else:
+                merged.append(state)
+        return merged
@@ -0,0 +1,227 @@
+"""
+Persistent (structurally shared) maps used to fork execution states cheaply.
+"""
+from collections import MutableMapping
+
+_BITS = 5
+_WIDTH = 1 << _BITS
+_MASK = _WIDTH - 1
+_HASH_BITS = 64
+_HASH_MASK = (1 << _HASH_BITS) - 1
+
+
+class _Node(object):
+    """Inner node of the trie, holding up to 32 entries"""
+    __slots__ = ('owner', 'slots')
+
+    def __init__(self, owner, slots=None):
+        self.owner = owner
+        self.slots = slots if slots is not None else [None] * _WIDTH
+
+
+class _Bucket(object):
+    """Keys whose whole hashes collide"""
+    __slots__ = ('owner', 'hash', 'items')
+
+    def __init__(self, owner, hash_value, items):
+        self.owner = owner
+        self.hash = hash_value
+        self.items = items
+
+
+def _entry_hash(entry):
+    if entry.__class__ is tuple:
+        return entry[0]
+    return entry.hash
+
+
+class PersistentMap(MutableMapping):
+    """
+    A hash array mapped trie with ownership tokens.
+
+    fork() is O(1): both maps keep sharing every node and get a new owner token. A write copies only the nodes in
+    its path that are not owned by the map doing the write, so a map that has not been forked is updated in place
+    and a forked one only pays for the paths it actually changes. Deletes copy their path the same way.
+
+    It is a MutableMapping, so it offers the operations of a dict (pop, setdefault, clear, ==, ...); copy() is fork().
+    """
+
+    def __init__(self, items=None):
+        """
+        @type items: dict
+        """
+        self._root = None
+        self._size = 0
+        self.owner = object()
+        if items:
+            self.update(items)
+
+    def fork(self):
+        """
+        @rtype PersistentMap
+        """
+        other = PersistentMap()
+        other._root = self._root
+        other._size = self._size
+        self.owner = object()
+        return other
+
+    def get(self, key, default=None):
+        h = hash(key) & _HASH_MASK
+        entry = self._root
+        shift = 0
+        while entry is not None:
+            if entry.__class__ is _Node:
+                entry = entry.slots[(h >> shift) & _MASK]
+                shift += _BITS
+            elif entry.__class__ is tuple:
+                if entry[0] == h and entry[1] == key:
+                    return entry[2]
+                return default
+            else:
+                if entry.hash == h:
+                    for item_key, item_value in entry.items:
+                        if item_key == key:
+                            return item_value
+                return default
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __setitem__(self, key, value):
+        h = hash(key) & _HASH_MASK
+        owner = self.owner
+        node = self._root
+        if node is None:
+            node = self._root = _Node(owner)
+        elif node.owner is not owner:
+            node = self._root = _Node(owner, list(node.slots))
+        shift = 0
+        while True:
+            index = (h >> shift) & _MASK
+            entry = node.slots[index]
+            if entry is None:
+                node.slots[index] = (h, key, value)
+                self._size += 1
+                return
+            if entry.__class__ is _Node:
+                if entry.owner is not owner:
+                    entry = node.slots[index] = _Node(owner, list(entry.slots))
+                node = entry
+                shift += _BITS
+                continue
+            entry_hash = _entry_hash(entry)
+            if entry_hash != h:
+                # push the existing entry one level down and keep descending
+                shift += _BITS
+                child = _Node(owner)
+                child.slots[(entry_hash >> shift) & _MASK] = entry
+                node.slots[index] = child
+                node = child
+                continue
+            if entry.__class__ is tuple:
+                if entry[1] == key:
+                    node.slots[index] = (h, key, value)
+                else:
+                    node.slots[index] = _Bucket(owner, h, [(entry[1], entry[2]), (key, value)])
+                    self._size += 1
+                return
+            if entry.owner is not owner:
+                entry = node.slots[index] = _Bucket(owner, h, list(entry.items))
+            for position, (item_key, _) in enumerate(entry.items):
+                if item_key == key:
+                    entry.items[position] = (key, value)
+                    return
+            entry.items.append((key, value))
+            self._size += 1
+            return
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        h = hash(key) & _HASH_MASK
+        owner = self.owner
+        node = self._root
+        if node.owner is not owner:
+            node = self._root = _Node(owner, list(node.slots))
+        shift = 0
+        while True:
+            index = (h >> shift) & _MASK
+            entry = node.slots[index]
+            if entry.__class__ is _Node:
+                if entry.owner is not owner:
+                    entry = node.slots[index] = _Node(owner, list(entry.slots))
+                node = entry
+                shift += _BITS
+                continue
+            if entry.__class__ is tuple:
+                node.slots[index] = None
+            else:
+                items = [item for item in entry.items if item[0] != key]
+                if len(items) == 1:
+                    node.slots[index] = (h, items[0][0], items[0][1])
+                else:
+                    node.slots[index] = _Bucket(owner, h, items)
+            self._size -= 1
+            return
+
+    def clear(self):
+        self._root = None
+        self._size = 0
+
+    def copy(self):
+        return self.fork()
+
+    def has_key(self, key):
+        return key in self
+
+    def __len__(self):
+        return self._size
+
+    def iteritems(self):
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            entry = stack.pop()
+            if entry.__class__ is _Node:
+                stack.extend(slot for slot in entry.slots if slot is not None)
+            elif entry.__class__ is tuple:
+                yield entry[1], entry[2]
+            else:
+                for item in entry.items:
+                    yield item
+
+    def items(self):
+        return list(self.iteritems())
+
+    def keys(self):
+        return [key for key, _ in self.iteritems()]
+
+    def values(self):
+        return [value for _, value in self.iteritems()]
+
+    def __iter__(self):
+        for key, _ in self.iteritems():
+            yield key
+
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        for _, value in self.iteritems():
+            yield value
+
+    def __str__(self):
+        return "{%s}" % ", ".join("%s: %s" % (key, value) for key, value in self.iteritems())
+
+    def __repr__(self):
+        return "PersistentMap({%s})" % ", ".join("%r: %r" % item for item in self.iteritems())
+
+
+_MISSING = object()
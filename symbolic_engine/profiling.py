@@ -0,0 +1,131 @@
+"""
+Opt-in profiling of interpreter runs.
+
+Set interpreter.profile to a Profile and every run() adds to it: executions and time of every pc, time of every
+rule, evaluations of every expression kind, the pages the memory allocated and touched and, for concolic
+interpreters, the time and number of solver queries. Interpreters only check `self.profile is not None`, once per
+statement and expression like they do for their tracer, which is all profiling costs when it is off.
+
+A Profile can be printed as a report or saved in the pstats format, so the usual tools (pstats, snakeviz,
+gprof2dot...) can read it: rules appear as functions calling the statements they ran.
+"""
+import marshal
+import time
+from collections import defaultdict
+
+PROGRAM_FILE = '<program>'
+RULE_FILE = '<rule>'
+EXPRESSION_FILE = '<expression>'
+
+
+class Profile(object):
+    """Counters collected over one or more runs"""
+    timer = staticmethod(time.time)
+
+    def __init__(self):
+        self.runs = 0
+        self.pc_counts = defaultdict(int)
+        self.pc_time = defaultdict(float)
+        self.pc_rules = {}
+        self.pc_statements = {}
+        self.rule_counts = defaultdict(int)
+        self.rule_time = defaultdict(float)
+        self.expression_counts = defaultdict(int)
+        self.page_counters = defaultdict(int)
+        self.solver_queries = 0
+        self.solver_cache_hits = 0
+        self.solver_time = 0.0
+        self.__started = None
+
+    def start(self, interpreter, context):
+        """
+        Called by the interpreter when a run starts
+        @type interpreter: BaseInterpreter
+        @type context: Context
+        """
+        self.__started = (context.memory.get_page_counters(), self.solver_counters(interpreter))
+
+    def stop(self, interpreter, context):
+        """
+        Called by the interpreter when a run ends, even if it raised
+        """
+        pages, solver = self.__started
+        self.runs += 1
+        for name, count in context.memory.get_page_counters().iteritems():
+            self.page_counters[name] += count - pages.get(name, 0)
+        queries, cache_hits, solver_time = self.solver_counters(interpreter)
+        self.solver_queries += queries - solver[0]
+        self.solver_cache_hits += cache_hits - solver[1]
+        self.solver_time += solver_time - solver[2]
+
+    @staticmethod
+    def solver_counters(interpreter):
+        solver = getattr(interpreter, 'solver', None)
+        if solver is None:
+            return 0, 0, 0.0
+        return solver.queries, solver.cache_hits, solver.solver_time
+
+    def statement(self, pc, stmt, rule_name, elapsed):
+        """
+        Records one execution of a statement
+        @type pc: int
+        @type stmt: Instruction
+        @param rule_name: name of the rule that executed it
+        @param elapsed: seconds it took
+        """
+        self.pc_counts[pc] += 1
+        self.pc_time[pc] += elapsed
+        self.rule_counts[rule_name] += 1
+        self.rule_time[rule_name] += elapsed
+        if pc not in self.pc_rules:
+            self.pc_rules[pc] = rule_name
+            self.pc_statements[pc] = str(stmt)
+
+    def report(self, limit=20):
+        """
+        @param limit: number of pcs listed, the most expensive first
+        @rtype str
+        """
+        lines = ["%d runs, %d statements, %.6fs" % (self.runs, sum(self.pc_counts.values()),
+                                                   sum(self.pc_time.values())), "", "rule: count, seconds"]
+        for rule in sorted(self.rule_time, key=self.rule_time.get, reverse=True):
+            lines.append("  %s: %d, %.6f" % (rule, self.rule_counts[rule], self.rule_time[rule]))
+        lines += ["", "pc: count, seconds, statement"]
+        for pc in sorted(self.pc_time, key=self.pc_time.get, reverse=True)[:limit]:
+            lines.append("  %d: %d, %.6f, %s" % (pc, self.pc_counts[pc], self.pc_time[pc], self.pc_statements[pc]))
+        lines += ["", "expression: evaluations"]
+        for name in sorted(self.expression_counts, key=self.expression_counts.get, reverse=True):
+            lines.append("  %s: %d" % (name, self.expression_counts[name]))
+        lines += ["", "pages: %s" % ", ".join("%s %d" % item for item in sorted(self.page_counters.items())),
+                  "solver: %d queries, %d cache hits, %.6fs" % (self.solver_queries, self.solver_cache_hits,
+                                                                 self.solver_time)]
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.report()
+
+    def stats(self):
+        """
+        @return: the counters as the dict pstats.Stats loads: (file, line, function) to
+        (primitive calls, calls, own time, cumulative time, callers)
+        """
+        stats = {}
+        for rule, elapsed in self.rule_time.iteritems():
+            count = self.rule_counts[rule]
+            stats[(RULE_FILE, 0, rule)] = (count, count, 0.0, elapsed, {})
+        for pc, elapsed in self.pc_time.iteritems():
+            count = self.pc_counts[pc]
+            rule = (RULE_FILE, 0, self.pc_rules[pc])
+            stats[(PROGRAM_FILE, pc, self.pc_statements[pc])] = (count, count, elapsed, elapsed,
+                                                                 {rule: (count, count, elapsed, elapsed)})
+        for name, count in self.expression_counts.iteritems():
+            stats[(EXPRESSION_FILE, 0, name)] = (count, count, 0.0, 0.0, {})
+        return stats
+
+    def dump_stats(self, path):
+        """
+        Writes the profile in the pstats format, e.g. pstats.Stats(path).sort_stats('time').print_stats()
+        @type path: str
+        """
+        with open(path, 'wb') as stream:
+            marshal.dump(self.stats(), stream)
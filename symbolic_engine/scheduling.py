@@ -0,0 +1,246 @@
+"""
+Which pending state of an exploration runs next, and where the pending states are kept.
+
+A Scheduler orders pending PathStates: DFSScheduler and BFSScheduler follow the order of the forks,
+RandomPathScheduler picks a state with a probability that halves with every fork above it (the random path
+selection of KLEE, without keeping the tree), and CoverageScheduler prefers states resuming at the pcs executed
+the fewest times so far. Every scheduler can also give up its coldest states, the ones it would run last.
+
+A Frontier holds at most max_resident states in memory. When a push exceeds it, a batch of the coldest states is
+evicted: written to a file in the spill directory, or dropped when there is none. Spilled batches are loaded
+back, most recent first, when no state is left in memory.
+"""
+import cPickle
+import heapq
+import os
+import random
+import tempfile
+from collections import deque, defaultdict
+
+from symbolic_engine import Value, as_int
+
+
+class Scheduler(object):
+    def push(self, state):
+        """
+        @type state: PathState
+        """
+        raise NotImplementedError
+
+    def pop(self):
+        """
+        @return: the state to run next
+        @rtype PathState
+        """
+        raise NotImplementedError
+
+    def evict(self, count):
+        """
+        Removes the count states that would run last
+        @return: list of the states removed
+        """
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class DFSScheduler(Scheduler):
+    """Last forked, first run"""
+
+    def __init__(self):
+        self.states = []
+
+    def push(self, state):
+        self.states.append(state)
+
+    def pop(self):
+        return self.states.pop()
+
+    def evict(self, count):
+        evicted = self.states[:count]
+        del self.states[:count]
+        return evicted
+
+    def __len__(self):
+        return len(self.states)
+
+
+class BFSScheduler(Scheduler):
+    """First forked, first run"""
+
+    def __init__(self):
+        self.states = deque()
+
+    def push(self, state):
+        self.states.append(state)
+
+    def pop(self):
+        return self.states.popleft()
+
+    def evict(self, count):
+        return [self.states.pop() for _ in range(min(count, len(self.states)))]
+
+    def __len__(self):
+        return len(self.states)
+
+
+class RandomPathScheduler(Scheduler):
+    """
+    Picks a state of depth d with a probability proportional to 2 ** -d. States are kept in one bucket per depth,
+    so a pick costs a walk over the depths and a swap with the last state of a bucket.
+    """
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.buckets = defaultdict(list)
+        self.count = 0
+
+    def push(self, state):
+        self.buckets[state.depth].append(state)
+        self.count += 1
+
+    def take(self, depth, index):
+        bucket = self.buckets[depth]
+        bucket[index], bucket[-1] = bucket[-1], bucket[index]
+        state = bucket.pop()
+        if not bucket:
+            del self.buckets[depth]
+        self.count -= 1
+        return state
+
+    def pop(self):
+        lowest = min(self.buckets)
+        weights = [(depth, len(bucket) * 2.0 ** (lowest - depth)) for depth, bucket in self.buckets.iteritems()]
+        point = self.random.random() * sum(weight for _, weight in weights)
+        for depth, weight in weights:
+            if point < weight:
+                break
+            point -= weight
+        return self.take(depth, self.random.randrange(len(self.buckets[depth])))
+
+    def evict(self, count):
+        evicted = []
+        while len(evicted) < count and self.buckets:
+            deepest = max(self.buckets)
+            evicted.append(self.take(deepest, len(self.buckets[deepest]) - 1))
+        return evicted
+
+    def __len__(self):
+        return self.count
+
+
+class CoverageScheduler(Scheduler):
+    """
+    Runs first the state resuming at the pc with the lowest hit count, the oldest state first among equals.
+    Hit counts only grow, so priorities in the heap are refreshed lazily: a popped state whose pc was hit since it
+    was pushed goes back in with its new count.
+    """
+
+    def __init__(self, coverage=None):
+        """
+        @param coverage: dict of pc to the number of times it was executed, updated by the explorer
+        """
+        self.coverage = coverage if coverage is not None else defaultdict(int)
+        self.heap = []
+        self.sequence = 0
+
+    def pc(self, state):
+        """
+        @return: the pc the state resumes at, the pc of the IF that forked it when its jump is computed
+        """
+        if isinstance(state.jump, Value):
+            return as_int(state.jump.value)
+        return state.context.pc
+
+    def push(self, state):
+        heapq.heappush(self.heap, (self.coverage.get(self.pc(state), 0), self.sequence, state))
+        self.sequence += 1
+
+    def pop(self):
+        while True:
+            hits, sequence, state = heapq.heappop(self.heap)
+            current = self.coverage.get(self.pc(state), 0)
+            if current == hits or not self.heap:
+                return state
+            heapq.heappush(self.heap, (current, sequence, state))
+
+    def evict(self, count):
+        entries = sorted((self.coverage.get(self.pc(state), 0), sequence, state) for _, sequence, state in self.heap)
+        self.heap = entries[:max(len(entries) - count, 0)]
+        return [state for _, _, state in entries[len(self.heap):]]
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class Frontier(object):
+    """
+    Pending states of an exploration, at most max_resident of them in memory
+    """
+
+    def __init__(self, scheduler=None, max_resident=None, spill_directory=None, batch=None):
+        """
+        @type scheduler: Scheduler
+        @param max_resident: states kept in memory, None for no limit
+        @param spill_directory: where evicted states are written, None to drop them
+        @param batch: states evicted at once, a quarter of max_resident by default
+        """
+        self.scheduler = scheduler if scheduler is not None else DFSScheduler()
+        self.max_resident = max_resident
+        self.spill_directory = spill_directory
+        self.batch = batch or (max(max_resident / 4, 1) if max_resident else 1)
+        self.spilled = []
+        self.spilled_states = 0
+        self.dropped = 0
+        self.program = None
+
+    def __len__(self):
+        return len(self.scheduler) + self.spilled_states
+
+    def push(self, state):
+        """
+        @type state: PathState
+        """
+        if self.program is None:
+            self.program = state.context.program
+        self.scheduler.push(state)
+        if self.max_resident is not None and len(self.scheduler) > self.max_resident:
+            self.spill(self.scheduler.evict(self.batch))
+
+    def pop(self):
+        """
+        @rtype PathState
+        """
+        if not len(self.scheduler) and self.spilled:
+            self.reload()
+        return self.scheduler.pop()
+
+    def spill(self, states):
+        if self.spill_directory is None:
+            self.dropped += len(states)
+            return
+        for state in states:
+            state.context.program = None
+        handle, path = tempfile.mkstemp(prefix='frontier-', suffix='.pickle', dir=self.spill_directory)
+        with os.fdopen(handle, 'wb') as stream:
+            cPickle.dump(states, stream, cPickle.HIGHEST_PROTOCOL)
+        self.spilled.append((path, len(states)))
+        self.spilled_states += len(states)
+
+    def reload(self):
+        path, count = self.spilled.pop()
+        with open(path, 'rb') as stream:
+            states = cPickle.load(stream)
+        os.remove(path)
+        self.spilled_states -= count
+        for state in states:
+            state.context.program = self.program
+            self.scheduler.push(state)
+
+    def close(self):
+        """Removes the spilled states that were never loaded back"""
+        for path, _ in self.spilled:
+            os.remove(path)
+        self.spilled = []
+        self.spilled_states = 0
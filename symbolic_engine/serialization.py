@@ -0,0 +1,365 @@
+"""
+Compact binary encoding of Programs, a lazy loader and an on-disk cache.
+
+A program is encoded as a flat table of fixed size node records (an opcode and up to three operands, which are
+indexes of other nodes, of the string table or of the input sources) followed by the node index of every
+statement. Numbers, in Value records and input sources, are kept as 64 bits with the width of their BitVector class
+(0 for plain ints), so every BitVector up to BitVec64 and every int that fits in 64 signed bits loads back as it
+was. Children are always written before their parents and shared nodes are written once, so a GetInput
+used twice still shares its source list after loading.
+
+A Value record keeps its taint in its last operand: the flag TAINTED stands for plain True, a label mask (see
+symbolic_engine.labels) is the operand itself, or the index in the string table of its hex digits when it doesn't fit
+in 32 bits.
+
+load() maps the file and decodes a statement, with the nodes below it, only the first time it is fetched.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+
+from symbolic_engine import (Program, Assign, Store, Goto, IF, Value, Var, GetInput, Load, BitVector, AddOp, SubOp,
+                             MulOp, EQ, GT, bitvector_class)
+
+MAGIC = 'SEPG'
+VERSION = 3
+HEADER = struct.Struct('<4sHIIII')
+RECORD = struct.Struct('<BxHqII')
+WORD = struct.Struct('<I')
+ELEMENT = struct.Struct('<qH')
+
+VALUE, VAR, GET_INPUT, LOAD, ASSIGN, STORE, GOTO, IF_STMT = range(8)
+BINOP_CLASSES = [AddOp, SubOp, MulOp, EQ, GT]
+BINOP_BASE = 16
+OPCODES = dict((cls, BINOP_BASE + index) for index, cls in enumerate(BINOP_CLASSES))
+OPCODES.update({Value: VALUE, Var: VAR, GetInput: GET_INPUT, Load: LOAD, Assign: ASSIGN, Store: STORE, Goto: GOTO,
+                IF: IF_STMT})
+
+TAINTED = 1
+LABELLED = 2
+WIDE_LABELS = 4
+
+
+def pack_number(number):
+    """
+    @param number: int or BitVector
+    @return: (width, signed 64 bit field) of the number
+    """
+    if isinstance(number, BitVector):
+        if number.WIDTH > 64:
+            raise Exception("can't encode a %d bit word" % number.WIDTH)
+        raw = number.value
+        return number.WIDTH, raw - 2 ** 64 if raw >= 2 ** 63 else raw
+    if not -2 ** 63 <= number < 2 ** 63:
+        raise Exception("can't encode %d in 64 bits" % number)
+    return 0, number
+
+
+def unpack_number(width, field):
+    """
+    @return: the number packed by pack_number
+    """
+    if not width:
+        return field
+    return bitvector_class(width)(field & (2 ** 64 - 1))
+
+
+class ProgramEncoder(object):
+    """Builds the tables of one program"""
+
+    def __init__(self):
+        self.records = []
+        self.strings = []
+        self.string_index = {}
+        self.sources = []
+        self.source_index = {}
+        self.node_index = {}
+
+    def string(self, text):
+        index = self.string_index.get(text)
+        if index is None:
+            index = self.string_index[text] = len(self.strings)
+            self.strings.append(text)
+        return index
+
+    def source(self, source):
+        index = self.source_index.get(id(source))
+        if index is None:
+            index = self.source_index[id(source)] = len(self.sources)
+            self.sources.append(source)
+        return index
+
+    def children(self, node):
+        cls = node.__class__
+        if cls in (Value, Var, GetInput):
+            return ()
+        if cls is Load:
+            return node.address,
+        if cls is Assign:
+            return node.expression,
+        if cls is Store:
+            return node.address, node.value
+        if cls is Goto:
+            return node.pc,
+        if cls is IF:
+            return node.e, node.e1, node.e2
+        if cls in OPCODES:
+            return node.left, node.right
+        raise Exception("can't encode %s" % cls.__name__)
+
+    def node(self, root):
+        """
+        Adds a node and everything below it, children first
+        @return: index of the node
+        """
+        pending = [(root, False)]
+        while pending:
+            node, expanded = pending.pop()
+            if id(node) in self.node_index:
+                continue
+            children = self.children(node)
+            if not expanded:
+                pending.append((node, True))
+                pending.extend((child, False) for child in reversed(children))
+                continue
+            self.node_index[id(node)] = len(self.records)
+            self.records.append(self.record(node, [self.node_index[id(child)] for child in children]))
+        return self.node_index[id(root)]
+
+    def record(self, node, children):
+        cls = node.__class__
+        if cls is Value:
+            flags, taint = self.taint(node.tainted)
+            width, value = pack_number(node.value)
+            return OPCODES[cls], width, value, flags, taint
+        if cls is Var:
+            return VAR, 0, self.string(node.var_name), 0, 0
+        if cls is GetInput:
+            return GET_INPUT, 0, self.string(node.input_name), self.source(node.source), 0
+        if cls is Assign:
+            return ASSIGN, 0, self.string(node.var_name), children[0], 0
+        return tuple([OPCODES[cls], 0] + children + [0] * (3 - len(children)))
+
+    def taint(self, tainted):
+        """
+        @return: the flags and the operand encoding the taint of a Value
+        """
+        if not tainted:
+            return 0, 0
+        if tainted is True:
+            return TAINTED, 0
+        if tainted < 2 ** 32:
+            return LABELLED, tainted
+        return WIDE_LABELS, self.string('%x' % tainted)
+
+    def encode(self, program):
+        """
+        @type program: Program
+        @rtype str
+        """
+        statements = [self.node(stmt) for stmt in program.stmts]
+        chunks = [HEADER.pack(MAGIC, VERSION, len(self.strings), len(self.sources), len(self.records),
+                              len(statements))]
+        for text in self.strings:
+            data = text.encode('utf-8') if isinstance(text, unicode) else text
+            chunks.append(WORD.pack(len(data)))
+            chunks.append(data)
+        for source in self.sources:
+            chunks.append(WORD.pack(len(source)))
+            for element in source:
+                width, value = pack_number(element)
+                chunks.append(ELEMENT.pack(value, width))
+        chunks.extend(RECORD.pack(*record) for record in self.records)
+        chunks.extend(WORD.pack(index) for index in statements)
+        return ''.join(chunks)
+
+
+def dumps(program):
+    """
+    @type program: Program
+    @rtype str
+    """
+    return ProgramEncoder().encode(program)
+
+
+def dump(program, path):
+    """
+    Writes the encoding of a program to a file, atomically
+    @type program: Program
+    @type path: str
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(handle, 'wb') as stream:
+            stream.write(dumps(program))
+        os.rename(temporary, path)
+    except:
+        os.remove(temporary)
+        raise
+
+
+class ProgramImage(object):
+    """
+    Decoder over an encoded program held in any buffer (a string or an mmap). Nodes are decoded on demand and
+    memoized, so a node shared in the original program is shared in the decoded one.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        magic, version, strings, sources, nodes, statements = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise Exception("not an encoded program")
+        offset = HEADER.size
+        self.strings = []
+        for _ in xrange(strings):
+            length, = WORD.unpack_from(data, offset)
+            offset += WORD.size
+            self.strings.append(data[offset:offset + length])
+            offset += length
+        self.source_offsets = []
+        for _ in xrange(sources):
+            length, = WORD.unpack_from(data, offset)
+            self.source_offsets.append((offset + WORD.size, length))
+            offset += WORD.size + length * ELEMENT.size
+        self.sources = [None] * sources
+        self.node_offset = offset
+        self.statement_offset = offset + nodes * RECORD.size
+        self.statement_count = statements
+        self.nodes = [None] * nodes
+
+    def source(self, index):
+        source = self.sources[index]
+        if source is None:
+            offset, length = self.source_offsets[index]
+            source = self.sources[index] = []
+            for position in xrange(offset, offset + length * ELEMENT.size, ELEMENT.size):
+                value, width = ELEMENT.unpack_from(self.data, position)
+                source.append(unpack_number(width, value))
+        return source
+
+    def node(self, index):
+        node = self.nodes[index]
+        if node is None:
+            record = RECORD.unpack_from(self.data, self.node_offset + index * RECORD.size)
+            node = self.nodes[index] = self.decode(*record)
+        return node
+
+    def decode(self, opcode, width, a, b, c):
+        if opcode >= BINOP_BASE:
+            return BINOP_CLASSES[opcode - BINOP_BASE](self.node(a), self.node(b))
+        if opcode == VALUE:
+            return Value(unpack_number(width, a), self.taint(b, c))
+        if opcode == VAR:
+            return Var(self.strings[a])
+        if opcode == GET_INPUT:
+            return GetInput(self.source(b), self.strings[a])
+        if opcode == LOAD:
+            return Load(self.node(a))
+        if opcode == ASSIGN:
+            return Assign(self.strings[a], self.node(b))
+        if opcode == STORE:
+            return Store(self.node(a), self.node(b))
+        if opcode == GOTO:
+            return Goto(self.node(a))
+        if opcode == IF_STMT:
+            return IF(self.node(a), self.node(b), self.node(c))
+        raise Exception("unknown opcode %d" % opcode)
+
+    def taint(self, flags, operand):
+        """
+        @return: the taint of a Value record, see ProgramEncoder.taint
+        """
+        if flags & TAINTED:
+            return True
+        if flags & LABELLED:
+            return operand
+        if flags & WIDE_LABELS:
+            return int(self.strings[operand], 16)
+        return False
+
+    def statement(self, pc):
+        if not 0 <= pc < self.statement_count:
+            raise IndexError(pc)
+        index, = WORD.unpack_from(self.data, self.statement_offset + pc * WORD.size)
+        return self.node(index)
+
+
+class LazyStatements(object):
+    """Read only sequence of the statements of a ProgramImage"""
+
+    def __init__(self, image):
+        """
+        @type image: ProgramImage
+        """
+        self.image = image
+
+    def __len__(self):
+        return self.image.statement_count
+
+    def __getitem__(self, pc):
+        if pc < 0:
+            pc += len(self)
+        return self.image.statement(pc)
+
+    def __iter__(self):
+        for pc in xrange(len(self)):
+            yield self.image.statement(pc)
+
+
+def loads(data):
+    """
+    @type data: str
+    @rtype Program
+    """
+    return Program(LazyStatements(ProgramImage(data)))
+
+
+def load(path):
+    """
+    Maps an encoded program; statements are decoded when first fetched
+    @type path: str
+    @rtype Program
+    """
+    with open(path, 'rb') as stream:
+        data = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    return Program(LazyStatements(ProgramImage(data)))
+
+
+class ProgramCache(object):
+    """
+    Directory of encoded programs keyed by a hash of whatever they were built from
+    """
+
+    def __init__(self, directory):
+        """
+        @type directory: str
+        """
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, content):
+        """
+        @param content: the data the program is built from, e.g. the text of the input file
+        @type content: str
+        """
+        return hashlib.sha1('%s:%d:%s' % (MAGIC, VERSION, content)).hexdigest()
+
+    def path(self, content):
+        return os.path.join(self.directory, self.key(content) + '.prog')
+
+    def get(self, content, build):
+        """
+        @param content: see key
+        @param build: callable returning the Program, called only when the cache has no program for content
+        @rtype Program
+        """
+        path = self.path(content)
+        if os.path.exists(path):
+            return load(path)
+        program = build()
+        dump(program, path)
+        return program
@@ -0,0 +1,92 @@
+"""
+Constraint independence: splitting a path constraint into groups of conjuncts that share no symbolic inputs.
+Each group can be solved on its own, and only the group a new branch condition touches needs to go to a solver.
+"""
+import weakref
+
+from symbolic_engine import SymInput, BinOp, And, Or, Not, Ite
+
+_inputs_cache = weakref.WeakKeyDictionary()
+
+
+def inputs_of(node):
+    """
+    @return: frozenset with the names of the symbolic inputs a node depends on
+    """
+    try:
+        return _inputs_cache[node]
+    except (KeyError, TypeError):
+        pass
+    if isinstance(node, SymInput):
+        names = frozenset([node.name])
+    elif isinstance(node, (BinOp, And, Or)):
+        names = inputs_of(node.left) | inputs_of(node.right)
+    elif isinstance(node, Not):
+        names = inputs_of(node.expression)
+    elif isinstance(node, Ite):
+        names = inputs_of(node.cond) | inputs_of(node.then) | inputs_of(node.otherwise)
+    else:
+        names = frozenset()
+    try:
+        _inputs_cache[node] = names
+    except TypeError:
+        pass
+    return names
+
+
+class UnionFind(object):
+    """Disjoint sets of input names, with path halving and union by size"""
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, name):
+        parent = self.parent
+        if name not in parent:
+            parent[name] = name
+            self.size[name] = 1
+            return name
+        while parent[name] != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    def union(self, first, second):
+        first = self.find(first)
+        second = self.find(second)
+        if first == second:
+            return first
+        if self.size[first] < self.size[second]:
+            first, second = second, first
+        self.parent[second] = first
+        self.size[first] += self.size[second]
+        return first
+
+
+def independent_groups(constraints):
+    """
+    Partitions conjuncts by the inputs they (transitively) share.
+    Ground conjuncts end up in a group of their own each.
+    @type constraints: list
+    @return: list of frozensets of conjuncts
+    """
+    sets = UnionFind()
+    for constraint in constraints:
+        names = iter(inputs_of(constraint))
+        first = next(names, None)
+        if first is None:
+            continue
+        sets.find(first)
+        for name in names:
+            sets.union(first, name)
+    groups = {}
+    ground = []
+    for constraint in constraints:
+        names = inputs_of(constraint)
+        if not names:
+            ground.append(frozenset([constraint]))
+            continue
+        groups.setdefault(sets.find(next(iter(names))), set()).add(constraint)
+    return ground + [frozenset(group) for group in groups.values()]
+
@@ -0,0 +1,527 @@
+"""
+Constraint solving for path constraints.
+
+Solver is what the interpreters talk to: it keeps a stack of assertions with push/pop, answers queries from a
+KLEE style counterexample cache when it can, and otherwise delegates to a backend. Z3Backend is used when z3 is
+installed; PythonBackend is a pure python fallback that looks for models by local search and only proves
+unsatisfiability in trivial cases (false ground constraints, x together with NOT x, x == a together with x == b).
+"""
+import os
+import random
+import time
+import weakref
+from collections import deque
+
+from symbolic_engine import (Value, SymInput, BinOp, AddOp, SubOp, MulOp, EQ, GT, And, Or, Not, Ite, SymTrue,
+                             SymFalse, WORD_MASK, as_int, symbols)
+from symbolic_engine.slicing import inputs_of, independent_groups
+
+try:
+    import z3
+except ImportError:
+    z3 = None
+else:
+    if os.environ.get('Z3_LIBRARY'):
+        z3.init(os.environ['Z3_LIBRARY'])
+
+SAT = 'sat'
+UNSAT = 'unsat'
+UNKNOWN = 'unknown'
+
+
+def conjuncts(constraint):
+    """
+    Splits a constraint into the list of its conjuncts
+    """
+    result = []
+    pending = [constraint]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, And):
+            pending.append(node.left)
+            pending.append(node.right)
+        elif node is not SymTrue:
+            result.append(node)
+    result.reverse()
+    return result
+
+
+def evaluate(node, model, memo=None):
+    """
+    Concrete value of a symbolic node, unassigned inputs are 0
+    @param model: dict from input name to int
+    @rtype int
+    """
+    if memo is None:
+        memo = {}
+    key = id(node)
+    if key in memo:
+        return memo[key]
+    if isinstance(node, Value):
+        result = as_int(node.value)
+    elif isinstance(node, SymInput):
+        result = model.get(node.name, 0)
+    elif isinstance(node, BinOp):
+        result = node.OPERATION(evaluate(node.left, model, memo), evaluate(node.right, model, memo)) & WORD_MASK
+    elif isinstance(node, And):
+        result = 1 if evaluate(node.left, model, memo) and evaluate(node.right, model, memo) else 0
+    elif isinstance(node, Or):
+        result = 1 if evaluate(node.left, model, memo) or evaluate(node.right, model, memo) else 0
+    elif isinstance(node, Not):
+        result = 0 if evaluate(node.expression, model, memo) else 1
+    elif isinstance(node, Ite):
+        branch = node.then if evaluate(node.cond, model, memo) else node.otherwise
+        result = evaluate(branch, model, memo)
+    elif node is SymTrue:
+        result = 1
+    elif node is SymFalse:
+        result = 0
+    else:
+        raise Exception("Can't evaluate %s" % node)
+    memo[key] = result
+    return result
+
+
+def satisfies(model, constraints):
+    memo = {}
+    for constraint in constraints:
+        if not evaluate(constraint, model, memo):
+            return False
+    return True
+
+
+class QueryCache(object):
+    """
+    Counterexample cache: exact results, known unsatisfiable subsets and recent models that may satisfy new queries
+    """
+
+    def __init__(self, max_models=16, max_cores=256):
+        self.results = {}
+        self.unsat_cores = deque(maxlen=max_cores)
+        self.models = deque(maxlen=max_models)
+
+    def lookup(self, query):
+        """
+        @type query: frozenset
+        @return: (status, model) or None
+        """
+        result = self.results.get(query)
+        if result is not None:
+            return result
+        for core in self.unsat_cores:
+            if core <= query:
+                return UNSAT, None
+        for model in self.models:
+            if satisfies(model, query):
+                return SAT, model
+        return None
+
+    def store(self, query, status, model):
+        if status == UNKNOWN:
+            return
+        self.results[query] = (status, model)
+        if status == UNSAT:
+            self.unsat_cores.append(query)
+        else:
+            self.models.appendleft(model)
+
+
+class Backend(object):
+    def push(self):
+        raise NotImplementedError
+
+    def pop(self):
+        raise NotImplementedError
+
+    def add(self, constraint):
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+    def check(self):
+        """
+        @return: (status, model), model is a dict from input name to int or None
+        """
+        raise NotImplementedError
+
+
+class Z3Translator(object):
+    """
+    Translates symbolic nodes to z3 terms, caching the translation of every node
+    """
+
+    def __init__(self, width=32):
+        self.width = width
+        self.words = weakref.WeakKeyDictionary()
+        self.booleans = weakref.WeakKeyDictionary()
+
+    def word(self, node):
+        term = self.words.get(node)
+        if term is None:
+            term = self.words[node] = self._word(node)
+        return term
+
+    def _word(self, node):
+        if isinstance(node, Value):
+            return z3.BitVecVal(as_int(node.value), self.width)
+        if isinstance(node, SymInput):
+            return z3.BitVec(node.name, self.width)
+        if isinstance(node, AddOp):
+            return self.word(node.left) + self.word(node.right)
+        if isinstance(node, SubOp):
+            return self.word(node.left) - self.word(node.right)
+        if isinstance(node, MulOp):
+            return self.word(node.left) * self.word(node.right)
+        if isinstance(node, Ite):
+            return z3.If(self.boolean(node.cond), self.word(node.then), self.word(node.otherwise))
+        return z3.If(self.boolean(node), z3.BitVecVal(1, self.width), z3.BitVecVal(0, self.width))
+
+    def boolean(self, node):
+        if node is SymTrue:
+            return z3.BoolVal(True)
+        if node is SymFalse:
+            return z3.BoolVal(False)
+        term = self.booleans.get(node)
+        if term is None:
+            term = self.booleans[node] = self._boolean(node)
+        return term
+
+    def _boolean(self, node):
+        if isinstance(node, EQ):
+            return self.word(node.left) == self.word(node.right)
+        if isinstance(node, GT):
+            return z3.UGT(self.word(node.left), self.word(node.right))
+        if isinstance(node, And):
+            return z3.And(self.boolean(node.left), self.boolean(node.right))
+        if isinstance(node, Or):
+            return z3.Or(self.boolean(node.left), self.boolean(node.right))
+        if isinstance(node, Not):
+            return z3.Not(self.boolean(node.expression))
+        return self.word(node) != z3.BitVecVal(0, self.width)
+
+
+class Z3Backend(Backend):
+    def __init__(self):
+        if z3 is None:
+            raise Exception("z3 is not available")
+        self.solver = z3.Solver()
+        self.translator = Z3Translator()
+
+    def push(self):
+        self.solver.push()
+
+    def pop(self):
+        self.solver.pop()
+
+    def add(self, constraint):
+        self.solver.add(self.translator.boolean(constraint))
+
+    def reset(self):
+        self.solver.reset()
+
+    def check(self):
+        result = self.solver.check()
+        if result == z3.sat:
+            model = self.solver.model()
+            return SAT, dict((str(declaration), model[declaration].as_long()) for declaration in model.decls())
+        if result == z3.unsat:
+            return UNSAT, None
+        return UNKNOWN, None
+
+
+def _inverse(value, bits):
+    """
+    Inverse of an odd value modulo 2 ** bits
+    """
+    modulus = 1 << bits
+    inverse = value
+    for _ in range(5):
+        inverse = (inverse * (2 - value * inverse)) % modulus
+    return inverse
+
+
+class PythonBackend(Backend):
+    """
+    Pure python fallback. Looks for a model by local search, solving single constraints for one input at a time
+    by inverting the arithmetic. Answers UNKNOWN when it gives up.
+    """
+
+    def __init__(self, max_rounds=64, seed=0):
+        self.frames = [[]]
+        self.max_rounds = max_rounds
+        self.random = random.Random(seed)
+
+    def push(self):
+        self.frames.append([])
+
+    def pop(self):
+        self.frames.pop()
+
+    def add(self, constraint):
+        self.frames[-1].extend(conjuncts(constraint))
+
+    def reset(self):
+        self.frames = [[]]
+
+    def check(self):
+        constraints = [constraint for frame in self.frames for constraint in frame]
+        if self.refuted(constraints):
+            return UNSAT, None
+        model = {}
+        for _ in range(self.max_rounds):
+            memo = {}
+            violated = [constraint for constraint in constraints if not evaluate(constraint, model, memo)]
+            if not violated:
+                return SAT, model
+            model = self.repair(self.random.choice(violated), constraints, model)
+        return UNKNOWN, None
+
+    def refuted(self, constraints):
+        """
+        Cheap unsatisfiability checks: false ground constraints, a constraint together with its negation and
+        terms required to be equal to two different constants
+        """
+        present = set(constraints)
+        fixed = {}
+        for constraint in constraints:
+            if not inputs_of(constraint) and not evaluate(constraint, {}):
+                return True
+            if isinstance(constraint, Not) and constraint.expression in present:
+                return True
+            if isinstance(constraint, EQ):
+                for term, other in ((constraint.left, constraint.right), (constraint.right, constraint.left)):
+                    if isinstance(other, Value) and inputs_of(term):
+                        value = as_int(other.value)
+                        if fixed.setdefault(term, value) != value:
+                            return True
+        for constraint in constraints:
+            if isinstance(constraint, Not) and isinstance(constraint.expression, EQ):
+                equality = constraint.expression
+                for term, other in ((equality.left, equality.right), (equality.right, equality.left)):
+                    if isinstance(other, Value) and fixed.get(term, -1) == as_int(other.value):
+                        return True
+        return False
+
+    def repair(self, constraint, constraints, model):
+        """
+        @return: the candidate model that satisfies the most constraints after changing one input of constraint
+        """
+        best, best_score = model, -1
+        for name in sorted(inputs_of(constraint)):
+            for value in self.candidates(constraint, name, model):
+                candidate = dict(model)
+                candidate[name] = value
+                memo = {}
+                score = sum(1 for c in constraints if evaluate(c, candidate, memo))
+                if evaluate(constraint, candidate, memo):
+                    score += len(constraints)
+                if score > best_score:
+                    best, best_score = candidate, score
+        return best
+
+    def candidates(self, constraint, name, model):
+        values = []
+        target = self.solve(constraint, name, model)
+        if target is not None:
+            values.append(target)
+        current = model.get(name, 0)
+        values.extend([(current + 1) & WORD_MASK, (current - 1) & WORD_MASK, 0, 1, WORD_MASK,
+                       self.random.randint(0, WORD_MASK)])
+        return values
+
+    def solve(self, constraint, name, model):
+        """
+        Value of the input that makes the constraint true, if inverting it is straightforward
+        """
+        negated = isinstance(constraint, Not)
+        node = constraint.expression if negated else constraint
+        if isinstance(node, (EQ, GT)):
+            left_has = name in inputs_of(node.left)
+            right_has = name in inputs_of(node.right)
+            if left_has == right_has:
+                return None
+            left = None if left_has else evaluate(node.left, model)
+            right = None if right_has else evaluate(node.right, model)
+            if isinstance(node, EQ):
+                target = (right + 1 if negated else right) if left_has else (left + 1 if negated else left)
+            elif left_has:
+                # left > right, or left <= right when negated
+                if negated:
+                    target = right
+                elif right == WORD_MASK:
+                    return None
+                else:
+                    target = right + 1
+            else:
+                if negated:
+                    target = left
+                elif left == 0:
+                    return None
+                else:
+                    target = left - 1
+            return self.invert(node.left if left_has else node.right, name, target & WORD_MASK, model)
+        if negated:
+            return self.invert(node, name, 0, model)
+        return self.invert(node, name, 1, model)
+
+    def invert(self, node, name, target, model):
+        """
+        Value of the input for which node evaluates to target
+        """
+        while not isinstance(node, SymInput):
+            if not isinstance(node, (AddOp, SubOp, MulOp)):
+                return None
+            left_has = name in inputs_of(node.left)
+            if left_has == (name in inputs_of(node.right)):
+                return None
+            other = evaluate(node.right if left_has else node.left, model)
+            if isinstance(node, AddOp):
+                target = target - other
+            elif isinstance(node, SubOp):
+                target = target + other if left_has else other - target
+            else:
+                if other == 0:
+                    return None
+                shift = 0
+                while not (other >> shift) & 1:
+                    shift += 1
+                if target & ((1 << shift) - 1):
+                    return None
+                bits = 32 - shift
+                target = ((target >> shift) * _inverse(other >> shift, bits)) % (1 << bits)
+            target &= WORD_MASK
+            node = node.left if left_has else node.right
+        return target
+
+
+def default_backend():
+    if z3 is not None:
+        return Z3Backend()
+    return PythonBackend()
+
+
+class Solver(object):
+    """
+    Solver with a query cache in front of a backend.
+
+    With slicing (the default) a query is split into groups of conjuncts that share no inputs: each group is looked
+    up in the cache on its own, so groups that did not change since an earlier query are never solved again, and
+    only the groups that are not cached are sent to the backend, each in a scratch frame. Without slicing the
+    backend mirrors the assertion stack and solves the whole path constraint incrementally, which suits callers
+    asking many queries that share a growing prefix (see generational.GenerationalSearch).
+    """
+
+    def __init__(self, backend=None, cache=None, factory=None, slicing=True):
+        """
+        @type backend: Backend
+        @type cache: QueryCache
+        @type factory: SymbolFactory
+        @type slicing: bool
+        """
+        self.backend = backend if backend is not None else default_backend()
+        self.cache = cache if cache is not None else QueryCache()
+        self.factory = factory if factory is not None else symbols
+        self.slicing = slicing
+        self.frames = [[]]
+        self.last_model = None
+        self.queries = 0
+        self.cache_hits = 0
+        self.solver_time = 0.0
+
+    def push(self):
+        self.frames.append([])
+        if not self.slicing:
+            self.backend.push()
+
+    def pop(self):
+        self.frames.pop()
+        if not self.slicing:
+            self.backend.pop()
+
+    def reset(self):
+        self.frames = [[]]
+        if not self.slicing:
+            self.backend.reset()
+
+    def add(self, constraint):
+        constraint = self.factory.intern(constraint)
+        self.frames[-1].extend(conjuncts(constraint))
+        if not self.slicing:
+            self.backend.add(constraint)
+
+    def assertions(self):
+        return [constraint for frame in self.frames for constraint in frame]
+
+    def check(self, focus=None):
+        """
+        @param focus: when given, only the conjuncts that share inputs with it are checked, the rest of the
+        assertions are assumed to be satisfiable (e.g. the path constraint before a branch)
+        @return: SAT, UNSAT or UNKNOWN
+        """
+        self.queries += 1
+        assertions = self.assertions()
+        if not self.slicing:
+            status, self.last_model = self.solve(frozenset(assertions), self.backend.check)
+            return status
+        groups = independent_groups(assertions)
+        if focus is not None:
+            names = inputs_of(focus)
+            focus_conjuncts = set(conjuncts(self.factory.intern(focus)))
+            groups = [group for group in groups if group & focus_conjuncts or
+                      any(inputs_of(constraint) & names for constraint in group)]
+        status = SAT
+        model = {}
+        for group in groups:
+            group_status, group_model = self.solve(group, lambda: self.solve_group(group))
+            if group_status == UNSAT:
+                self.last_model = None
+                return UNSAT
+            if group_status == UNKNOWN:
+                status = UNKNOWN
+            else:
+                model.update(group_model)
+        self.last_model = model if status == SAT else None
+        return status
+
+    def solve(self, query, backend_check):
+        """
+        @type query: frozenset
+        @return: (status, model), from the cache when possible
+        """
+        result = self.cache.lookup(query)
+        if result is not None:
+            self.cache_hits += 1
+            return result
+        start = time.time()
+        result = backend_check()
+        self.solver_time += time.time() - start
+        self.cache.store(query, *result)
+        return result
+
+    def solve_group(self, group):
+        self.backend.push()
+        try:
+            for constraint in group:
+                self.backend.add(constraint)
+            return self.backend.check()
+        finally:
+            self.backend.pop()
+
+    def model(self):
+        """
+        @return: dict from input name to int for the last satisfiable check, restricted to the inputs of the
+        checked groups
+        """
+        return self.last_model
+
+    def may_be_true(self, constraint):
+        """
+        @return: False only if the constraint is known to be unsatisfiable with the current assertions
+        """
+        self.push()
+        try:
+            self.add(constraint)
+            return self.check(constraint) != UNSAT
+        finally:
+            self.pop()
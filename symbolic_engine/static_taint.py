@@ -0,0 +1,314 @@
+"""
+Static taint pre-analysis: which statements provably never see tainted data.
+
+A forward dataflow pass over the statements of a Program, starting from the taint of the context the program is
+run in. Its state is the set of variables that may be tainted, whether any memory cell may hold a tainted (or
+symbolic) value and whether the taint shadow of any address may be set; memory is summarized conservatively, so
+one tainted store makes every Load tainted from then on. GetInput is always assumed tainted, and a computed jump
+may reach any statement.
+
+A Store is clean when its address and value are untainted and no address shadow can be set yet, so skipping the
+shadow write changes nothing; a Goto is clean when its target is untainted. Interpreters whose taint policy has
+static_taint set run clean statements without calling the policy, see StaticTaintExecution.
+
+The analysis costs about as much as running every statement once, which is all a run of a program without loops
+does, so it is only computed once it can pay off: on the first run of a program whose control flow graph has a
+cycle, on the second run of any other, and never for a program without a Store or a Goto to run clean.
+"""
+import heapq
+import weakref
+
+from symbolic_engine import BaseInterpreter, Interpreter, Value, BINOPS
+from symbolic_engine.cfg import BlockExecution, BasicBlock, control_flow_graph
+
+_analyses = weakref.WeakKeyDictionary()
+_accesses = weakref.WeakKeyDictionary()
+_runs = weakref.WeakKeyDictionary()
+
+# the expressions of every kind of statement
+FIELDS = {'Assign': ('expression',), 'Store': ('address', 'value'), 'Goto': ('pc',), 'IF': ('e', 'e1', 'e2')}
+
+
+class TaintState(object):
+    """What may be tainted before a statement"""
+
+    def __init__(self, variables=frozenset(), memory=False, shadow=False):
+        """
+        @param variables: frozenset of the names of the variables that may be tainted
+        @param memory: whether some memory cell may hold a tainted value
+        @param shadow: whether the shadow of some address may be set
+        """
+        self.variables = variables
+        self.memory = memory
+        self.shadow = shadow
+
+    def key(self):
+        return self.variables, self.memory, self.shadow
+
+    def join(self, other):
+        """
+        @rtype TaintState
+        """
+        if other is None:
+            return self
+        return TaintState(self.variables | other.variables, self.memory or other.memory, self.shadow or other.shadow)
+
+    def __eq__(self, other):
+        return isinstance(other, TaintState) and self.key() == other.key()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key())
+
+    @staticmethod
+    def of_context(context, memory=True, shadow=True):
+        """
+        The state a run starts from: variables holding anything but an untainted Value, and the taint in memory
+        @type context: Context
+        @param memory: whether to look for tainted values in memory, False when the program never loads
+        @param shadow: whether to look for a set address shadow, False when the program never stores
+        @rtype TaintState
+        """
+        variables = frozenset(name for name, value in context.variables.iteritems()
+                              if not isinstance(value, Value) or value.tainted)
+        return TaintState(variables, memory and context.memory.any_tainted_values(),
+                          shadow and context.memory.any_tainted_addresses())
+
+
+class TaintAnalysis(object):
+    """
+    Fixpoint of the taint states of a program from an entry state. States are only kept at the start of the basic
+    blocks reached (see symbolic_engine.cfg) while the fixpoint is computed, and a block is walked statement by
+    statement from its start state with a mutable set of variables; once the fixpoint is reached, the blocks are
+    walked a last time to find the clean statements, and only those are kept.
+    """
+
+    def __init__(self, program, entry=None):
+        """
+        @type program: Program
+        @type entry: TaintState
+        """
+        self.entry = entry if entry is not None else TaintState()
+        stmts = program.stmts
+        self.size = len(stmts)
+        self.clean = set()
+        self.assigned = frozenset(stmt.var_name for stmt in stmts if stmt.get_name() == 'Assign')
+        if not self.size:
+            return
+        graph = control_flow_graph(program)
+        states, anywhere = self.block_states(stmts, graph)
+        for start, state in states.iteritems():
+            self.walk(stmts, graph.block_at(start), state, anywhere, self.clean)
+
+    def block_states(self, stmts, graph):
+        """
+        @type graph: ControlFlowGraph
+        @return: dict of the start pc of every block reached to the state before it, and the join of the states
+        the computed jumps leave, which reaches every statement (None when no computed jump is reached)
+        """
+        states = {0: self.entry}
+        anywhere = None
+        # start pcs of the blocks to walk again, lowest first so a block is walked after the blocks before it
+        pending = [0]
+        queued = set(pending)
+        while pending:
+            start = heapq.heappop(pending)
+            queued.discard(start)
+            block = graph.block_at(start)
+            state = self.walk(stmts, block, states[start], anywhere)
+            changed = []
+            if block.computed:
+                joined = state.join(anywhere)
+                if joined != anywhere:
+                    anywhere = joined
+                    # every block sees the new states of the computed jumps
+                    for target in graph.starts:
+                        states.setdefault(target, anywhere)
+                    changed = list(graph.starts)
+            for target in block.successors:
+                joined = state.join(states.get(target))
+                if joined != states.get(target):
+                    states[target] = joined
+                    changed.append(target)
+            for target in changed:
+                if target not in queued:
+                    queued.add(target)
+                    heapq.heappush(pending, target)
+        return states, anywhere
+
+    def walk(self, stmts, block, state, anywhere, clean=None):
+        """
+        Runs the transfer functions over the statements of a block
+        @type block: BasicBlock
+        @param state: the state before the block
+        @param anywhere: see block_states
+        @param clean: set the clean pcs of the block are added to, if given
+        @return: the state after the block
+        @rtype TaintState
+        """
+        if anywhere is not None:
+            state = state.join(anywhere)
+            # a computed jump may land on any statement of the block, so what it leaves tainted stays tainted
+            pinned = anywhere.variables
+        else:
+            pinned = frozenset()
+        state = TaintState(set(state.variables), state.memory, state.shadow)
+        for pc in xrange(block.start, block.stop):
+            stmt = stmts[pc]
+            if clean is not None and self.is_clean(stmt, state):
+                clean.add(pc)
+            self.transfer(stmt, state)
+            if pinned and stmt.get_name() == 'Assign' and stmt.var_name in pinned:
+                state.variables.add(stmt.var_name)
+        return TaintState(frozenset(state.variables), state.memory, state.shadow)
+
+    def tainted(self, expression, state):
+        """
+        @return: whether the expression may evaluate to a tainted or symbolic value in the state
+        """
+        name = expression.get_name()
+        if name in BINOPS:
+            return self.tainted(expression.left, state) or self.tainted(expression.right, state)
+        if name == 'Value':
+            return bool(expression.tainted)
+        if name == 'Var':
+            return expression.var_name in state.variables
+        if name == 'Load':
+            return state.memory or self.tainted(expression.address, state)
+        return True
+
+    def transfer(self, stmt, state):
+        """
+        Updates a state to the state after the statement
+        @param state: TaintState whose variables are a mutable set
+        """
+        name = stmt.get_name()
+        if name == 'Assign':
+            if self.tainted(stmt.expression, state):
+                state.variables.add(stmt.var_name)
+            else:
+                state.variables.discard(stmt.var_name)
+        elif name == 'Store':
+            value_tainted = self.tainted(stmt.value, state)
+            # policies may taint the shadow of an address for the value stored there
+            state.shadow = state.shadow or value_tainted or self.tainted(stmt.address, state)
+            state.memory = state.memory or value_tainted
+        elif name not in ('Goto', 'IF'):
+            state.variables.update(self.assigned)
+            state.memory = state.shadow = True
+
+    def is_clean(self, stmt, state):
+        name = stmt.get_name()
+        if name == 'Store':
+            return not (state.shadow or self.tainted(stmt.address, state) or self.tainted(stmt.value, state))
+        if name == 'Goto':
+            return not self.tainted(stmt.pc, state)
+        return False
+
+    def state_before(self, program, pc):
+        """
+        The state before a statement, for inspecting the analysis: the states are not kept, so this computes the
+        fixpoint again
+        @param program: the program analysed
+        @return: the state, None if the statement is never reached
+        @rtype TaintState
+        """
+        graph = control_flow_graph(program)
+        states, anywhere = self.block_states(program.stmts, graph)
+        block = graph.block_at(pc)
+        if block.start not in states:
+            return None
+        return self.walk(program.stmts, BasicBlock(block.index, block.start, pc), states[block.start], anywhere)
+
+
+def program_accesses(program):
+    """
+    @return: (loads, stores, gotos): whether the program has a Load, and a Store, so that the memory or the address
+    shadow matter to its analysis, and a Goto; computed once per program
+    @type program: Program
+    """
+    accesses = _accesses.get(program)
+    if accesses is None or accesses[0] != len(program.stmts):
+        loads = stores = gotos = False
+        for stmt in program.stmts:
+            name = stmt.get_name()
+            if name not in FIELDS:
+                loads = stores = True
+                break
+            stores = stores or name == 'Store'
+            gotos = gotos or name == 'Goto'
+            pending = [getattr(stmt, field) for field in FIELDS[name]]
+            while pending and not loads:
+                expression = pending.pop()
+                expression_name = expression.get_name()
+                if expression_name == 'Load':
+                    loads = True
+                elif expression_name in BINOPS:
+                    pending.extend((expression.left, expression.right))
+        accesses = _accesses[program] = len(program.stmts), loads, stores, gotos
+    return accesses[1:]
+
+
+def ran_before(program):
+    """
+    @return: whether a StaticTaintExecution ran the program before; counts this run as one
+    @type program: Program
+    """
+    if program in _runs:
+        return True
+    _runs[program] = True
+    return False
+
+
+def taint_analysis(program, entry):
+    """
+    The analysis of a program from an entry state, computed the first time it is asked for
+    @type program: Program
+    @type entry: TaintState
+    @rtype TaintAnalysis
+    """
+    analyses = _analyses.get(program)
+    if analyses is None or analyses[None] != len(program.stmts):
+        analyses = _analyses[program] = {None: len(program.stmts)}
+    analysis = analyses.get(entry)
+    if analysis is None:
+        analysis = analyses[entry] = TaintAnalysis(program, entry)
+    return analysis
+
+
+class StaticTaintExecution(BlockExecution):
+    """
+    BlockExecution running the statements the analysis proves clean with clean_store_rule and clean_goto_rule,
+    when the taint policy allows it (static_taint), no tracer is set and the analysis pays off
+    """
+    CLEAN_RULES = {
+        BaseInterpreter.store_rule.__func__: 'clean_store_rule',
+        BaseInterpreter.goto_rule.__func__: 'clean_goto_rule'
+    }
+
+    def entry_key(self, context):
+        graph = super(StaticTaintExecution, self).entry_key(context)
+        if not self.taint_policy.static_taint or self.tracer is not None:
+            return graph
+        program = context.program
+        # see the module docstring for when the analysis pays off
+        if not (ran_before(program) or graph.loops):
+            return graph
+        loads, stores, gotos = program_accesses(program)
+        if not (stores or gotos):
+            return graph
+        return graph, taint_analysis(program, TaintState.of_context(context, loads, stores))
+
+    def statement_rule(self, key, pc, stmt):
+        rule = super(StaticTaintExecution, self).statement_rule(key, pc, stmt)
+        if isinstance(key, tuple) and pc in key[1].clean:
+            clean_rule = self.CLEAN_RULES.get(getattr(rule, '__func__', None))
+            if clean_rule is not None:
+                return getattr(self, clean_rule)
+        return rule
+
+
+class StaticTaintInterpreter(StaticTaintExecution, Interpreter):
+    pass
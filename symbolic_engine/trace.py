@@ -0,0 +1,228 @@
+"""
+Streaming execution traces.
+
+A TraceRecorder packs one fixed size record per executed statement (pc, opcode, flags, target and value) into a
+preallocated segment of memory. Full segments are handed to a writer thread that appends them to the trace file
+while the interpreter keeps filling the next free segment, so tracing costs a struct.pack_into per statement and
+no I/O on the interpreter's thread. Interpreters only check `self.tracer is not None`, which is all tracing
+costs when it is off.
+
+The file is a header followed by chunks, each one holding the variable names first used in it and its records.
+Targets and values are signed 64-bit fields: negative ints are kept, and words over 2 ** 63 (the top half of a
+BitVec64) are read back as their two's complement. read_trace() is a generator over the records of a file, for
+offline analysis.
+
+An error of the writer thread (a full disk, a closed file) is kept and raised by the next flush or by close, in the
+interpreter's thread.
+"""
+import collections
+import struct
+import threading
+import Queue
+
+from symbolic_engine import Value, ConcolicValue, as_int
+
+MAGIC = 'SETR'
+VERSION = 2
+HEADER = struct.Struct('<4sH')
+CHUNK = struct.Struct('<II')
+NAME = struct.Struct('<H')
+RECORD = struct.Struct('<IBB2xqq')
+
+ASSIGN, STORE, GOTO, IF = range(4)
+OPCODE_NAMES = ['Assign', 'Store', 'Goto', 'IF']
+
+VALUE_TAINTED = 1
+TARGET_TAINTED = 2
+VALUE_SYMBOLIC = 4
+BRANCH_TAKEN = 8
+
+# seconds between two checks of the writer thread while waiting for a free segment
+WRITER_POLL = 0.5
+
+TraceRecord = collections.namedtuple('TraceRecord', 'pc opcode flags target value')
+
+
+def _field(number):
+    """
+    @return: number wrapped to a signed 64-bit field
+    """
+    return ((number + 2 ** 63) & (2 ** 64 - 1)) - 2 ** 63
+
+
+def _value_fields(value):
+    """
+    @return: the word and the flags describing a Value or a symbolic expression
+    """
+    if isinstance(value, Value):
+        return as_int(value.value), VALUE_TAINTED if value.tainted else 0
+    if isinstance(value, ConcolicValue):
+        return as_int(value.value), VALUE_SYMBOLIC | (VALUE_TAINTED if value.tainted else 0)
+    return 0, VALUE_SYMBOLIC
+
+
+class TraceRecorder(object):
+    """
+    Records the statements executed by an interpreter whose tracer it is. Call close() (or use it as a context
+    manager) to flush the last records and stop the writer thread.
+    """
+
+    def __init__(self, path, capacity=4096, segments=4):
+        """
+        @type path: str
+        @param capacity: records per segment
+        @param segments: number of preallocated segments; the interpreter waits for the writer when all of them are
+        full
+        """
+        self.capacity = capacity
+        self.stream = open(path, 'wb')
+        self.stream.write(HEADER.pack(MAGIC, VERSION))
+        self.free = Queue.Queue()
+        for _ in range(segments - 1):
+            self.free.put(bytearray(capacity * RECORD.size))
+        self.full = Queue.Queue()
+        self.buffer = bytearray(capacity * RECORD.size)
+        self.position = 0
+        self.names = {}
+        self.new_names = []
+        self.records = 0
+        # exception raised by the writer thread, re-raised by flush and close
+        self.error = None
+        self.writer = threading.Thread(target=self.write_segments, name="trace writer")
+        self.writer.daemon = True
+        self.writer.start()
+
+    def record(self, pc, opcode, flags, target, value):
+        RECORD.pack_into(self.buffer, self.position * RECORD.size, pc, opcode, flags, _field(target), _field(value))
+        self.position += 1
+        if self.position == self.capacity:
+            self.flush()
+
+    def assign(self, pc, name, value):
+        """
+        @type pc: int
+        @type name: str
+        @type value: Value | SymExpression
+        """
+        index = self.names.get(name)
+        if index is None:
+            index = self.names[name] = len(self.names)
+            self.new_names.append(name)
+        word, flags = _value_fields(value)
+        self.record(pc, ASSIGN, flags, index, word)
+
+    def store(self, pc, address, value, address_tainted):
+        """
+        @type pc: int
+        @type address: Value
+        @type value: Value | SymExpression
+        """
+        word, flags = _value_fields(value)
+        if address_tainted:
+            flags |= TARGET_TAINTED
+        self.record(pc, STORE, flags, as_int(address.value), word)
+
+    def goto(self, pc, target):
+        """
+        @type target: Value
+        """
+        self.record(pc, GOTO, TARGET_TAINTED if target.tainted else 0, as_int(target.value), 0)
+
+    def branch(self, pc, taken, target):
+        """
+        @param taken: whether the condition held
+        @type target: Value
+        """
+        flags = (BRANCH_TAKEN if taken else 0) | (TARGET_TAINTED if target.tainted else 0)
+        self.record(pc, IF, flags, as_int(target.value), 0)
+
+    def flush(self):
+        """Hands the records so far to the writer thread"""
+        self.check()
+        if self.position or self.new_names:
+            self.records += self.position
+            self.full.put((self.buffer, self.position, self.new_names))
+            self.buffer = self.free_segment()
+            self.position = 0
+            self.new_names = []
+
+    def check(self):
+        """Raises the error of the writer thread, if any"""
+        if self.error is not None:
+            raise self.error
+
+    def free_segment(self):
+        """
+        Waits for a segment the writer is done with
+        @rtype bytearray
+        """
+        while True:
+            try:
+                return self.free.get(timeout=WRITER_POLL)
+            except Queue.Empty:
+                self.check()
+                if not self.writer.is_alive():
+                    raise Exception("the trace writer thread stopped")
+
+    def write_segments(self):
+        while True:
+            item = self.full.get()
+            if item is None:
+                return
+            buffer, count, names = item
+            # after an error the segments are only given back, so the interpreter never waits for them
+            if self.error is None:
+                try:
+                    chunk = [CHUNK.pack(len(names), count)]
+                    for name in names:
+                        chunk.append(NAME.pack(len(name)))
+                        chunk.append(name)
+                    self.stream.write(''.join(chunk))
+                    self.stream.write(buffer[:count * RECORD.size])
+                except Exception, e:
+                    self.error = e
+            self.free.put(buffer)
+
+    def close(self):
+        if self.stream.closed:
+            return
+        try:
+            self.flush()
+        finally:
+            self.full.put(None)
+            self.writer.join()
+            self.stream.close()
+        self.check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def read_trace(path):
+    """
+    Generator over the records of a trace file. The target of Assign records is the variable name, for the other
+    opcodes it is the address or pc written.
+    @type path: str
+    """
+    with open(path, 'rb') as stream:
+        magic, version = HEADER.unpack(stream.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise Exception("%s is not a trace" % path)
+        names = []
+        while True:
+            header = stream.read(CHUNK.size)
+            if not header:
+                return
+            name_count, count = CHUNK.unpack(header)
+            for _ in range(name_count):
+                length, = NAME.unpack(stream.read(NAME.size))
+                names.append(stream.read(length))
+            data = stream.read(count * RECORD.size)
+            for offset in xrange(0, count * RECORD.size, RECORD.size):
+                pc, opcode, flags, target, value = RECORD.unpack_from(data, offset)
+                if opcode == ASSIGN:
+                    target = names[target]
+                yield TraceRecord(pc, opcode, flags, target, value)
@@ -1,29 +1,26 @@
-from z3 import *
-init(r"C:\Users\core\Downloads\z3-4.3.0-x86\z3-4.3.0-x86\bin\libz3.dll")
-# ((3) + ((2) * (s_1))) > ((s_2) - (20)) AND (((2) * (s_1)) - (5)) == (15)
-s_1 = BitVec('s_1', 32)
-s_2 = BitVec('s_2', 32)
+from symbolic_engine import Value, UInt32, MulOp, AddOp, SubOp, EQ, GT, symbols, Simplifier
+from symbolic_engine.solver import Solver
 
-v_3 = BitVecVal(3, 32)
-v_2 = BitVecVal(2, 32)
-v_20 = BitVecVal(20, 32)
-v_5 = BitVecVal(5, 32)
-v_15 = BitVecVal(15, 32)
+# ((3) + ((2) * (s_1))) > ((s_2) - (20)) AND (((2) * (s_1)) - (5)) == (15)
+# set Z3_LIBRARY to the path of libz3 if z3 can't find it by itself
+simplifier = Simplifier(symbols)
+s_1 = symbols.input('s_1')
+s_2 = symbols.input('s_2')
 
-s = And(
-    v_3 + (v_2 * s_1) > (s_2 - v_20),
-    ((v_2 * s_1) - v_5) == v_15
-)
-print solve(s)
-s2 = And(
-    v_3 + (v_2 * s_1) > (s_2 - v_20),
-    Not(((v_2 * s_1) - v_5) == v_15)
-)
+v_3 = Value(UInt32(3))
+v_2 = Value(UInt32(2))
+v_20 = Value(UInt32(20))
+v_5 = Value(UInt32(5))
+v_15 = Value(UInt32(15))
 
-print solve(s2)
+c1 = simplifier.binop(GT, simplifier.binop(AddOp, v_3, simplifier.binop(MulOp, v_2, s_1)),
+                      simplifier.binop(SubOp, s_2, v_20))
+c2 = simplifier.binop(EQ, simplifier.binop(SubOp, simplifier.binop(MulOp, v_2, s_1), v_5), v_15)
 
-s3 = And(
-    Not(v_3 + (v_2 * s_1) > (s_2 - v_20)),
-    Not(((v_2 * s_1) - v_5) == v_15)
-)
-print solve(s3)
\ No newline at end of file
+solver = Solver()
+for constraints in ([c1, c2], [c1, simplifier.negate(c2)], [simplifier.negate(c1), simplifier.negate(c2)]):
+    solver.push()
+    for constraint in constraints:
+        solver.add(constraint)
+    print solver.check(), solver.model()
+    solver.pop()
@@ -0,0 +1,42 @@
+import os
+import unittest
+from symbolic_engine.compiler import CompiledInterpreter
+from benchmarks import generators
+from benchmarks.runner import run_benchmarks, compare, measure_isolated
+
+
+class DyingWorkload(object):
+    name = 'dying'
+    unit = 'statements'
+
+    def run(self):
+        os._exit(3)
+
+
+class BenchmarkTest(unittest.TestCase):
+    def test_workloads_run(self):
+        workloads = [generators.straight_line(50), generators.tight_loop(20, CompiledInterpreter),
+                     generators.memory_sweep(3, cells_per_page=4), generators.taint_chain(30),
+                     generators.branch_tree(3),
+                     generators.memory_sweep(2, cells_per_page=4, interpreter_class=CompiledInterpreter, runs=3)]
+        results = run_benchmarks(workloads, repeat=1, isolated=False)
+        self.assertEqual(set(workload.name for workload in workloads), set(results['benchmarks']))
+        self.assertEqual(61, results['benchmarks']['tight_loop_CompiledInterpreter']['units'])
+        self.assertEqual(3, results['benchmarks']['memory_sweep_Interpreter']['pages'])
+        self.assertEqual(8, results['benchmarks']['branch_tree']['units'])
+        self.assertEqual(3 * 16, results['benchmarks']['memory_sweep_x3_CompiledInterpreter']['units'])
+        self.assertEqual([], compare(results, results))
+
+    def test_regressions_are_flagged(self):
+        baseline = {'benchmarks': {'a': {'throughput': 100.0, 'peak_rss_kb': 1000, 'unit': 'statements'},
+                                   'b': {'throughput': 100.0, 'peak_rss_kb': 1000, 'unit': 'statements'}}}
+        results = {'benchmarks': {'a': {'throughput': 70.0, 'peak_rss_kb': 1300, 'unit': 'statements'},
+                                  'b': {'throughput': 90.0, 'peak_rss_kb': 1100, 'unit': 'statements'},
+                                  'c': {'error': 'IndexError: pop from empty list'}}}
+        regressions = compare(results, baseline, tolerance=0.2)
+        self.assertEqual(3, len(regressions))
+        self.assertTrue(all(message.startswith('a') or message.startswith('c') for message in regressions))
+
+    def test_dead_child_is_an_error(self):
+        result = measure_isolated(DyingWorkload(), 1, poll=0.1)
+        self.assertEqual({'error': 'the benchmark process exited with code 3'}, result)
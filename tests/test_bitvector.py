@@ -0,0 +1,70 @@
+import pickle
+import unittest
+from symbolic_engine import (UInt32, BitVec8, BitVec16, BitVec64, bitvector_class, Program, Assign, SubOp, GT, IF,
+                             Value, Var, Interpreter, DefaultTaintPolicy, DefaultTaintCheckHandler)
+from test_taint import a_context
+
+
+class BitVectorTest(unittest.TestCase):
+    def test_wraps_at_width(self):
+        self.assertEqual(0, UInt32(2 ** 32 - 1) + UInt32(1))
+        self.assertEqual(2 ** 32 - 2, UInt32(2 ** 31 + 3) * 2 - 8)
+        self.assertEqual(255, BitVec8(0) - 1)
+        self.assertEqual(0x2345, BitVec16(0x1234) + 0x1111)
+        self.assertEqual(2 ** 64 - 1, -BitVec64(1))
+        self.assertEqual(10, 3 + UInt32(7))
+        self.assertEqual(2 ** 32 - 4, 3 - UInt32(7))
+
+    def test_operator_set(self):
+        x = UInt32(0xf0f0f0f0)
+        self.assertEqual(0x0f0f0f0f, ~x)
+        self.assertEqual(0xf0f0f000, x & 0xffffff00)
+        self.assertEqual(0xf0f0f0ff, x | 0xff)
+        self.assertEqual(0xf0f0f00f, x ^ 0xff)
+        self.assertEqual(0x0f0f0f00, x << 4)
+        self.assertEqual(0, x << 32)
+        self.assertEqual(0x0f0f0f0f, x >> 4)
+        self.assertEqual(0xff0f0f0f, x.ashr(4))
+        self.assertEqual((UInt32(3), UInt32(1)), divmod(UInt32(10), UInt32(3)))
+        self.assertEqual(3, UInt32(10) / 3)
+        self.assertRaises(ZeroDivisionError, lambda: UInt32(1) / UInt32(0))
+
+    def test_compares(self):
+        minus_one = UInt32(2 ** 32 - 1)
+        self.assertTrue(minus_one > UInt32(1))
+        self.assertTrue(minus_one.slt(UInt32(1)))
+        self.assertTrue(UInt32(1).sgt(minus_one))
+        self.assertTrue(minus_one.sle(minus_one) and minus_one.sge(-1))
+        self.assertEqual(-1, minus_one.signed())
+        self.assertEqual(-128, BitVec8(0x80).signed())
+        self.assertTrue(UInt32(5) == 5 and UInt32(5) != UInt32(6))
+        self.assertEqual(hash(5), hash(UInt32(5)))
+
+    def test_small_constants_are_shared(self):
+        self.assertTrue(UInt32.of(7) is UInt32(3) + 4)
+        self.assertTrue(UInt32.of(2 ** 32 + 1) is UInt32.of(1))
+        self.assertFalse(UInt32.of(1) is BitVec8.of(1))
+        self.assertFalse(hasattr(UInt32(1), '__dict__'))
+
+    def test_widths(self):
+        self.assertTrue(bitvector_class(32) is UInt32)
+        BitVec12 = bitvector_class(12)
+        self.assertEqual(0, BitVec12(4095) + 1)
+        self.assertRaises(AssertionError, BitVec8, 256)
+        self.assertRaises(AssertionError, UInt32, -1)
+        for value in (UInt32(2 ** 31), BitVec12(7), BitVec64(2 ** 40)):
+            copy = pickle.loads(pickle.dumps(value))
+            self.assertEqual(value, copy)
+            self.assertTrue(copy.__class__ is value.__class__)
+
+    def test_pc_is_a_plain_int(self):
+        program = Program([
+            Assign("X", SubOp(Value(UInt32(3)), Value(UInt32(5)))),
+            IF(GT(Var("X"), Value(UInt32(3))), Value(UInt32(2)), Value(UInt32(3))),
+            Assign("Y", Var("X"))
+        ])
+        context = Interpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler()).run(
+            a_context().with_program(program).build())
+        self.assertTrue(type(context.pc) is int)
+        self.assertEqual(3, context.pc)
+        self.assertEqual(UInt32(2 ** 32 - 2), context.resolve_name("Y").value)
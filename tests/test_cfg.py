@@ -0,0 +1,146 @@
+import unittest
+from symbolic_engine import (Program, Assign, AddOp, Value, Interpreter, GetInput, Store, Load, Goto, IF, Var, EQ, GT,
+                             UInt32, DefaultTaintPolicy, DefaultTaintCheckHandler, AttackException, ConcolicInterpreter,
+                             IdProvider)
+from symbolic_engine.cfg import (control_flow_graph, ControlFlowGraph, BlockInterpreter, BlockConcolicInterpreter,
+                                 static_targets)
+from test_taint import a_context
+
+
+def loop_program(iterations=5):
+    return Program([
+        Assign("I", Value(UInt32(0))),
+        Assign("S", Value(UInt32(0))),
+        Assign("I", AddOp(Var("I"), Value(UInt32(1)))),
+        Assign("S", AddOp(Var("S"), Var("I"))),
+        Store(Var("I"), Var("S")),
+        IF(EQ(Var("I"), Value(UInt32(iterations))), Value(UInt32(7)), Value(UInt32(6))),
+        Goto(Value(UInt32(2))),
+        Assign("DONE", Load(Value(UInt32(iterations))))
+    ])
+
+
+def computed_program():
+    return Program([
+        Assign("T", AddOp(GetInput([UInt32(2)]), Value(UInt32(2)))),
+        Goto(Var("T")),
+        Assign("A", Value(UInt32(1))),
+        Assign("B", Value(UInt32(2))),
+        Assign("C", Value(UInt32(3)))
+    ])
+
+
+class ControlFlowGraphTest(unittest.TestCase):
+    def test_blocks(self):
+        graph = ControlFlowGraph(loop_program())
+        self.assertEqual([0, 2, 6, 7], graph.starts)
+        self.assertEqual([(0, 2), (2, 6), (6, 7), (7, 8)], [(block.start, block.stop) for block in graph])
+        self.assertEqual([[2], [7, 6], [2], []], [block.successors for block in graph])
+        self.assertEqual([[], [0, 6], [2], [2]], [block.predecessors for block in graph])
+        self.assertEqual([False, False, False, True], [block.exit for block in graph])
+        self.assertEqual(graph.blocks[1], graph.block_at(4))
+        self.assertEqual(set([0, 2, 6, 7]), graph.reachable())
+        self.assertTrue(graph.loops)
+
+    def test_computed_targets(self):
+        graph = ControlFlowGraph(computed_program())
+        self.assertEqual([(0, 2), (2, 5)], [(block.start, block.stop) for block in graph])
+        self.assertTrue(graph.blocks[0].computed)
+        self.assertEqual([graph.blocks[0]], graph.computed_blocks)
+        self.assertEqual(([], True), static_targets(computed_program().stmts[1]))
+        self.assertEqual(([3], True), static_targets(IF(Var("C"), Value(UInt32(3)), Var("X"))))
+
+    def test_unreachable(self):
+        program = Program([Goto(Value(UInt32(2))), Assign("A", Value(UInt32(1))), Assign("B", Value(UInt32(2)))])
+        self.assertEqual(set([0, 2]), control_flow_graph(program).reachable())
+        self.assertFalse(control_flow_graph(program).loops)
+        self.assertTrue(control_flow_graph(computed_program()).loops)
+        self.assertTrue(control_flow_graph(Program([Goto(Value(UInt32(0)))])).loops)
+
+    def test_cached(self):
+        program = loop_program()
+        graph = control_flow_graph(program)
+        self.assertTrue(graph is control_flow_graph(program))
+        program.stmts.append(Assign("X", Value(UInt32(0))))
+        self.assertFalse(graph is control_flow_graph(program))
+        self.assertEqual(9, control_flow_graph(program).size)
+
+
+class BlockInterpreterTest(unittest.TestCase):
+    def run_both(self, program, interpreter_class=BlockInterpreter, reference_class=Interpreter):
+        results = []
+        for cls in (reference_class, interpreter_class):
+            context = a_context().with_program(program).build()
+            cls(DefaultTaintPolicy(), DefaultTaintCheckHandler()).run(context)
+            results.append(context)
+        return results
+
+    def test_loop(self):
+        expected, context = self.run_both(loop_program())
+        self.assertEqual(8, context.pc)
+        self.assertEqual(UInt32(15), context.resolve_name("DONE").value)
+        self.assertEqual(dict(expected.variables.items()), dict(context.variables.items()))
+        for address in range(1, 6):
+            self.assertEqual(expected.get_mem_value(UInt32(address)), context.get_mem_value(UInt32(address)))
+
+    def test_computed_jump_into_a_block(self):
+        expected, context = self.run_both(Program([
+            Assign("T", AddOp(Value(UInt32(2)), Value(UInt32(1)))),
+            Goto(Var("T")),
+            Assign("A", Value(UInt32(1))),
+            Assign("B", Value(UInt32(2))),
+            Assign("C", Value(UInt32(3)))
+        ]))
+        self.assertEqual(dict(expected.variables.items()), dict(context.variables.items()))
+        self.assertFalse("A" in context.variables)
+        self.assertEqual(UInt32(3), context.resolve_name("C").value)
+
+    def test_tainted_goto(self):
+        context = a_context().with_program(computed_program()).build()
+        self.assertRaises(AttackException,
+                          BlockInterpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler()).run, context)
+        self.assertEqual(1, context.pc)
+
+    def test_overridden_rule_ends_the_run(self):
+        class JumpingAssign(BlockInterpreter):
+            def assign_rule(self, context):
+                super(JumpingAssign, self).assign_rule(context)
+                if context.current_instr() is not None and context.pc == 1:
+                    context.pc = 2
+                return context
+
+        program = Program([Assign("A", Value(UInt32(1))), Assign("B", Value(UInt32(2))), Assign("C", Value(UInt32(3)))])
+        context = a_context().with_program(program).build()
+        JumpingAssign(DefaultTaintPolicy(), DefaultTaintCheckHandler()).run(context)
+        self.assertEqual(["A", "C"], sorted(context.variables))
+
+    def test_statements_are_fetched_once_per_block(self):
+        class CountingStatements(list):
+            fetches = 0
+
+            def __getitem__(self, pc):
+                self.fetches += 1
+                return list.__getitem__(self, pc)
+
+        program = loop_program()
+        program.stmts = CountingStatements(program.stmts)
+        context = a_context().with_program(program).build()
+        BlockInterpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler()).run(context)
+        self.assertEqual(UInt32(15), context.resolve_name("DONE").value)
+        # every statement once when its block is first entered, and the one checked when the run starts
+        self.assertEqual(len(program.stmts) + 1, program.stmts.fetches)
+
+    def test_concolic(self):
+        def program():
+            the_input = GetInput([UInt32(3), UInt32(1)])
+            return Program([
+                Assign("X", AddOp(Value(UInt32(2)), the_input)),
+                IF(GT(Var("X"), Value(UInt32(4))), Value(UInt32(2)), Value(UInt32(3))),
+                Assign("Y", Var("X"))
+            ])
+
+        interpreter = BlockConcolicInterpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler(), IdProvider())
+        interpreter.run(a_context().with_program(program()).build())
+        reference = ConcolicInterpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler(), IdProvider())
+        reference.run(a_context().with_program(program()).build())
+        self.assertEqual(str(reference.constraints), str(interpreter.constraints))
@@ -0,0 +1,107 @@
+import unittest
+from symbolic_engine import (Program, Assign, AddOp, Value, Interpreter, GetInput, Store, Load, Goto, IF, Var, UInt32,
+                             DefaultTaintPolicy, DefaultTaintCheckHandler, AttackException, MulOp, SubOp,
+                             ConcolicInterpreter, EQ, GT, IdProvider)
+from symbolic_engine.compiler import CompiledInterpreter, CompiledConcolicInterpreter
+from test_taint import a_context
+
+
+class TestCompiledInterpreter(unittest.TestCase):
+    def setUp(self):
+        self.interpreter = CompiledInterpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler())
+
+    def run_both(self, build_program):
+        expected = Interpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler()).run(
+            a_context().with_program(build_program()).build())
+        result = self.interpreter.run(a_context().with_program(build_program()).build())
+        return expected, result
+
+    def test_same_results_and_taint(self):
+        mem_pos = 0x1000
+
+        def build_program():
+            return Program([
+                Assign("foo", GetInput([UInt32(7)])),
+                Assign("bar", MulOp(Value(UInt32(3)), AddOp(Var("foo"), Value(UInt32(3))))),
+                Store(Value(UInt32(mem_pos)), Var("bar")),
+                Goto(Value(UInt32(5))),
+                Assign("bar", Value(UInt32(0))),
+                IF(AddOp(Value(UInt32(0)), Value(UInt32(1))), Value(UInt32(6)), Value(UInt32(7))),
+                Assign("baz", Load(Value(UInt32(mem_pos)))),
+                Assign("clean", Value(UInt32(1)))
+            ])
+
+        expected, result = self.run_both(build_program)
+        for name in ("foo", "bar", "baz", "clean"):
+            self.assertEqual(expected.resolve_name(name).value, result.resolve_name(name).value)
+            self.assertEqual(expected.resolve_name(name).isTainted(), result.resolve_name(name).isTainted())
+        self.assertEqual(expected.pc, result.pc)
+
+    def test_taint_check(self):
+        program = Program([
+            Assign("foo", GetInput([UInt32(0)])),
+            Goto(Var("foo"))
+        ])
+        context = a_context().with_program(program).build()
+        self.assertRaises(AttackException, lambda: self.interpreter.run(context))
+        self.assertEqual(UInt32(1), context.pc)
+
+    def test_overridden_evaluation(self):
+        class Saturating(CompiledInterpreter):
+            def eval_binop(self, expression, context):
+                result = super(Saturating, self).eval_binop(expression, context)
+                return Value(UInt32(min(result.value.value, 10)), result.tainted)
+
+            def eval_var(self, expression, context):
+                self.reads += 1
+                return super(Saturating, self).eval_var(expression, context)
+
+        program = Program([
+            Assign("foo", AddOp(Value(UInt32(7)), Value(UInt32(8)))),
+            Assign("bar", Var("foo"))
+        ])
+        interpreter = Saturating(DefaultTaintPolicy(), DefaultTaintCheckHandler())
+        interpreter.reads = 0
+        context = interpreter.run(a_context().with_program(program).build())
+        self.assertEqual(UInt32(10), context.resolve_name("bar").value)
+        self.assertEqual(1, interpreter.reads)
+
+    def test_code_is_cached_per_program(self):
+        program = Program([Assign("foo", Value(UInt32(1)))])
+        self.assertTrue(self.interpreter.compile(program) is self.interpreter.compile(program))
+
+    def test_statements_compiled_once_they_run_again(self):
+        program = Program([
+            Assign("i", Value(UInt32(0))),
+            Assign("i", AddOp(Var("i"), Value(UInt32(1)))),
+            IF(GT(Var("i"), Value(UInt32(2))), Value(UInt32(3)), Value(UInt32(1))),
+            Assign("done", Var("i"))
+        ])
+        code = self.interpreter.compile(program)
+        self.assertEqual(["run_once"] * 4, [closure.__name__ for closure in code])
+        context = self.interpreter.run(a_context().with_program(program).build())
+        self.assertEqual(UInt32(3), context.resolve_name("done").value)
+        self.assertEqual(["run_once", "assign", "branch", "run_once"],
+                         [closure.__name__ for closure in code])
+
+        self.interpreter.run(a_context().with_program(program).build())
+        self.assertEqual(["assign", "assign", "branch", "assign"], [closure.__name__ for closure in code])
+
+
+class TestCompiledConcolicInterpreter(unittest.TestCase):
+    def build_program(self):
+        the_input = GetInput([UInt32(10), UInt32(30)])
+        return Program([
+            Assign("X", MulOp(Value(UInt32(2)), the_input)),
+            IF(EQ(SubOp(Var("X"), AddOp(Value(UInt32(3)), Value(UInt32(2)))), Value(UInt32(15))), Value(UInt32(2)),
+               Value(UInt32(3))),
+            Assign("Y", AddOp(Value(UInt32(3)), Var("X"))),
+            IF(GT(Var("Y"), SubOp(the_input, Value(UInt32(20)))), Value(UInt32(4)), Value(UInt32(5)))
+        ])
+
+    def test_same_constraints(self):
+        expected = ConcolicInterpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler(), IdProvider())
+        expected.run(a_context().with_program(self.build_program()).build())
+        compiled = CompiledConcolicInterpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler(), IdProvider())
+        compiled.run(a_context().with_program(self.build_program()).build())
+        self.assertEqual(str(expected.constraints), str(compiled.constraints))
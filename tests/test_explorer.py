@@ -0,0 +1,38 @@
+import unittest
+from symbolic_engine import (Program, Assign, AddOp, Value, GetInput, IF, Var, UInt32, DefaultTaintPolicy,
+                             DefaultTaintCheckHandler, MulOp, SubOp, EQ, GT)
+from symbolic_engine.explorer import Explorer
+from test_taint import a_context
+
+
+def diamond_program():
+    the_input = GetInput([])
+    return Program([
+        Assign("X", MulOp(Value(UInt32(2)), the_input)),
+        Assign("Y", Value(UInt32(100))),
+        IF(EQ(SubOp(Var("X"), Value(UInt32(5))), Value(UInt32(15))), Value(UInt32(3)), Value(UInt32(4))),
+        Assign("Y", AddOp(Value(UInt32(3)), Var("X"))),
+        IF(GT(Var("Y"), the_input), Value(UInt32(5)), Value(UInt32(6))),
+        Assign("Z", Var("X"))
+    ])
+
+
+class ExplorerTest(unittest.TestCase):
+    def check_results(self, results):
+        self.assertEqual(4, len(results))
+        constraints = sorted(str(result.constraint) for result in results)
+        self.assertEqual(4, len(set(constraints)))
+        self.assertTrue(all(result.exception is None and result.summary['pc'] == 6 for result in results))
+        self.assertEqual(2, len([result for result in results if 'Z' in result.summary['variables']]))
+
+    def test_serial(self):
+        explorer = Explorer(DefaultTaintPolicy(), DefaultTaintCheckHandler(), processes=0)
+        self.check_results(list(explorer.explore(a_context().with_program(diamond_program()).build())))
+
+    def test_process_pool(self):
+        explorer = Explorer(DefaultTaintPolicy(), DefaultTaintCheckHandler(), processes=2)
+        self.check_results(list(explorer.explore(a_context().with_program(diamond_program()).build())))
+
+    def test_max_paths(self):
+        explorer = Explorer(DefaultTaintPolicy(), DefaultTaintCheckHandler(), processes=0, max_paths=2)
+        self.assertEqual(2, len(list(explorer.explore(a_context().with_program(diamond_program()).build()))))
@@ -0,0 +1,62 @@
+import pickle
+import sys
+import unittest
+from symbolic_engine import (Value, Var, Assign, Store, Load, Goto, IF, AddOp, MulOp, SubOp, EQ, GT, SymInput, And,
+                             Not, GetInput, Context, Memory, UInt32, Program, Interpreter, DefaultTaintPolicy,
+                             DefaultTaintCheckHandler)
+from test_taint import a_context
+
+
+class DictValue(object):
+    """What Value looked like before it had slots"""
+
+    def __init__(self, value, tainted=False):
+        self.value = value
+        self.tainted = tainted
+
+
+def footprint(objects):
+    return sum(sys.getsizeof(obj) + sys.getsizeof(getattr(obj, '__dict__', None) or ()) for obj in objects)
+
+
+class FootprintTest(unittest.TestCase):
+    def test_no_instance_dicts(self):
+        nodes = [Value(UInt32(1)), Var("X"), Assign("X", Var("Y")), Store(Var("X"), Var("Y")), Load(Var("X")),
+                 Goto(Var("X")), IF(Var("X"), Var("Y"), Var("Z")), AddOp(Var("X"), Var("Y")),
+                 MulOp(Var("X"), Var("Y")), SubOp(Var("X"), Var("Y")), EQ(Var("X"), Var("Y")),
+                 GT(Var("X"), Var("Y")), SymInput("s_1"), And(Var("X"), Var("Y")), Not(Var("X")), GetInput([]),
+                 Context(Memory(), {}, 0, None)]
+        for node in nodes:
+            self.assertFalse(hasattr(node, '__dict__'), node.__class__.__name__)
+
+    def test_values_are_smaller(self):
+        count = 10000
+        slotted = footprint([Value(UInt32(2 ** 20 + index), True) for index in range(count)])
+        with_dicts = footprint([DictValue(UInt32(2 ** 20 + index), True) for index in range(count)])
+        self.assertTrue(slotted * 2 < with_dicts, "%d bytes with slots, %d with dicts" % (slotted, with_dicts))
+
+    def test_small_results_are_flyweights(self):
+        program = Program([
+            Assign("X", AddOp(Value(UInt32(1)), Value(UInt32(2)))),
+            Assign("Y", MulOp(Var("X"), Value(UInt32(1)))),
+            Assign("Z", EQ(Var("X"), Var("Y")))
+        ])
+        context = Interpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler()).run(
+            a_context().with_program(program).build())
+        self.assertTrue(context.resolve_name("X") is Value.of(UInt32(3)))
+        self.assertTrue(context.resolve_name("Y") is context.resolve_name("X"))
+        self.assertTrue(context.resolve_name("Z") is Value.of(1))
+        self.assertFalse(Value.of(UInt32(3), True) is Value.of(UInt32(3), True))
+        self.assertFalse(Value.of(UInt32(1)) is Value.of(1))
+
+    def test_pickling(self):
+        program = Program([Assign("X", AddOp(Var("Y"), Value(UInt32(7), True))), Goto(Value(UInt32(0)))])
+        hash(program.stmts[0].expression)
+        for protocol in (0, pickle.HIGHEST_PROTOCOL):
+            copy = pickle.loads(pickle.dumps(program, protocol))
+            self.assertEqual(str(program.stmts[0]), str(copy.stmts[0]))
+            self.assertEqual(0, copy.stmts[1].pc.value.value)
+            self.assertTrue(copy.stmts[0].expression.right.tainted)
+        context = pickle.loads(pickle.dumps(Context(Memory(), {"X": Value(1)}, 3, None), pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(3, context.pc)
+        self.assertEqual(Value(1), context.resolve_name("X"))
@@ -0,0 +1,104 @@
+import unittest
+from symbolic_engine import Memory, Context, Program, Value, UInt32
+from symbolic_engine.persistent import PersistentMap
+
+
+class _Colliding(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __hash__(self):
+        return 42
+
+    def __eq__(self, other):
+        return self.name == other.name
+
+
+class PersistentMapTest(unittest.TestCase):
+    def test_set_get(self):
+        variables = PersistentMap({"foo": 1})
+        for i in range(1000):
+            variables["v%d" % i] = i
+        self.assertEqual(1001, len(variables))
+        self.assertEqual(1, variables["foo"])
+        self.assertEqual(999, variables["v999"])
+        self.assertRaises(KeyError, lambda: variables["missing"])
+
+    def test_fork_is_isolated(self):
+        parent = PersistentMap()
+        for i in range(100):
+            parent[i] = i
+        child = parent.fork()
+        child[5] = "child"
+        parent[6] = "parent"
+        child[1000] = "new"
+        self.assertEqual(5, parent[5])
+        self.assertEqual("child", child[5])
+        self.assertEqual(6, child[6])
+        self.assertFalse(1000 in parent)
+        self.assertEqual(101, len(child))
+
+    def test_hash_collisions(self):
+        variables = PersistentMap()
+        variables[_Colliding("a")] = 1
+        variables[_Colliding("b")] = 2
+        fork = variables.fork()
+        fork[_Colliding("a")] = 3
+        self.assertEqual(1, variables[_Colliding("a")])
+        self.assertEqual(3, fork[_Colliding("a")])
+        self.assertEqual(2, fork[_Colliding("b")])
+
+    def test_delete(self):
+        parent = PersistentMap(dict(("v%d" % i, i) for i in range(100)))
+        parent[_Colliding("a")] = 1
+        parent[_Colliding("b")] = 2
+        child = parent.fork()
+        del child["v5"]
+        del child[_Colliding("a")]
+        self.assertRaises(KeyError, child.__delitem__, "v5")
+        self.assertEqual(100, len(child))
+        self.assertFalse("v5" in child)
+        self.assertEqual(2, child[_Colliding("b")])
+        self.assertEqual(5, parent["v5"])
+        self.assertEqual(1, parent[_Colliding("a")])
+        self.assertEqual(102, len(parent))
+        child["v5"] = "back"
+        self.assertEqual("back", child["v5"])
+
+    def test_dict_operations(self):
+        variables = PersistentMap({"a": 1, "b": 2})
+        self.assertEqual(1, variables.pop("a"))
+        self.assertEqual(None, variables.pop("a", None))
+        self.assertEqual(3, variables.setdefault("c", 3))
+        self.assertEqual({"b": 2, "c": 3}, variables)
+        self.assertEqual(variables, variables.copy())
+        variables.update(d=4)
+        self.assertEqual(["b", "c", "d"], sorted(variables.iterkeys()))
+        variables.clear()
+        self.assertEqual(0, len(variables))
+        self.assertEqual({}, dict(variables))
+
+
+class MemoryForkTest(unittest.TestCase):
+    def test_pages_are_copied_on_write(self):
+        memory = Memory()
+        for page_nr in range(4):
+            memory.set_value(UInt32(page_nr * memory.page_size), Value(UInt32(page_nr)))
+        fork = memory.fork()
+        self.assertEqual(4, fork.get_shared_page_numbers())
+        fork.set_value(UInt32(0), Value(UInt32(10)))
+        fork.set_taint(UInt32(1), 1)
+        self.assertEqual(1, fork.get_private_page_numbers())
+        self.assertEqual(3, fork.get_shared_page_numbers())
+        self.assertEqual(UInt32(0), memory.get_value(UInt32(0)).value)
+        self.assertEqual(0, memory.get_taint(UInt32(1)))
+        self.assertEqual(UInt32(10), fork.get_value(UInt32(0)).value)
+
+    def test_context_fork(self):
+        context = Context(Memory(), {"foo": Value(UInt32(1))}, UInt32(0), Program([]))
+        fork = context.fork()
+        fork.variables["foo"] = Value(UInt32(2))
+        fork.set_mem_value(UInt32(0x1000), Value(UInt32(3)))
+        self.assertEqual(UInt32(1), context.resolve_name("foo").value)
+        self.assertEqual(UInt32(2), fork.resolve_name("foo").value)
+        self.assertEqual(0, context.get_mem_value(UInt32(0x1000)).value)
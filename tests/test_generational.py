@@ -0,0 +1,66 @@
+import unittest
+from symbolic_engine import (Program, Assign, AddOp, Value, GetInput, IF, Goto, Var, UInt32, EQ, GT, IdProvider,
+                             DefaultTaintPolicy, DefaultTaintCheckHandler)
+from symbolic_engine.generational import GenerationalInterpreter, GenerationalSearch
+from test_explorer import diamond_program
+from test_taint import a_context
+
+
+def magic_program():
+    """Sets R to 2 only for the inputs 1234 then anything over 100"""
+    the_input = GetInput([])
+    return Program([
+        Assign("X", the_input),
+        Assign("Y", AddOp(the_input, Value(UInt32(1)))),
+        Assign("R", Value(UInt32(1))),
+        IF(EQ(Var("X"), Value(UInt32(1234))), Value(UInt32(4)), Value(UInt32(7))),
+        IF(GT(Var("Y"), Value(UInt32(101))), Value(UInt32(5)), Value(UInt32(7))),
+        Assign("R", Value(UInt32(2))),
+        Goto(Value(UInt32(8))),
+        Assign("R", Value(UInt32(3)))
+    ])
+
+
+class GenerationalInterpreterTest(unittest.TestCase):
+    def test_branches_follow_the_inputs(self):
+        inputs = {'s_1': 1234}
+        interpreter = GenerationalInterpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler(), IdProvider(), inputs)
+        context = interpreter.run(a_context().with_program(magic_program()).build())
+        self.assertEqual(['s_1', 's_2'], sorted(inputs))
+        self.assertEqual(0, inputs['s_2'])
+        self.assertEqual([(3, True), (4, False)], [(pc, taken) for pc, taken, _, _ in interpreter.branches])
+        self.assertEqual('3', str(context.variables['R']))
+        self.assertEqual(0, interpreter.solver.queries)
+
+
+class GenerationalSearchTest(unittest.TestCase):
+    def search(self, program, seed=None, **kwargs):
+        search = GenerationalSearch(DefaultTaintPolicy(), DefaultTaintCheckHandler(), **kwargs)
+        return search, list(search.search(a_context().with_program(program).build(), seed))
+
+    def test_finds_every_path(self):
+        search, results = self.search(magic_program(), [0, 0])
+        new = [result for result in results if result.new]
+        self.assertEqual(3, len(new))
+        self.assertEqual(3, len(results))
+        self.assertEqual(len(new), len(set(result.path for result in new)))
+        self.assertEqual(set(['2', '3']),
+                         set(result.summary['variables']['R'][0] for result in results))
+        magic = [result.test.inputs for result in results if result.summary['variables']['R'][0] == '2']
+        self.assertEqual(1234, magic[0]['s_1'])
+        self.assertTrue(magic[0]['s_2'] + 1 > 101)
+        self.assertTrue(all(result.exception is None for result in results))
+        self.assertEqual(2, search.solver_sessions)
+
+    def test_generations(self):
+        search, results = self.search(magic_program(), [0, 0])
+        self.assertEqual([0, 1, 2], [result.test.generation for result in results])
+        self.assertEqual(results[0].test.inputs, {'s_1': 0, 's_2': 0})
+
+    def test_diamond(self):
+        search, results = self.search(diamond_program())
+        self.assertEqual(4, len(set(result.path for result in results)))
+
+    def test_limits(self):
+        self.assertEqual(1, len(self.search(magic_program(), max_generations=0)[1]))
+        self.assertEqual(2, len(self.search(magic_program(), max_runs=2)[1]))
@@ -0,0 +1,37 @@
+import unittest
+from symbolic_engine.intervals import IntervalSet
+
+
+class IntervalSetTest(unittest.TestCase):
+    def test_add_merges(self):
+        intervals = IntervalSet([(10, 20), (30, 40)])
+        intervals.add(20, 25)
+        self.assertEqual([(10, 25), (30, 40)], list(intervals))
+        intervals.add(5, 35)
+        self.assertEqual([(5, 40)], list(intervals))
+        intervals.add(50, 50)
+        self.assertEqual(1, len(intervals))
+
+    def test_remove_splits(self):
+        intervals = IntervalSet([(0, 100)])
+        intervals.remove(10, 20)
+        intervals.remove(90, 200)
+        self.assertEqual([(0, 10), (20, 90)], list(intervals))
+        intervals.remove(0, 90)
+        self.assertEqual([], list(intervals))
+
+    def test_queries(self):
+        intervals = IntervalSet([(10, 20), (30, 40)])
+        self.assertTrue(10 in intervals)
+        self.assertFalse(20 in intervals)
+        self.assertFalse(intervals.overlaps(20, 30))
+        self.assertTrue(intervals.overlaps(25, 31))
+        self.assertFalse(intervals.overlaps(15, 15))
+        self.assertEqual([(15, 20), (30, 35)], list(intervals.intervals(15, 35)))
+
+    def test_copy_is_independent(self):
+        intervals = IntervalSet([(0, 10)])
+        copy = intervals.copy()
+        copy.remove(0, 5)
+        self.assertEqual(IntervalSet([(0, 10)]), intervals)
+        self.assertNotEqual(intervals, copy)
@@ -0,0 +1,113 @@
+import os
+import tempfile
+import unittest
+from symbolic_engine import (Program, Assign, AddOp, Value, Interpreter, GetInput, Store, Load, Goto, Var, UInt32,
+                             AttackException, Memory, DefaultTaintPolicy, DefaultTaintCheckHandler)
+from symbolic_engine.compiler import CompiledInterpreter
+from symbolic_engine.labels import LabelRegistry, LabelTaintPolicy, LabelTaintCheckHandler, UNLABELLED
+from test_taint import a_context
+
+
+def mixing_program():
+    return Program([
+        Assign("A", GetInput([UInt32(1)], "network")),
+        Assign("B", GetInput([UInt32(2)], "file")),
+        Assign("C", GetInput([UInt32(3)], "env")),
+        Assign("AB", AddOp(Var("A"), Var("B"))),
+        Store(Value(UInt32(0x100)), Var("AB")),
+        Store(Var("C"), Value(UInt32(7))),
+        Assign("L", Load(Value(UInt32(0x100)))),
+        Goto(AddOp(Var("L"), Value(UInt32(10))))
+    ])
+
+
+class LabelRegistryTest(unittest.TestCase):
+    def test_bits(self):
+        registry = LabelRegistry()
+        self.assertEqual(2, registry.label("network"))
+        self.assertEqual(4, registry.label("file"))
+        self.assertEqual(2, registry.label("network"))
+        self.assertEqual(2, len(registry))
+        self.assertEqual(["network", "file"], registry.sources(registry.mask(["file", "network"])))
+        self.assertEqual([None, "file"], registry.sources(4 | UNLABELLED))
+        self.assertEqual([], registry.sources(False))
+
+    def test_hundreds_of_sources(self):
+        registry = LabelRegistry()
+        masks = [registry.label("input%d" % index) for index in range(300)]
+        taint = masks[3] | masks[299]
+        self.assertEqual(["input3", "input299"], registry.sources(taint))
+
+
+class LabelPropagationTest(unittest.TestCase):
+    def run_program(self, interpreter_class):
+        policy = LabelTaintPolicy()
+        handler = LabelTaintCheckHandler(policy)
+        context = a_context().with_program(mixing_program()).build()
+        self.assertRaises(AttackException, interpreter_class(policy, handler).run, context)
+        return policy.registry, handler, context
+
+    def check(self, interpreter_class):
+        registry, handler, context = self.run_program(interpreter_class)
+        network, file_, env = registry.label("network"), registry.label("file"), registry.label("env")
+        self.assertEqual(network | file_, context.resolve_name("AB").tainted)
+        self.assertEqual(network | file_, context.get_mem_value(UInt32(0x100)).tainted)
+        self.assertEqual(network | file_, context.resolve_name("L").tainted)
+        self.assertEqual(env, context.get_mem_address_labels(UInt32(3)))
+        self.assertTrue(context.get_mem_address_taint(UInt32(3)))
+        self.assertEqual(0, context.get_mem_address_labels(UInt32(0x100)))
+        self.assertEqual([(7, ["network", "file"])], handler.attributions)
+
+    def test_interpreter(self):
+        self.check(Interpreter)
+
+    def test_compiled(self):
+        self.check(CompiledInterpreter)
+
+    def test_booleans_still_work(self):
+        program = Program([Assign("A", GetInput([UInt32(1)])), Assign("B", AddOp(Var("A"), Value(UInt32(1))))])
+        context = a_context().with_program(program).build()
+        Interpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler()).run(context)
+        self.assertTrue(context.resolve_name("B").tainted is True)
+        self.assertEqual(Value(UInt32(2), True), context.resolve_name("B"))
+
+
+class LabelMemoryTest(unittest.TestCase):
+    def test_cells_keep_labels(self):
+        memory = Memory()
+        memory.set_value(UInt32(5), Value(UInt32(9), 2 ** 200))
+        memory.set_value(UInt32(6), Value(UInt32(9), True))
+        memory.set_taint(UInt32(5), 2 ** 100)
+        self.assertEqual(2 ** 200, memory.get_value(UInt32(5)).tainted)
+        self.assertTrue(memory.get_value(UInt32(6)).tainted is True)
+        self.assertEqual(2 ** 100, memory.get_taint(UInt32(5)))
+        fork = memory.fork()
+        fork.set_value(UInt32(5), Value(UInt32(9)))
+        fork.set_taint(UInt32(5), 0)
+        self.assertFalse(fork.get_value(UInt32(5)).tainted)
+        self.assertEqual(0, fork.get_taint(UInt32(5)))
+        self.assertEqual(2 ** 200, memory.get_value(UInt32(5)).tainted)
+        self.assertEqual(2 ** 100, memory.get_taint(UInt32(5)))
+
+    def test_clear_range_drops_labels(self):
+        memory = Memory()
+        memory.set_taint(UInt32(5), 8)
+        memory.taint_range(UInt32(4), UInt32(6))
+        self.assertEqual(9, memory.get_taint(UInt32(5)))
+        memory.clear_range(UInt32(0), UInt32(16))
+        self.assertEqual(0, memory.get_taint(UInt32(5)))
+
+    def test_snapshot(self):
+        memory = Memory()
+        memory.set_value(UInt32(5), Value(UInt32(9), 16))
+        memory.set_taint(UInt32(5), 32)
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            memory.snapshot(path)
+            restored = Memory()
+            restored.restore(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(Value(UInt32(9), 16), restored.get_value(UInt32(5)))
+        self.assertEqual(32, restored.get_taint(UInt32(5)))
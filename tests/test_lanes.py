@@ -0,0 +1,142 @@
+import unittest
+from symbolic_engine import (Program, Assign, AddOp, Value, GetInput, IF, Var, UInt32, DefaultTaintPolicy,
+                             DefaultTaintCheckHandler, MulOp, SubOp, EQ, GT, Store, Load, Goto, AttackException,
+                             TaintPolicy, TaintCheckHandler)
+from symbolic_engine import lanes
+from symbolic_engine.labels import LabelTaintPolicy, LabelTaintCheckHandler
+
+
+def branching_program():
+    the_input = GetInput([])
+    return Program([
+        Assign("X", MulOp(Value(UInt32(2)), the_input)),
+        IF(EQ(SubOp(Var("X"), Value(UInt32(5))), Value(UInt32(15))), Value(UInt32(2)), Value(UInt32(4))),
+        Assign("Y", Value(UInt32(1))),
+        Goto(Value(UInt32(5))),
+        Assign("Y", AddOp(Value(UInt32(3)), Var("X"))),
+        Store(Var("Y"), Var("X")),
+        Assign("Z", Load(AddOp(Value(UInt32(3)), Var("X")))),
+        IF(GT(Var("Y"), the_input), Value(UInt32(9)), Value(UInt32(8))),
+        Assign("W", SubOp(Value(UInt32(0)), Value(UInt32(1))))
+    ])
+
+
+class UntaintedInputs(TaintPolicy):
+    def input_policy(self, src):
+        return False
+
+    def goto_check(self, v1):
+        return not v1.isTainted()
+
+    def tainted_address(self, address, value):
+        return value.isTainted()
+
+
+@unittest.skipIf(lanes.numpy is None, "NumPy is not installed")
+class LaneInterpreterTest(unittest.TestCase):
+    def run_lanes(self, inputs, policy=None, handler=None):
+        interpreter = lanes.LaneInterpreter(policy or DefaultTaintPolicy(), handler or DefaultTaintCheckHandler())
+        return interpreter.run(branching_program(), inputs)
+
+    def expected(self, x, y):
+        X = (2 * x) & 0xffffffff
+        Y = 1 if X - 5 == 15 else (3 + X) & 0xffffffff
+        variables = {"X": X, "Y": Y, "Z": X if Y == (3 + X) & 0xffffffff else 0}
+        if not Y > y:
+            variables["W"] = 0xffffffff
+        return variables
+
+    def test_lanes_match_scalar_semantics(self):
+        inputs = [[x, y] for x in (0, 10, 7, 2 ** 31 + 1) for y in (0, 5, 2 ** 32 - 1)]
+        results = self.run_lanes(inputs)
+        self.assertEqual(len(inputs), len(results))
+        self.assertEqual({}, results.errors)
+        for lane, (x, y) in enumerate(inputs):
+            variables = results.lane_variables(lane)
+            expected = self.expected(x, y)
+            self.assertEqual(sorted(expected), sorted(variables))
+            for name, value in expected.iteritems():
+                self.assertEqual(UInt32(value), variables[name].value)
+            self.assertEqual(9, results.pc[lane])
+            self.assertTrue(variables["X"].isTainted())
+            self.assertEqual(1 if x != 10 else 0, results.memory.get_taint(lane, variables["Y"].value))
+
+    def test_taint_policy(self):
+        results = self.run_lanes([[10, 0], [3, 0]], UntaintedInputs())
+        self.assertFalse(results.lane_variables(0)["X"].isTainted())
+        self.assertEqual(0, results.memory.get_taint(1, 9))
+        self.assertEqual(Value(UInt32(6)), results.memory.get_value(1, 9))
+
+    def test_lane_errors_stop_only_their_lane(self):
+        results = self.run_lanes([[10, 0], [3], [4]])
+        self.assertEqual([1, 2], sorted(results.errors))
+        self.assertTrue(isinstance(results.errors[1], IndexError))
+        self.assertEqual(7, results.pc[1])
+        self.assertEqual(9, results.pc[0])
+
+    def test_error_on_one_side_of_an_if(self):
+        program = Program([
+            Assign("A", GetInput([])),
+            IF(EQ(Var("A"), Value(UInt32(0))), Value(UInt32(2)), Var("B")),
+            Assign("C", Value(UInt32(1)))
+        ])
+        interpreter = lanes.LaneInterpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler())
+        results = interpreter.run(program, [[0], [1], [0]])
+        self.assertEqual([1], sorted(results.errors))
+        self.assertTrue(isinstance(results.errors[1], KeyError))
+        self.assertEqual([3, 1, 3], list(results.pc))
+        self.assertEqual(Value(UInt32(1)), results.lane_variables(2)["C"])
+
+    def test_goto_check(self):
+        program = Program([Goto(GetInput([]))])
+        interpreter = lanes.LaneInterpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler())
+        results = interpreter.run(program, [[5], [7]])
+        self.assertTrue(all(isinstance(error, AttackException) for error in results.errors.values()))
+        interpreter = lanes.LaneInterpreter(DefaultTaintPolicy(), TaintCheckHandler())
+        self.assertEqual([5, 7], list(interpreter.run(program, [[5], [7]]).pc))
+
+    def test_overridden_checks_are_asked_per_lane(self):
+        class CountingPolicy(DefaultTaintPolicy):
+            checks = 0
+
+            def goto_check(self, v1):
+                self.checks += 1
+                return True
+
+        policy = CountingPolicy()
+        program = Program([Goto(GetInput([]))])
+        results = lanes.LaneInterpreter(policy, DefaultTaintCheckHandler()).run(program, [[5], [7]])
+        self.assertEqual(2, policy.checks)
+        self.assertEqual({}, results.errors)
+        self.assertEqual([True, False], DefaultTaintPolicy().goto_check_lanes([1, 2], [False, True]))
+
+    def test_labels(self):
+        program = Program([
+            Assign("A", GetInput([], "a")),
+            Assign("B", GetInput([], "b")),
+            IF(EQ(Var("B"), Value(UInt32(0))), Value(UInt32(3)), Value(UInt32(4))),
+            Goto(AddOp(Var("A"), Value(UInt32(2)))),
+            Goto(AddOp(Var("A"), Var("B")))
+        ])
+        policy = LabelTaintPolicy()
+        handler = LabelTaintCheckHandler(policy, fatal=False)
+        results = lanes.LaneInterpreter(policy, handler).run(program, {"a": [[3], [3]], "b": [[0], [2]]})
+        self.assertEqual([(3, ['a']), (4, ['a', 'b'])], sorted(handler.attributions))
+        self.assertEqual(policy.registry.label("b"), results.lane_variables(1)["B"].tainted)
+        self.assertEqual([5, 5], list(results.pc))
+
+    def test_wide_labels(self):
+        policy = LabelTaintPolicy()
+        for index in range(70):
+            policy.registry.label("input%d" % index)
+        program = Program([Assign("A", GetInput([], "a")), Store(Value(UInt32(9)), AddOp(Var("A"), GetInput([])))])
+        results = lanes.LaneInterpreter(policy, LabelTaintCheckHandler(policy)).run(program, {"a": [[1], [2]],
+                                                                                              "default": [[0], [0]]})
+        mask = policy.registry.mask(["a", "default"])
+        self.assertTrue(mask >= 2 ** 64)
+        self.assertEqual(Value(UInt32(2), mask), results.memory.get_value(1, 9))
+
+    def test_generic_policy_hooks(self):
+        policy = UntaintedInputs()
+        self.assertEqual([True, False], policy.goto_check_lanes([1, 2], [False, True]))
+        self.assertEqual([False, True], policy.tainted_address_lanes([1, 2], [True, False], [3, 4], [False, True]))
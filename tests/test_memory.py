@@ -0,0 +1,188 @@
+import os
+import pickle
+import struct
+import tempfile
+import unittest
+from symbolic_engine import Context, Memory, MemoryPage, Value, UInt32, SymInput, AddOp
+
+
+class MemoryPageTest(unittest.TestCase):
+    def setUp(self):
+        self.page = MemoryPage(4096, 0x1000)
+
+    def test_round_trip(self):
+        self.page.set_value(0x1000, Value(UInt32(7), tainted=True))
+        self.page.set_value(0x1001, Value(UInt32(2 ** 32 - 1)))
+        self.page.set_value(0x1002, Value(1))
+        symbolic = AddOp(SymInput("s_1"), Value(UInt32(1)))
+        self.page.set_value(0x1003, symbolic)
+        self.assertEqual(Value(UInt32(7), tainted=True), self.page.get_value(0x1000))
+        self.assertEqual(UInt32(2 ** 32 - 1), self.page.get_value(0x1001).value)
+        self.assertFalse(self.page.get_value(0x1001).isTainted())
+        self.assertTrue(self.page.get_value(0x1002).value.__class__ is int)
+        self.assertTrue(self.page.get_value(0x1003) is symbolic)
+        self.page.set_value(0x1003, Value(UInt32(3)))
+        self.assertEqual(UInt32(3), self.page.get_value(0x1003).value)
+        self.assertEqual(0, self.page.get_value(0x1fff).value)
+
+    def test_taint_shadow(self):
+        self.page.set_taint(0x1009, 1)
+        self.assertEqual(1, self.page.get_taint(0x1009))
+        self.assertEqual(0, self.page.get_taint(0x1008))
+        self.page.set_taint(0x1009, 0)
+        self.assertEqual(0, self.page.get_taint(0x1009))
+
+    def test_footprint(self):
+        pointer_lists = 2 * 8 * self.page.size
+        self.assertTrue(self.page.nbytes() * 10 < pointer_lists)
+        self.page.set_value(0x1000, Value(UInt32(2 ** 20)))
+        self.assertTrue(self.page.nbytes() * 3 < pointer_lists)
+
+    def test_copy_is_independent(self):
+        self.page.set_value(0x1000, Value(UInt32(1)))
+        copy = self.page.copy(object())
+        copy.set_value(0x1000, Value(UInt32(2 ** 31)))
+        copy.set_taint(0x1000, 1)
+        self.assertEqual(UInt32(1), self.page.get_value(0x1000).value)
+        self.assertEqual(0, self.page.get_taint(0x1000))
+        self.assertEqual(UInt32(2 ** 31), copy.get_value(0x1000).value)
+
+
+class LazyMemoryTest(unittest.TestCase):
+    def test_reads_do_not_allocate(self):
+        memory = Memory()
+        for address in range(0, 64 * memory.page_size, 512):
+            self.assertEqual(0, memory.get_value(UInt32(address)).value)
+            self.assertEqual(0, memory.get_taint(UInt32(address)))
+        self.assertEqual(0, memory.get_page_numbers())
+        counters = memory.get_page_counters()
+        self.assertEqual(0, counters['allocated'])
+        self.assertEqual(2 * 64 * 8, counters['touched_for_read'])
+
+    def test_writes_allocate_once(self):
+        memory = Memory()
+        memory.set_value(UInt32(0x2000), Value(UInt32(1)))
+        memory.set_taint(UInt32(0x2001), 1)
+        self.assertEqual(1, memory.get_page_numbers())
+        self.assertEqual({'allocated': 1, 'touched_for_read': 0, 'touched_for_write': 2}, memory.get_page_counters())
+        fork = memory.fork()
+        fork.set_value(UInt32(0x2000), Value(UInt32(2)))
+        self.assertEqual(2, fork.get_page_counters()['allocated'])
+        self.assertEqual(0, memory.zero_page.get_value(0).value)
+
+
+class TaintRangeTest(unittest.TestCase):
+    def setUp(self):
+        self.memory = Memory(page_size=64)
+
+    def test_bulk_taint(self):
+        self.memory.taint_range(UInt32(100), UInt32(100 + 64 * 1024))
+        self.assertEqual(0, self.memory.get_page_numbers())
+        self.assertEqual(1, self.memory.get_taint(UInt32(100)))
+        self.assertEqual(0, self.memory.get_taint(UInt32(99)))
+        self.assertTrue(self.memory.any_tainted(0, 101))
+        self.assertFalse(self.memory.any_tainted(0, 100))
+        self.memory.clear_range(200, 300)
+        self.assertFalse(self.memory.any_tainted(200, 300))
+        self.assertEqual([(100, 200), (300, 100 + 64 * 1024)], list(self.memory.tainted_intervals()))
+
+    def test_mixes_with_cell_shadow(self):
+        self.memory.set_taint(UInt32(10), 1)
+        self.memory.set_taint(UInt32(11), 1)
+        self.memory.set_taint(UInt32(130), 1)
+        self.memory.taint_range(12, 20)
+        self.assertEqual([(10, 20), (130, 131)], list(self.memory.tainted_intervals()))
+        self.assertEqual([(15, 20)], list(self.memory.tainted_intervals(15, 100)))
+        self.assertTrue(self.memory.any_tainted(125, 135))
+        self.memory.set_taint(UInt32(15), 0)
+        self.assertEqual(0, self.memory.get_taint(UInt32(15)))
+        self.memory.clear_range(0, 129)
+        self.assertEqual([(130, 131)], list(self.memory.tainted_intervals()))
+        self.assertEqual(0, self.memory.get_taint(UInt32(10)))
+
+    def test_fork_copies_on_write(self):
+        self.memory.taint_range(0, 10)
+        self.memory.set_taint(UInt32(70), 1)
+        fork = self.memory.fork()
+        fork.clear_range(0, 100)
+        self.assertFalse(fork.any_tainted(0, 100))
+        self.assertEqual([(0, 10), (70, 71)], list(self.memory.tainted_intervals()))
+        untouched = self.memory.fork()
+        untouched.clear_range(200, 300)
+        self.assertTrue(untouched.pages[1] is self.memory.pages[1])
+
+    def test_context_range_taint(self):
+        context = Context(self.memory, {}, UInt32(0), None)
+        context.set_mem_range_taint(UInt32(0), UInt32(8), True)
+        self.assertTrue(context.is_mem_range_tainted(UInt32(4), UInt32(5)))
+        self.assertTrue(context.get_mem_address_taint(UInt32(7)))
+        context.set_mem_range_taint(UInt32(0), UInt32(8), False)
+        self.assertFalse(context.is_mem_range_tainted(UInt32(0), UInt32(8)))
+
+
+class MappedMemoryTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.image = tempfile.mkstemp()
+        os.write(handle, struct.pack('<7I', *range(1, 8)) + '\x00' * 4 + struct.pack('<I', 2 ** 32 - 1))
+        os.close(handle)
+        handle, self.snapshot = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.image)
+        os.remove(self.snapshot)
+
+    def test_map_words(self):
+        memory = Memory(page_size=4)
+        self.assertEqual(3, memory.map_file(self.image, 0x100, word_size=4))
+        self.assertEqual(UInt32(1), memory.get_value(UInt32(0x100)).value)
+        self.assertEqual(UInt32(7), memory.get_value(UInt32(0x106)).value)
+        self.assertEqual(UInt32(2 ** 32 - 1), memory.get_value(UInt32(0x108)).value)
+        self.assertEqual(0, memory.get_value(UInt32(0x109)).value)
+        self.assertEqual(0, memory.get_taint(UInt32(0x100)))
+        self.assertEqual(0, memory.get_page_counters()['allocated'])
+
+    def test_map_bytes_at_offset(self):
+        memory = Memory(page_size=8)
+        self.assertEqual(1, memory.map_file(self.image, 0, offset=4, length=8))
+        self.assertEqual([2, 0, 0, 0, 3, 0, 0, 0], [memory.get_value(UInt32(address)).value for address in range(8)])
+        self.assertRaises(Exception, memory.map_file, self.image, 3)
+
+    def test_write_copies_mapped_page(self):
+        memory = Memory(page_size=4)
+        memory.map_file(self.image, 0, word_size=4)
+        fork = memory.fork()
+        fork.set_value(UInt32(1), Value(UInt32(20), tainted=True))
+        self.assertEqual(UInt32(2), memory.get_value(UInt32(1)).value)
+        self.assertEqual(Value(UInt32(20), tainted=True), fork.get_value(UInt32(1)))
+        self.assertEqual(UInt32(3), fork.get_value(UInt32(2)).value)
+        self.assertEqual(1, fork.get_page_counters()['allocated'])
+
+    def test_snapshot_keeps_only_dirty_pages(self):
+        memory = Memory(page_size=4)
+        memory.map_file(self.image, 0, word_size=4)
+        memory.set_value(UInt32(5), Value(UInt32(60), tainted=True))
+        memory.set_value(UInt32(0x40), Value(UInt32(2 ** 20)))
+        memory.set_taint(UInt32(0x41), 1)
+        memory.taint_range(0x1000, 0x2000)
+        symbolic = AddOp(SymInput("s_1"), Value(UInt32(1)))
+        memory.set_value(UInt32(0x42), symbolic)
+        self.assertEqual(2, memory.snapshot(self.snapshot))
+
+        restored = Memory(page_size=4)
+        restored.map_file(self.image, 0, word_size=4)
+        self.assertEqual(2, restored.restore(self.snapshot))
+        self.assertEqual(UInt32(1), restored.get_value(UInt32(0)).value)
+        self.assertEqual(Value(UInt32(60), tainted=True), restored.get_value(UInt32(5)))
+        self.assertEqual(UInt32(7), restored.get_value(UInt32(6)).value)
+        self.assertEqual(UInt32(2 ** 20), restored.get_value(UInt32(0x40)).value)
+        self.assertEqual(1, restored.get_taint(UInt32(0x41)))
+        self.assertEqual([(0x41, 0x42), (0x1000, 0x2000)], list(restored.tainted_intervals()))
+        self.assertEqual(str(symbolic), str(restored.get_value(UInt32(0x42))))
+        self.assertRaises(Exception, Memory(page_size=8).restore, self.snapshot)
+
+    def test_pickle_remaps(self):
+        memory = Memory(page_size=4)
+        memory.map_file(self.image, 0, word_size=4)
+        copy = pickle.loads(pickle.dumps(memory, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(UInt32(5), copy.get_value(UInt32(4)).value)
@@ -0,0 +1,193 @@
+import unittest
+from symbolic_engine import (Program, Assign, AddOp, Value, GetInput, IF, Goto, Store, Load, Var, UInt32, EQ, GT,
+                             Or, Ite, Not, SymTrue, SymFalse, Simplifier, SymbolFactory, Memory, Context,
+                             DefaultTaintPolicy, DefaultTaintCheckHandler, IdProvider)
+from symbolic_engine.explorer import Explorer
+from symbolic_engine.merging import (MergingExplorer, MergeHeuristic, SegmentInterpreter, guards, differences,
+                                     merge_contexts)
+from symbolic_engine.slicing import inputs_of
+from symbolic_engine.solver import evaluate, conjuncts
+from test_explorer import diamond_program
+from test_taint import a_context
+
+
+def diamond_loop(iterations):
+    return Program([
+        Assign("I", Value(UInt32(0))),
+        Assign("S", Value(UInt32(0))),
+        IF(EQ(Var("I"), Value(UInt32(iterations))), Value(UInt32(11)), Value(UInt32(3))),
+        Assign("X", GetInput([])),
+        IF(GT(Var("X"), Value(UInt32(5))), Value(UInt32(5)), Value(UInt32(7))),
+        Assign("Y", Value(UInt32(1))),
+        Goto(Value(UInt32(8))),
+        Assign("Y", Value(UInt32(2))),
+        Assign("S", AddOp(Var("S"), Var("Y"))),
+        Assign("I", AddOp(Var("I"), Value(UInt32(1)))),
+        Goto(Value(UInt32(2))),
+        Store(Value(UInt32(64)), Var("S"))
+    ])
+
+
+def merged_address(last):
+    """A is 100 or 200 depending on the input when the paths meet at 5, where last runs"""
+    return Program([
+        Assign("X", GetInput([])),
+        IF(GT(Var("X"), Value(UInt32(5))), Value(UInt32(2)), Value(UInt32(4))),
+        Assign("A", Value(UInt32(100))),
+        Goto(Value(UInt32(5))),
+        Assign("A", Value(UInt32(200))),
+        last
+    ])
+
+
+class IteOrTest(unittest.TestCase):
+    def setUp(self):
+        self.factory = SymbolFactory()
+        self.simplifier = Simplifier(self.factory)
+        self.x = self.factory.input("x")
+        self.cond = self.factory.binop(GT, self.x, Value(UInt32(5)))
+
+    def test_simplifications(self):
+        simplifier = self.simplifier
+        one, two = Value(UInt32(1)), Value(UInt32(2))
+        self.assertTrue(simplifier.disj(self.cond, simplifier.negate(self.cond)) is SymTrue)
+        self.assertTrue(simplifier.disj(SymFalse, self.cond) is self.cond)
+        self.assertTrue(simplifier.disj(self.cond, self.cond) is self.cond)
+        self.assertTrue(isinstance(simplifier.disj(self.cond, self.x), Or))
+        self.assertEqual(one, simplifier.ite(SymTrue, one, two))
+        self.assertEqual(two, simplifier.ite(Value(UInt32(0)), one, two))
+        self.assertTrue(simplifier.ite(self.cond, self.x, self.x) is self.x)
+        ite = simplifier.ite(self.cond, one, two)
+        self.assertTrue(isinstance(ite, Ite))
+        self.assertTrue(ite is simplifier.ite(self.cond, Value(UInt32(1)), Value(UInt32(2))))
+
+    def test_evaluate(self):
+        ite = self.simplifier.ite(self.cond, Value(UInt32(1)), self.x)
+        self.assertEqual(1, evaluate(ite, {'x': 9}))
+        self.assertEqual(3, evaluate(ite, {'x': 3}))
+        disjunction = self.factory.disj(self.cond, self.factory.binop(EQ, self.x, Value(UInt32(0))))
+        self.assertEqual(1, evaluate(disjunction, {'x': 0}))
+        self.assertEqual(0, evaluate(disjunction, {'x': 4}))
+        self.assertEqual(frozenset(['x', 'y']), inputs_of(self.factory.ite(self.cond, self.factory.input("y"),
+                                                                            Value(UInt32(0)))))
+        self.assertEqual([disjunction], conjuncts(disjunction))
+
+
+class MergeTest(unittest.TestCase):
+    def setUp(self):
+        self.simplifier = Simplifier(SymbolFactory())
+        self.cond = self.simplifier.factory.binop(GT, self.simplifier.factory.input("x"), Value(UInt32(5)))
+
+    def test_guards(self):
+        simplifier = self.simplifier
+        common = simplifier.factory.binop(EQ, simplifier.factory.input("y"), Value(UInt32(1)))
+        first = simplifier.conj(simplifier.conj(SymTrue, common), self.cond)
+        second = simplifier.conj(simplifier.conj(SymTrue, common), simplifier.negate(self.cond))
+        self.assertEqual(([common], [self.cond], [simplifier.negate(self.cond)]), guards(first, second, simplifier))
+        self.assertEqual(None, guards(first, first, simplifier))
+
+    def test_merge_contexts(self):
+        first = Context(Memory(), {"A": Value(UInt32(1)), "B": Value(UInt32(7))}, 4, None)
+        second = first.fork()
+        second.variables["A"] = Value(UInt32(2))
+        second.memory.set_value(UInt32(8), Value(UInt32(3)))
+        second.memory.set_taint(UInt32(9), 1)
+        changes = differences(first, second)
+        self.assertEqual([('variable', 'A', Value(UInt32(1)), Value(UInt32(2))),
+                          ('memory', 8, Value(UInt32(0)), Value(UInt32(3)))], changes)
+        self.assertEqual(4, MergeHeuristic().cost(changes))
+        merged = merge_contexts(first, second, self.cond, changes, self.simplifier)
+        for x, a, cell in ((9, 1, 0), (2, 2, 3)):
+            self.assertEqual(a, evaluate(merged.resolve_name("A"), {'x': x}))
+            self.assertEqual(cell, evaluate(merged.get_mem_value(UInt32(8)), {'x': x}))
+        self.assertEqual(Value(UInt32(7)), merged.resolve_name("B"))
+        self.assertTrue(merged.get_mem_address_taint(UInt32(9)))
+        self.assertEqual(Value(UInt32(1)), first.resolve_name("A"))
+        second.variables["C"] = Value(UInt32(0))
+        self.assertEqual(None, differences(first, second))
+
+
+    def test_merged_taint(self):
+        first = Context(Memory(), {"A": Value(UInt32(1), True), "B": Value(UInt32(1))}, 4, None)
+        second = first.fork()
+        second.variables["A"] = Value(UInt32(2), 4)
+        second.variables["B"] = Value(UInt32(2))
+        merged = merge_contexts(first, second, self.cond, differences(first, second), self.simplifier)
+        self.assertEqual(5, merged.resolve_name("A").tainted)
+        self.assertTrue(merged.resolve_name("A").isTainted())
+        self.assertFalse(merged.resolve_name("B").isTainted())
+
+    def test_memory_differences(self):
+        first = Context(Memory(page_size=256), {}, 0, None)
+        first.memory.set_value(UInt32(3), Value(UInt32(1)))
+        first.memory.set_value(UInt32(600), Value(UInt32(5)))
+        second = first.fork()
+        second.memory.set_value(UInt32(3), Value(UInt32(1)))
+        second.memory.set_value(UInt32(4), Value(UInt32(2 ** 20)))
+        second.memory.set_value(UInt32(200), Value(UInt32(1), 4))
+        second.memory.set_value(UInt32(201), Value(1))
+        x = SymbolFactory().input("x")
+        second.memory.set_value(UInt32(300), x)
+        first.memory.set_value(UInt32(600), Value(UInt32(6)))
+        changes = differences(first, second)
+        self.assertEqual([4, 200, 201, 300, 600], [key for _, key, _, _ in changes])
+        self.assertEqual(('memory', 300, Value(UInt32(0)), x), changes[3])
+        self.assertEqual(('memory', 200, Value(UInt32(0)), Value(UInt32(1), 4)), changes[1])
+
+
+class MergingExplorerTest(unittest.TestCase):
+    def explore(self, program, **kwargs):
+        explorer = MergingExplorer(DefaultTaintPolicy(), DefaultTaintCheckHandler(), **kwargs)
+        return explorer, list(explorer.explore(a_context().with_program(program).build()))
+
+    def test_diamond(self):
+        explorer, results = self.explore(diamond_program())
+        self.assertEqual(1, explorer.merges)
+        self.assertEqual(2, len(results))
+        self.assertTrue(all(result.exception is None and result.summary['pc'] == 6 for result in results))
+        self.assertTrue(all('ite(' in result.summary['variables']['Y'][0] for result in results))
+
+    def test_loop(self):
+        iterations = 5
+        plain = list(Explorer(DefaultTaintPolicy(), DefaultTaintCheckHandler(), processes=0).explore(
+            a_context().with_program(diamond_loop(iterations)).build()))
+        self.assertEqual(2 ** iterations, len(plain))
+        explorer, results = self.explore(diamond_loop(iterations))
+        self.assertEqual(iterations, explorer.merges)
+        self.assertEqual(1, len(results))
+        self.assertEqual(None, results[0].exception)
+        self.assertEqual(12, results[0].summary['pc'])
+
+    def test_heuristic_refuses(self):
+        explorer, results = self.explore(diamond_loop(3), heuristic=MergeHeuristic(max_cost=1))
+        # only the states that agree on every value merge: 1 + 2 and 2 + 1 in the second iteration
+        self.assertEqual(2, explorer.merges)
+        self.assertEqual(6, len(results))
+
+    def test_merged_words(self):
+        for last in (Store(Var("A"), Value(UInt32(1))), Assign("B", Load(AddOp(Var("A"), Value(UInt32(1)))))):
+            plain = list(Explorer(DefaultTaintPolicy(), DefaultTaintCheckHandler(), processes=0).explore(
+                a_context().with_program(merged_address(last)).build()))
+            self.assertEqual([None, None], [result.exception for result in plain])
+            explorer, results = self.explore(merged_address(last))
+            self.assertEqual(1, explorer.merges)
+            self.assertEqual([None], [result.exception for result in results])
+            self.assertEqual(plain[0].summary['pages'], results[0].summary['pages'])
+        explorer, results = self.explore(merged_address(Goto(Var("A"))))
+        self.assertEqual([None, None], [result.exception for result in results])
+        self.assertEqual([100, 200], sorted(result.summary['pc'] for result in results))
+
+    def test_split_words(self):
+        interpreter = SegmentInterpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler(), IdProvider())
+        simplifier = interpreter.simplifier
+        cond = simplifier.binop(GT, simplifier.factory.input("x"), Value(UInt32(5)))
+        context = Context(Memory(), {"A": simplifier.ite(cond, Value(UInt32(100)), Value(UInt32(200), True))}, 0,
+                          Program([Store(Var("A"), Value(UInt32(7))), Assign("B", Load(Var("A")))]))
+        interpreter.run_segment(context, set())
+        for x, cell in ((9, 100), (2, 200)):
+            self.assertEqual(7, evaluate(context.get_mem_value(UInt32(cell)), {'x': x}))
+            self.assertEqual(0, evaluate(context.get_mem_value(UInt32(300 - cell)), {'x': x}))
+            self.assertEqual(7, evaluate(context.resolve_name("B"), {'x': x}))
+        self.assertFalse(context.get_mem_address_taint(UInt32(100)))
+        self.assertTrue(context.get_mem_address_taint(UInt32(200)))
+        self.assertEqual([], interpreter.pending)
@@ -0,0 +1,84 @@
+import os
+import pstats
+import tempfile
+import unittest
+from symbolic_engine import (DefaultTaintPolicy, TaintCheckHandler, Interpreter, ConcolicInterpreter, IdProvider)
+from symbolic_engine.compiler import CompiledInterpreter
+from symbolic_engine.profiling import Profile
+from test_taint import a_context
+from test_trace import traced_program
+
+
+class ProfileTest(unittest.TestCase):
+    def run_profiled(self, interpreter, runs=1, program=traced_program):
+        interpreter.profile = Profile()
+        for _ in range(runs):
+            interpreter.run(a_context().with_program(program()).build())
+        return interpreter.profile
+
+    def test_counters(self):
+        profile = self.run_profiled(Interpreter(DefaultTaintPolicy(), TaintCheckHandler()), runs=2)
+        self.assertEqual(2, profile.runs)
+        self.assertEqual({0: 2, 1: 2, 2: 2, 3: 2, 4: 2}, dict(profile.pc_counts))
+        self.assertEqual({'assign_rule': 4, 'eval_if': 2, 'store_rule': 2, 'goto_rule': 2},
+                         dict(profile.rule_counts))
+        self.assertEqual({'Value': 12, 'Var': 6, 'GetInput': 2, 'MulOp': 2, 'EQ': 2, 'AddOp': 2},
+                         dict(profile.expression_counts))
+        self.assertEqual(2, profile.page_counters['allocated'])
+        self.assertEqual(0, profile.solver_queries)
+
+    def test_compiled_counters_match(self):
+        expected = self.run_profiled(Interpreter(DefaultTaintPolicy(), TaintCheckHandler()))
+        profile = self.run_profiled(CompiledInterpreter(DefaultTaintPolicy(), TaintCheckHandler()))
+        self.assertEqual(expected.pc_counts, profile.pc_counts)
+        self.assertEqual(expected.rule_counts, profile.rule_counts)
+        self.assertEqual(expected.expression_counts, profile.expression_counts)
+
+    def test_overridden_evaluation(self):
+        class RecordingInterpreter(Interpreter):
+            patched = False
+
+            def eval_var(self, expression, context):
+                self.patched |= 'eval_expression' in self.__dict__
+                return super(RecordingInterpreter, self).eval_var(expression, context)
+
+        class CompiledRecordingInterpreter(CompiledInterpreter, RecordingInterpreter):
+            pass
+
+        expected = self.run_profiled(Interpreter(DefaultTaintPolicy(), TaintCheckHandler()))
+        for interpreter_class in (RecordingInterpreter, CompiledRecordingInterpreter):
+            interpreter = interpreter_class(DefaultTaintPolicy(), TaintCheckHandler())
+            profile = self.run_profiled(interpreter)
+            self.assertFalse(interpreter.patched)
+            self.assertEqual(expected.expression_counts, profile.expression_counts)
+
+    def test_solver_time(self):
+        def symbolic_program():
+            program = traced_program()
+            # without a concrete input the branch on it is decided by the solver
+            del program.stmts[0].expression.right.source[:]
+            return program
+
+        profile = self.run_profiled(ConcolicInterpreter(DefaultTaintPolicy(), TaintCheckHandler(), IdProvider()),
+                                    program=symbolic_program)
+        self.assertEqual(1, profile.solver_queries)
+        self.assertTrue(profile.solver_time >= 0)
+        self.assertTrue("solver: 1 queries" in profile.report())
+
+    def test_pstats_export(self):
+        profile = self.run_profiled(Interpreter(DefaultTaintPolicy(), TaintCheckHandler()))
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            profile.dump_stats(path)
+            stats = pstats.Stats(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(5 + 4 + 6, len(stats.stats))
+        self.assertEqual(2, stats.stats[('<rule>', 0, 'assign_rule')][1])
+
+    def test_disabled(self):
+        interpreter = Interpreter(DefaultTaintPolicy(), TaintCheckHandler())
+        interpreter.run(a_context().with_program(traced_program()).build())
+        self.assertTrue(interpreter.profile is None)
+        self.assertFalse('eval_expression' in interpreter.__dict__)
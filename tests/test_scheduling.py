@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+import unittest
+from symbolic_engine import Value, UInt32, DefaultTaintPolicy, DefaultTaintCheckHandler, IdProvider
+from symbolic_engine.explorer import Explorer, ExplorationInterpreter
+from symbolic_engine.scheduling import (DFSScheduler, BFSScheduler, RandomPathScheduler, CoverageScheduler,
+                                        Frontier)
+from test_explorer import diamond_program
+from test_merging import diamond_loop
+from test_taint import a_context
+
+
+class FakeContext(object):
+    def __init__(self, pc):
+        self.pc = pc
+        self.program = None
+
+
+class FakeState(object):
+    def __init__(self, name, pc=0, depth=0, jump=None):
+        self.name = name
+        self.context = FakeContext(pc)
+        self.depth = depth
+        self.jump = jump
+
+
+def drain(scheduler):
+    return [scheduler.pop().name for _ in range(len(scheduler))]
+
+
+class SchedulerTest(unittest.TestCase):
+    def fill(self, scheduler):
+        for index in range(4):
+            scheduler.push(FakeState(index, pc=index, depth=index))
+        return scheduler
+
+    def test_dfs_and_bfs(self):
+        self.assertEqual([3, 2, 1, 0], drain(self.fill(DFSScheduler())))
+        self.assertEqual([0, 1, 2, 3], drain(self.fill(BFSScheduler())))
+        self.assertEqual([0], [state.name for state in self.fill(DFSScheduler()).evict(1)])
+        self.assertEqual([3], [state.name for state in self.fill(BFSScheduler()).evict(1)])
+
+    def test_random_path(self):
+        first = drain(self.fill(RandomPathScheduler(seed=3)))
+        self.assertEqual([0, 1, 2, 3], sorted(first))
+        self.assertEqual(first, drain(self.fill(RandomPathScheduler(seed=3))))
+        shallow = 0
+        for seed in range(200):
+            shallow += self.fill(RandomPathScheduler(seed)).pop().name == 0
+        self.assertTrue(shallow > 80)
+        scheduler = self.fill(RandomPathScheduler())
+        self.assertEqual([3, 2], [state.name for state in scheduler.evict(2)])
+        self.assertEqual(2, len(scheduler))
+
+    def test_coverage(self):
+        coverage = {0: 5, 1: 1, 2: 0, 3: 1}
+        scheduler = self.fill(CoverageScheduler(coverage))
+        self.assertEqual(2, scheduler.pop().name)
+        coverage[1] = 9
+        # the hits of pc 1 grew after it was pushed
+        self.assertEqual([3, 0, 1], drain(scheduler))
+        scheduler = CoverageScheduler({7: 0, 1: 3})
+        scheduler.push(FakeState('constant jump', pc=1, jump=Value(UInt32(7))))
+        scheduler.push(FakeState('at 1', pc=1))
+        self.assertEqual(['constant jump', 'at 1'], drain(scheduler))
+        scheduler = self.fill(CoverageScheduler(coverage))
+        self.assertEqual([0, 1], [state.name for state in scheduler.evict(2)])
+
+
+class FrontierTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_spill_and_reload(self):
+        frontier = Frontier(DFSScheduler(), max_resident=4, spill_directory=self.directory, batch=2)
+        for index in range(10):
+            frontier.push(FakeState(index))
+        self.assertEqual(10, len(frontier))
+        self.assertEqual(4, len(frontier.scheduler))
+        self.assertEqual(3, len(os.listdir(self.directory)))
+        self.assertEqual(range(9, -1, -1), [frontier.pop().name for _ in range(10)])
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_drop(self):
+        frontier = Frontier(BFSScheduler(), max_resident=2, batch=1)
+        for index in range(4):
+            frontier.push(FakeState(index))
+        self.assertEqual(2, frontier.dropped)
+        self.assertEqual([0, 1], drain(frontier))
+
+    def test_close(self):
+        frontier = Frontier(max_resident=1, spill_directory=self.directory)
+        for index in range(3):
+            frontier.push(FakeState(index))
+        frontier.close()
+        self.assertEqual([], os.listdir(self.directory))
+        self.assertEqual(1, len(frontier))
+
+
+class ScheduledExplorerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def explore(self, program, **kwargs):
+        explorer = Explorer(DefaultTaintPolicy(), DefaultTaintCheckHandler(), **kwargs)
+        return explorer, list(explorer.explore(a_context().with_program(program).build()))
+
+    def constraints(self, results):
+        return sorted(str(result.constraint) for result in results)
+
+    def test_every_scheduler_finds_every_path(self):
+        _, expected = self.explore(diamond_loop(3), processes=0)
+        self.assertEqual(8, len(expected))
+        for scheduler in (BFSScheduler, RandomPathScheduler, CoverageScheduler):
+            explorer, results = self.explore(diamond_loop(3), processes=0, scheduler=scheduler)
+            self.assertEqual(self.constraints(expected), self.constraints(results))
+        # a forked state resumes after the IF that forked it: 1 + 2 + 4 runs of the input IF
+        self.assertEqual(7, explorer.coverage[4])
+
+    def test_spilled_states_are_explored(self):
+        _, expected = self.explore(diamond_loop(3), processes=0)
+        explorer, results = self.explore(diamond_loop(3), processes=0, max_resident=1,
+                                         spill_directory=self.directory)
+        self.assertEqual(self.constraints(expected), self.constraints(results))
+        self.assertTrue(all(result.summary['pc'] == 12 for result in results))
+        self.assertEqual([], os.listdir(self.directory))
+
+    def test_dropped_states(self):
+        explorer, results = self.explore(diamond_loop(3), processes=0, max_resident=1)
+        self.assertTrue(explorer.frontier.dropped > 0)
+        self.assertTrue(len(results) < 8)
+
+    def test_process_pool(self):
+        explorer, results = self.explore(diamond_program(), processes=2, scheduler=CoverageScheduler)
+        self.assertEqual(4, len(results))
+        self.assertEqual(1, explorer.coverage[2])
+        self.assertEqual(2, explorer.coverage[4])
+
+    def test_counted_rules_keep_their_names(self):
+        interpreter = ExplorationInterpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler(), IdProvider(),
+                                             coverage={})
+        self.assertEqual('assign_rule', interpreter.rules['Assign'].__name__)
+        self.assertEqual('eval_if', interpreter.rules['IF'].__name__)
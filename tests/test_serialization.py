@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import unittest
+from symbolic_engine import (Program, Assign, Value, GetInput, UInt32, Interpreter, DefaultTaintPolicy,
+                             DefaultTaintCheckHandler, Store, Load, Goto, SymInput, AddOp, MulOp, EQ, IF, Var, BitVec8,
+                             BitVec64, bitvector_class)
+from symbolic_engine import serialization
+from symbolic_engine.compiler import CompiledInterpreter
+from test_taint import a_context
+
+
+def branching_program():
+    the_input = GetInput([UInt32(10), UInt32(7)])
+    return Program([
+        Assign("X", MulOp(Value(UInt32(2)), the_input)),
+        Assign("Y", Value(UInt32(100))),
+        IF(EQ(AddOp(Var("X"), Value(UInt32(5))), Value(UInt32(25))), Value(UInt32(3)), Value(UInt32(4))),
+        Assign("Y", AddOp(Value(UInt32(3)), Var("X"))),
+        IF(EQ(Var("Y"), AddOp(the_input, Value(UInt32(16)))), Value(UInt32(5)), Value(UInt32(6))),
+        Assign("Z", Var("X"))
+    ])
+
+
+class SerializationTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_program(self, program, interpreter_class=Interpreter):
+        interpreter = interpreter_class(DefaultTaintPolicy(), DefaultTaintCheckHandler())
+        return interpreter.run(a_context().with_program(program).build())
+
+    def assertSameRun(self, original, load):
+        expected = self.run_program(original)
+        for interpreter_class in (Interpreter, CompiledInterpreter):
+            context = self.run_program(load(), interpreter_class)
+            self.assertEqual(expected.pc, context.pc)
+            self.assertEqual(dict(expected.variables.iteritems()), dict(context.variables.iteritems()))
+
+    def test_round_trip(self):
+        data = serialization.dumps(branching_program())
+        copy = serialization.loads(data)
+        self.assertEqual(6, len(copy.stmts))
+        self.assertEqual([str(stmt) for stmt in branching_program().stmts], [str(stmt) for stmt in copy.stmts])
+        self.assertTrue(copy.stmts[0].expression.right is copy.stmts[4].e.right.left)
+        self.assertEqual([UInt32(10), UInt32(7)], copy.stmts[0].expression.right.source)
+        self.assertSameRun(branching_program(), lambda: serialization.loads(data))
+        self.assertEqual(data, serialization.dumps(serialization.loads(data)))
+
+    def test_memory_statements(self):
+        program = Program([
+            Store(Value(UInt32(8)), Value(5, tainted=True)),
+            Assign("X", Load(Value(UInt32(8)))),
+            Goto(Value(UInt32(3)))
+        ])
+        data = serialization.dumps(program)
+        self.assertEqual(Value(5, tainted=True), serialization.loads(data).stmts[0].value)
+        self.assertSameRun(program, lambda: serialization.loads(data))
+
+    def test_label_masks(self):
+        for tainted in (True, 4, 2 ** 40 | 2):
+            copy = serialization.loads(serialization.dumps(Program([Assign("X", Value(UInt32(1), tainted))])))
+            self.assertEqual(tainted, copy.stmts[0].expression.tainted)
+            self.assertEqual(type(tainted), type(copy.stmts[0].expression.tainted))
+
+    def test_widths(self):
+        numbers = [BitVec8(3), BitVec64(2 ** 40), BitVec64(2 ** 64 - 1), UInt32(2 ** 32 - 1), -1, int(2 ** 63 - 1), 7]
+        program = Program([Assign("X", AddOp(Value(number), GetInput([number]))) for number in numbers])
+        copy = serialization.loads(serialization.dumps(program))
+        for number, stmt in zip(numbers, copy.stmts):
+            for decoded in (stmt.expression.left.value, stmt.expression.right.source[0]):
+                self.assertEqual(number, decoded)
+                self.assertEqual(type(number), type(decoded))
+        self.assertRaises(Exception, serialization.dumps, Program([Assign("X", Value(2 ** 64))]))
+        self.assertRaises(Exception, serialization.dumps, Program([Assign("X", Value(bitvector_class(128)(1)))]))
+
+    def test_lazy_load(self):
+        path = os.path.join(self.directory, "diamond.prog")
+        serialization.dump(branching_program(), path)
+        image = serialization.load(path).stmts.image
+        self.assertTrue(all(node is None for node in image.nodes))
+        image.statement(1)
+        self.assertEqual(2, len([node for node in image.nodes if node is not None]))
+        self.assertSameRun(branching_program(), lambda: serialization.load(path))
+
+    def test_symbolic_nodes_are_refused(self):
+        self.assertRaises(Exception, serialization.dumps, Program([Assign("X", AddOp(SymInput("s_1"), Value(1)))]))
+
+    def test_cache(self):
+        cache = serialization.ProgramCache(os.path.join(self.directory, "cache"))
+        built = []
+
+        def build():
+            built.append(1)
+            return branching_program()
+
+        cache.get("branching source", build)
+        second = cache.get("branching source", build)
+        self.assertEqual(1, len(built))
+        self.assertTrue(isinstance(second.stmts, serialization.LazyStatements))
+        self.assertSameRun(branching_program(), lambda: cache.get("branching source", build))
+        cache.get("other source", build)
+        self.assertEqual(2, len(built))
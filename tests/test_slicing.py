@@ -0,0 +1,55 @@
+import unittest
+from symbolic_engine import Value, UInt32, AddOp, EQ, GT, SymbolFactory, Simplifier
+from symbolic_engine.slicing import independent_groups, UnionFind
+from symbolic_engine.solver import Solver, PythonBackend, SAT
+
+
+class CountingBackend(PythonBackend):
+    def __init__(self):
+        super(CountingBackend, self).__init__()
+        self.checked = []
+
+    def check(self):
+        self.checked.append(len([constraint for frame in self.frames for constraint in frame]))
+        return super(CountingBackend, self).check()
+
+
+class SlicingTest(unittest.TestCase):
+    def setUp(self):
+        factory = SymbolFactory()
+        self.simplifier = Simplifier(factory)
+        self.s = [factory.input("s_%d" % i) for i in range(1, 6)]
+        self.gt = lambda node, value: self.simplifier.binop(GT, node, Value(UInt32(value)))
+        self.constraints = [
+            self.gt(self.s[0], 1),
+            self.gt(self.simplifier.binop(AddOp, self.s[0], self.s[1]), 5),
+            self.gt(self.s[2], 3),
+            self.gt(self.s[3], 4),
+            self.simplifier.binop(EQ, self.s[3], self.s[4])
+        ]
+
+    def test_union_find(self):
+        sets = UnionFind()
+        sets.union("s_1", "s_2")
+        sets.union("s_3", "s_2")
+        self.assertEqual(sets.find("s_1"), sets.find("s_3"))
+        self.assertNotEqual(sets.find("s_1"), sets.find("s_4"))
+
+    def test_groups(self):
+        groups = sorted(independent_groups(self.constraints), key=len)
+        self.assertEqual([1, 2, 2], [len(group) for group in groups])
+
+    def test_only_relevant_group_is_solved(self):
+        backend = CountingBackend()
+        solver = Solver(backend)
+        for constraint in self.constraints:
+            solver.add(constraint)
+        self.assertEqual(SAT, solver.check())
+        self.assertEqual([1, 2, 2], sorted(backend.checked))
+        backend.checked = []
+        self.assertTrue(solver.may_be_true(self.gt(self.s[2], 10)))
+        # only s_3 > 3 and the new condition go to the backend
+        self.assertEqual([2], backend.checked)
+        backend.checked = []
+        self.assertEqual(SAT, solver.check())
+        self.assertEqual([], backend.checked)
@@ -0,0 +1,83 @@
+import unittest
+from symbolic_engine import (Program, Assign, Value, GetInput, IF, Var, UInt32, DefaultTaintPolicy,
+                             DefaultTaintCheckHandler, MulOp, SubOp, AddOp, EQ, GT, ConcolicInterpreter, IdProvider,
+                             SymbolFactory, Simplifier, SymTrue)
+from symbolic_engine.solver import Solver, PythonBackend, Z3Backend, QueryCache, SAT, UNSAT, evaluate, satisfies, z3
+from test_taint import a_context
+
+
+class SolverTestMixin(object):
+    def setUp(self):
+        self.factory = SymbolFactory()
+        self.simplifier = Simplifier(self.factory)
+        self.solver = Solver(self.backend(), factory=self.factory)
+        self.s_1 = self.factory.input("s_1")
+        self.s_2 = self.factory.input("s_2")
+
+    def const(self, value):
+        return Value(UInt32(value))
+
+    def test_bed_constraints(self):
+        two_s_1 = self.simplifier.binop(MulOp, self.const(2), self.s_1)
+        first = self.simplifier.binop(EQ, self.simplifier.binop(SubOp, two_s_1, self.const(5)), self.const(15))
+        second = self.simplifier.binop(GT, self.simplifier.binop(AddOp, two_s_1, self.const(3)),
+                                       self.simplifier.binop(SubOp, self.s_2, self.const(20)))
+        self.solver.add(first)
+        self.solver.push()
+        self.solver.add(second)
+        self.assertEqual(SAT, self.solver.check())
+        self.assertTrue(satisfies(self.solver.model(), [first, second]))
+        self.solver.add(self.simplifier.negate(second))
+        self.assertEqual(UNSAT, self.solver.check())
+        self.solver.pop()
+        self.solver.push()
+        self.solver.add(self.simplifier.negate(second))
+        self.assertEqual(SAT, self.solver.check())
+        self.assertTrue(evaluate(first, self.solver.model()))
+        self.assertFalse(evaluate(second, self.solver.model()))
+        self.solver.pop()
+        self.assertEqual(1, len(self.solver.assertions()))
+
+    def test_unsat(self):
+        self.solver.add(self.simplifier.binop(EQ, self.s_1, self.const(20)))
+        self.assertFalse(self.solver.may_be_true(self.simplifier.binop(EQ, self.s_1, self.const(21))))
+        self.assertTrue(self.solver.may_be_true(self.simplifier.binop(GT, self.s_1, self.const(19))))
+
+    def test_cache(self):
+        constraint = self.simplifier.binop(EQ, self.simplifier.binop(MulOp, self.const(3), self.s_1), self.const(9))
+        self.solver.add(constraint)
+        self.solver.check()
+        self.solver.check()
+        self.assertEqual(1, self.solver.cache_hits)
+        # the model found for the first query satisfies a weaker one
+        self.solver.reset()
+        self.solver.add(self.simplifier.binop(GT, self.s_1, self.const(2)))
+        self.assertEqual(SAT, self.solver.check())
+        self.assertEqual(2, self.solver.cache_hits)
+
+
+class PythonBackendTest(SolverTestMixin, unittest.TestCase):
+    def backend(self):
+        return PythonBackend()
+
+
+@unittest.skipIf(z3 is None, "z3 is not installed")
+class Z3BackendTest(SolverTestMixin, unittest.TestCase):
+    def backend(self):
+        return Z3Backend()
+
+
+class ConcolicSolverTest(unittest.TestCase):
+    def test_infeasible_branch_is_not_followed(self):
+        the_input = GetInput([])
+        program = Program([
+            Assign("X", the_input),
+            IF(EQ(Var("X"), Value(UInt32(20))), Value(UInt32(2)), Value(UInt32(4))),
+            IF(EQ(Var("X"), Value(UInt32(21))), Value(UInt32(3)), Value(UInt32(4))),
+            Assign("unreachable", Value(UInt32(1)))
+        ])
+        interpreter = ConcolicInterpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler(), IdProvider(),
+                                          solver=Solver(PythonBackend(), QueryCache()))
+        context = interpreter.run(a_context().with_program(program).build())
+        self.assertFalse("unreachable" in context.variables)
+        self.assertEqual("NOT ((s_1) == (21)) AND (s_1) == (20)", str(interpreter.constraints))
@@ -0,0 +1,202 @@
+import unittest
+from symbolic_engine import (Program, Assign, AddOp, Value, Interpreter, GetInput, Store, Load, Goto, IF, Var, EQ,
+                             UInt32, DefaultTaintPolicy, DefaultTaintCheckHandler, AttackException)
+from symbolic_engine.static_taint import (TaintAnalysis, TaintState, StaticTaintInterpreter, taint_analysis,
+                                          program_accesses)
+from test_taint import a_context
+
+
+class CountingPolicy(DefaultTaintPolicy):
+    def __init__(self):
+        self.calls = 0
+
+    def goto_check(self, v1):
+        self.calls += 1
+        return super(CountingPolicy, self).goto_check(v1)
+
+    def tainted_address(self, address, value):
+        self.calls += 1
+        return super(CountingPolicy, self).tainted_address(address, value)
+
+
+def clean_loop(iterations=4):
+    return Program([
+        Assign("I", Value(UInt32(0))),
+        Assign("I", AddOp(Var("I"), Value(UInt32(1)))),
+        Store(Var("I"), Var("I")),
+        IF(EQ(Var("I"), Value(UInt32(iterations))), Value(UInt32(5)), Value(UInt32(4))),
+        Goto(Value(UInt32(1))),
+        Assign("X", GetInput([UInt32(9)])),
+        Store(Value(UInt32(100)), Var("X")),
+        Store(Value(UInt32(101)), Value(UInt32(1))),
+        Assign("Y", Load(Value(UInt32(2)))),
+        Store(Var("X"), Var("Y")),
+        Store(Value(UInt32(102)), Value(UInt32(2))),
+        Goto(Value(UInt32(12)))
+    ])
+
+
+class TaintAnalysisTest(unittest.TestCase):
+    def test_clean_statements(self):
+        program = clean_loop()
+        analysis = TaintAnalysis(program)
+        self.assertEqual(set([2, 4, 11]), analysis.clean)
+        self.assertEqual(frozenset(["X"]), analysis.state_before(program, 6).variables)
+        self.assertFalse(analysis.state_before(program, 6).memory)
+        self.assertFalse(analysis.state_before(program, 6).shadow)
+        self.assertTrue(analysis.state_before(program, 7).memory)
+        self.assertTrue(analysis.state_before(program, 7).shadow)
+        self.assertEqual(frozenset(["X", "Y"]), analysis.state_before(program, 9).variables)
+        self.assertEqual(TaintState(), analysis.state_before(program, 0))
+
+    def test_entry_state(self):
+        # I is assigned an untainted constant before it is used
+        analysis = TaintAnalysis(clean_loop(), TaintState(frozenset(["I"])))
+        self.assertEqual(set([2, 4, 11]), analysis.clean)
+        analysis = TaintAnalysis(clean_loop(), TaintState(shadow=True))
+        self.assertEqual(set([4, 11]), analysis.clean)
+
+    def test_computed_jump(self):
+        program = Program([
+            Assign("A", Value(UInt32(3))),
+            Goto(Var("A")),
+            Assign("B", GetInput([UInt32(1)])),
+            Store(Value(UInt32(1)), Var("B")),
+            Goto(Var("B"))
+        ])
+        analysis = TaintAnalysis(program)
+        self.assertEqual(set([1]), analysis.clean)
+        self.assertEqual(frozenset(["B"]), analysis.state_before(program, 3).variables)
+
+    def test_computed_jump_into_a_block(self):
+        # B may be tainted when the computed jump lands on the Store, even right after its untainted Assign
+        program = Program([
+            Assign("B", GetInput([UInt32(3)])),
+            Goto(Var("B")),
+            Assign("B", Value(UInt32(1))),
+            Store(Value(UInt32(1)), Var("B")),
+            Goto(Value(UInt32(5)))
+        ])
+        analysis = TaintAnalysis(program)
+        self.assertEqual(set([4]), analysis.clean)
+        self.assertEqual(frozenset(["B"]), analysis.state_before(program, 3).variables)
+
+    def test_unreached_blocks(self):
+        program = Program([Goto(Value(UInt32(2))), Goto(Var("X")), Goto(Value(UInt32(3)))])
+        analysis = TaintAnalysis(program, TaintState(frozenset(["X"])))
+        self.assertEqual(set([0, 2]), analysis.clean)
+        self.assertTrue(analysis.state_before(program, 1) is None)
+
+    def test_long_block(self):
+        # a straight line of assignments, each one tainted through the previous one
+        size = 3000
+        stmts = [Assign("X0", GetInput([]))]
+        stmts.extend(Assign("X%d" % index, Var("X%d" % (index - 1))) for index in range(1, size))
+        stmts.append(Goto(Var("X%d" % (size - 1))))
+        stmts.append(Goto(Value(UInt32(size + 2))))
+        program = Program(stmts)
+        analysis = TaintAnalysis(program)
+        self.assertEqual(set([size + 1]), analysis.clean)
+        self.assertFalse(hasattr(analysis, 'states'))
+        self.assertEqual(size, len(analysis.state_before(program, size).variables))
+
+    def test_context_state(self):
+        context = a_context().with_program(clean_loop()).build()
+        self.assertEqual(TaintState(), TaintState.of_context(context))
+        context.variables["T"] = Value(UInt32(1), True)
+        context.variables["U"] = Value(UInt32(1))
+        context.set_mem_range_taint(UInt32(10), UInt32(20), True)
+        self.assertEqual(TaintState(frozenset(["T"]), False, True), TaintState.of_context(context))
+        context.set_mem_value(UInt32(5), Value(UInt32(1), True))
+        self.assertTrue(TaintState.of_context(context).memory)
+        self.assertEqual(TaintState(frozenset(["T"])), TaintState.of_context(context, False, False))
+        context.set_mem_value(UInt32(5), Value(UInt32(1)))
+        context.set_mem_range_taint(UInt32(10), UInt32(20), False)
+        context.set_mem_address_taint(UInt32(8000), True)
+        self.assertEqual(TaintState(frozenset(["T"]), False, True), TaintState.of_context(context))
+
+    def test_program_accesses(self):
+        self.assertEqual((True, True, True), program_accesses(clean_loop()))
+        self.assertEqual((False, True, False), program_accesses(Program([Store(Value(UInt32(1)), GetInput([]))])))
+        self.assertEqual((True, False, False), program_accesses(Program([
+            IF(EQ(Load(Value(UInt32(1))), Value(UInt32(0))), Value(UInt32(1)), Value(UInt32(1)))])))
+        self.assertEqual((False, False, True), program_accesses(Program([Goto(Value(UInt32(1)))])))
+
+    def test_cached(self):
+        program = clean_loop()
+        self.assertTrue(taint_analysis(program, TaintState()) is taint_analysis(program, TaintState()))
+        self.assertFalse(taint_analysis(program, TaintState()) is taint_analysis(program, TaintState(shadow=True)))
+
+
+class StaticTaintInterpreterTest(unittest.TestCase):
+    def run_program(self, interpreter_class, program, context=None):
+        policy = CountingPolicy()
+        context = context or a_context().with_program(program).build()
+        try:
+            interpreter_class(policy, DefaultTaintCheckHandler()).run(context)
+        except AttackException:
+            return context, policy.calls, True
+        return context, policy.calls, False
+
+    def test_same_results_fewer_checks(self):
+        expected, expected_calls, expected_attack = self.run_program(Interpreter, clean_loop())
+        context, calls, attack = self.run_program(StaticTaintInterpreter, clean_loop())
+        self.assertFalse(expected_attack)
+        self.assertFalse(attack)
+        self.assertEqual(expected.pc, context.pc)
+        self.assertEqual(dict(expected.variables.items()), dict(context.variables.items()))
+        for address in (1, 2, 3, 4, 9, 100, 101, 102):
+            self.assertEqual(expected.get_mem_value(UInt32(address)), context.get_mem_value(UInt32(address)))
+            self.assertEqual(expected.get_mem_address_taint(UInt32(address)),
+                             context.get_mem_address_taint(UInt32(address)))
+        self.assertEqual(expected_calls - 4 - 3 - 1, calls)
+
+    def test_same_attacks(self):
+        def program():
+            return Program([
+                Assign("A", Value(UInt32(2))),
+                Goto(Var("A")),
+                Assign("B", GetInput([UInt32(5)])),
+                Goto(Var("B")),
+                Store(Value(UInt32(1)), Value(UInt32(1))),
+                Goto(Value(UInt32(6)))
+            ])
+
+        expected, _, expected_attack = self.run_program(Interpreter, program())
+        context, calls, attack = self.run_program(StaticTaintInterpreter, program())
+        self.assertTrue(expected_attack)
+        self.assertTrue(attack)
+        self.assertEqual(expected.pc, context.pc)
+        self.assertEqual(1, calls)
+
+    def test_tainted_context(self):
+        program = Program([Store(Value(UInt32(7)), Value(UInt32(1)))])
+        context = a_context().with_program(program).build()
+        context.set_mem_address_taint(UInt32(7), True)
+        context, calls, _ = self.run_program(StaticTaintInterpreter, program, context)
+        self.assertEqual(1, calls)
+        self.assertFalse(context.get_mem_address_taint(UInt32(7)))
+
+    def test_analysed_once_it_pays_off(self):
+        interpreter = StaticTaintInterpreter(CountingPolicy(), DefaultTaintCheckHandler())
+        program = Program([Store(Value(UInt32(7)), Value(UInt32(1))), Goto(Value(UInt32(5)))])
+        # without loops, the first run executes every statement once, as the analysis would: it runs unanalysed
+        interpreter.run(a_context().with_program(program).build())
+        self.assertEqual(2, interpreter.taint_policy.calls)
+        # later runs have both statements clean
+        for _ in range(2):
+            interpreter.run(a_context().with_program(program).build())
+        self.assertEqual(2, interpreter.taint_policy.calls)
+        loop = clean_loop()
+        _, first_calls, _ = self.run_program(StaticTaintInterpreter, loop)
+        _, plain_calls, _ = self.run_program(Interpreter, clean_loop())
+        self.assertTrue(first_calls < plain_calls)
+
+    def test_policy_without_static_taint(self):
+        class Checked(CountingPolicy):
+            static_taint = False
+
+        interpreter = StaticTaintInterpreter(Checked(), DefaultTaintCheckHandler())
+        program = Program([Store(Value(UInt32(7)), Value(UInt32(1))), Goto(Value(UInt32(5)))])
+        interpreter.run(a_context().with_program(program).build())
+        self.assertEqual(2, interpreter.taint_policy.calls)
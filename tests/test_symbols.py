@@ -0,0 +1,142 @@
+import pickle
+import unittest
+from symbolic_engine import (Program, Assign, AddOp, Value, GetInput, IF, Var, UInt32, DefaultTaintPolicy,
+                             DefaultTaintCheckHandler, MulOp, SubOp, EQ, GT, ConcolicInterpreter, IdProvider,
+                             SymbolFactory, SymInput, Simplifier, SymTrue, SymFalse, ConcolicValue, Store, Load,
+                             TaintCheckHandler)
+from symbolic_engine.explorer import Explorer
+from test_taint import a_context
+
+
+class SymbolFactoryTest(unittest.TestCase):
+    def setUp(self):
+        self.factory = SymbolFactory()
+
+    def test_equal_terms_are_identical(self):
+        s_1 = self.factory.input("s_1")
+        first = self.factory.binop(MulOp, Value(UInt32(2)), s_1)
+        second = self.factory.binop(MulOp, Value(UInt32(2)), SymInput("s_1"))
+        self.assertTrue(first is second)
+        self.assertEqual(hash(first), first.structural_hash())
+        self.assertFalse(first is self.factory.binop(MulOp, Value(UInt32(3)), s_1))
+        self.assertFalse(first is self.factory.binop(AddOp, Value(UInt32(2)), s_1))
+
+    def test_intern_copies(self):
+        term = self.factory.conj(self.factory.input("s_1"), self.factory.negate(self.factory.input("s_2")))
+        copy = pickle.loads(pickle.dumps(term, pickle.HIGHEST_PROTOCOL))
+        self.assertFalse(copy is term)
+        self.assertTrue(self.factory.intern(copy) is term)
+
+    def test_constraints_share_subterms(self):
+        the_input = GetInput([UInt32(10), UInt32(30)])
+        program = Program([
+            Assign("X", MulOp(Value(UInt32(2)), the_input)),
+            IF(EQ(SubOp(Var("X"), AddOp(Value(UInt32(3)), Value(UInt32(2)))), Value(UInt32(15))), Value(UInt32(2)),
+               Value(UInt32(3))),
+            Assign("Y", AddOp(Value(UInt32(3)), Var("X"))),
+            IF(GT(Var("Y"), SubOp(the_input, Value(UInt32(20)))), Value(UInt32(4)), Value(UInt32(5)))
+        ])
+        interpreter = ConcolicInterpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler(), IdProvider(),
+                                          factory=self.factory)
+        context = interpreter.run(a_context().with_program(program).build())
+        two_s_1 = self.factory.binop(MulOp, Value(UInt32(2)), self.factory.input("s_1"))
+        self.assertTrue(context.resolve_name("X").symbolic is two_s_1)
+        self.assertTrue(context.resolve_name("Y").symbolic.left is two_s_1)
+        self.assertTrue(interpreter.constraints.left.left is two_s_1)
+
+
+class SimplifierTest(unittest.TestCase):
+    def setUp(self):
+        self.factory = SymbolFactory()
+        self.simplifier = Simplifier(self.factory)
+        self.x = self.factory.input("s_1")
+
+    def const(self, value):
+        return Value(UInt32(value))
+
+    def test_identities(self):
+        self.assertTrue(self.simplifier.binop(AddOp, self.x, self.const(0)) is self.x)
+        self.assertTrue(self.simplifier.binop(MulOp, self.const(1), self.x) is self.x)
+        self.assertEqual(UInt32(0), self.simplifier.binop(SubOp, self.x, self.x).value)
+        self.assertEqual(UInt32(0), self.simplifier.binop(MulOp, self.x, self.const(0)).value)
+        self.assertEqual(UInt32(1), self.simplifier.binop(EQ, self.x, self.x).value)
+
+    def test_tainted_constants_are_kept(self):
+        node = self.simplifier.binop(AddOp, self.x, Value(UInt32(0), tainted=True))
+        self.assertTrue(isinstance(node, AddOp))
+
+    def test_nested_constants_wrap_at_32_bits(self):
+        node = self.simplifier.binop(AddOp, self.simplifier.binop(AddOp, self.x, self.const(2 ** 32 - 1)),
+                                     self.const(3))
+        self.assertTrue(node is self.factory.binop(AddOp, self.x, self.const(2)))
+        node = self.simplifier.binop(SubOp, self.simplifier.binop(AddOp, self.const(3), self.x), self.const(5))
+        self.assertTrue(node is self.factory.binop(SubOp, self.x, self.const(2)))
+        self.assertTrue(self.simplifier.binop(SubOp, node, self.const(2 ** 32 - 2)) is self.x)
+
+    def test_equality_moves_constants(self):
+        node = self.simplifier.binop(EQ, self.simplifier.binop(SubOp, self.x, self.const(5)), self.const(15))
+        self.assertTrue(node is self.factory.binop(EQ, self.x, self.const(20)))
+
+    def test_conjunctions(self):
+        self.assertTrue(self.simplifier.conj(SymTrue, self.x) is self.x)
+        self.assertTrue(self.simplifier.conj(self.x, self.const(1)) is self.x)
+        self.assertTrue(self.simplifier.conj(self.x, self.const(0)) is SymFalse)
+        self.assertTrue(self.simplifier.negate(self.simplifier.negate(self.x)) is self.x)
+
+    def test_memoized(self):
+        node = self.simplifier.binop(AddOp, self.simplifier.binop(AddOp, self.x, self.const(1)), self.const(1))
+        self.assertTrue(node is self.simplifier.binop(AddOp, self.simplifier.binop(AddOp, self.x, self.const(1)),
+                                                      self.const(1)))
+
+
+class ConcolicValueTest(unittest.TestCase):
+    def program(self, inputs):
+        the_input = GetInput(inputs)
+        return Program([
+            Assign("X", AddOp(the_input, Value(UInt32(1)))),
+            Assign("C", MulOp(Value(UInt32(3)), Value(UInt32(4)))),
+            Assign("Z", SubOp(Var("X"), Var("X"))),
+            IF(GT(Var("X"), Value(UInt32(10))), Value(UInt32(5)), Value(UInt32(4))),
+            Assign("Small", Value(UInt32(1))),
+            IF(EQ(Var("C"), Value(UInt32(12))), Value(UInt32(6)), Value(UInt32(6))),
+            Store(Var("X"), Var("X")),
+            Assign("L", Load(Var("X")))
+        ])
+
+    def run_program(self, inputs):
+        interpreter = ConcolicInterpreter(DefaultTaintPolicy(), TaintCheckHandler(), IdProvider())
+        return interpreter, interpreter.run(a_context().with_program(self.program(inputs)).build())
+
+    def test_shadow_values(self):
+        interpreter, context = self.run_program([UInt32(3)])
+        x = context.resolve_name("X")
+        self.assertTrue(isinstance(x, ConcolicValue))
+        self.assertEqual(UInt32(4), x.value)
+        self.assertTrue(x.tainted)
+        self.assertEqual("(s_1) + (1)", str(x.symbolic))
+        self.assertEqual(Value(UInt32(12)), context.resolve_name("C"))
+        # the input cancels out
+        self.assertEqual(UInt32(0), context.resolve_name("Z").value)
+        self.assertTrue(context.resolve_name("Z").__class__ is Value)
+        self.assertTrue(context.resolve_name("L") is x)
+
+    def test_branches_follow_the_concrete_values(self):
+        interpreter, context = self.run_program([UInt32(3)])
+        self.assertTrue("Small" in context.variables)
+        self.assertEqual("NOT (((s_1) + (1)) > (10))", str(interpreter.constraints))
+        self.assertEqual(0, interpreter.solver.queries)
+        interpreter, context = self.run_program([UInt32(30)])
+        self.assertFalse("Small" in context.variables)
+        self.assertEqual("((s_1) + (1)) > (10)", str(interpreter.constraints))
+
+    def test_symbolic_inputs(self):
+        interpreter = ConcolicInterpreter(DefaultTaintPolicy(), TaintCheckHandler(), IdProvider())
+        program = Program(self.program([]).stmts[:5])
+        context = interpreter.run(a_context().with_program(program).build())
+        self.assertTrue(isinstance(context.resolve_name("X"), AddOp))
+        self.assertEqual(1, interpreter.solver.queries)
+
+    def test_explorer_ignores_concrete_inputs(self):
+        program = Program(self.program([UInt32(3), UInt32(3)]).stmts[:5])
+        explorer = Explorer(DefaultTaintPolicy(), TaintCheckHandler(), processes=0)
+        self.assertEqual(2, len(list(explorer.explore(a_context().with_program(program).build()))))
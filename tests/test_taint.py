@@ -183,7 +183,7 @@ class TestSymbolicExecution(unittest.TestCase):
                                                print_statements=True)
 
     def test_bed(self):
-        the_input = GetInput([UInt32(3), UInt32(1)])
+        the_input = GetInput([UInt32(10), UInt32(30)])
         program = Program([
             Assign("X", MulOp(Value(UInt32(2)), the_input)),
             IF(EQ(SubOp(Var("X"), AddOp(Value(UInt32(3)), Value(UInt32(2)))), Value(UInt32(15))), Value(UInt32(2)),
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+from symbolic_engine import (Program, Assign, Value, GetInput, UInt32, Interpreter, DefaultTaintPolicy,
+                             DefaultTaintCheckHandler, TaintCheckHandler, Store, Goto, AddOp, MulOp, EQ, IF, Var,
+                             ConcolicInterpreter, IdProvider, BitVec64)
+from symbolic_engine import trace
+from symbolic_engine.compiler import CompiledInterpreter
+from test_taint import a_context
+
+
+def traced_program():
+    the_input = GetInput([UInt32(10)])
+    return Program([
+        Assign("X", MulOp(Value(UInt32(2)), the_input)),
+        IF(EQ(Var("X"), Value(UInt32(20))), Value(UInt32(2)), Value(UInt32(3))),
+        Store(Value(UInt32(0x100)), Var("X")),
+        Goto(Value(UInt32(4))),
+        Assign("Y", AddOp(Var("X"), Value(UInt32(1))))
+    ])
+
+
+class TraceTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def run_traced(self, interpreter, capacity=2):
+        with trace.TraceRecorder(self.path, capacity=capacity, segments=2) as recorder:
+            interpreter.tracer = recorder
+            interpreter.run(a_context().with_program(traced_program()).build())
+        return list(trace.read_trace(self.path))
+
+    def test_records(self):
+        records = self.run_traced(Interpreter(DefaultTaintPolicy(), TaintCheckHandler()))
+        self.assertEqual([0, 1, 2, 3, 4], [record.pc for record in records])
+        self.assertEqual([trace.ASSIGN, trace.IF, trace.STORE, trace.GOTO, trace.ASSIGN],
+                         [record.opcode for record in records])
+        assign, branch, store, goto, last = records
+        self.assertEqual(("X", 20, trace.VALUE_TAINTED), (assign.target, assign.value, assign.flags))
+        self.assertEqual((2, trace.BRANCH_TAKEN), (branch.target, branch.flags))
+        self.assertEqual((0x100, 20, trace.VALUE_TAINTED), (store.target, store.value, store.flags))
+        self.assertEqual((4, 0), (goto.target, goto.flags))
+        self.assertEqual(("Y", 21), (last.target, last.value))
+
+    def test_compiled_code_records_the_same(self):
+        expected = self.run_traced(Interpreter(DefaultTaintPolicy(), TaintCheckHandler()))
+        interpreter = CompiledInterpreter(DefaultTaintPolicy(), TaintCheckHandler())
+        self.assertEqual(expected, self.run_traced(interpreter, capacity=3))
+        self.assertEqual(expected, self.run_traced(interpreter, capacity=64))
+
+    def test_symbolic_values(self):
+        records = self.run_traced(ConcolicInterpreter(DefaultTaintPolicy(), TaintCheckHandler(), IdProvider()))
+        # concolic values are traced with their concrete word and the taint of their input
+        self.assertEqual(trace.VALUE_SYMBOLIC | trace.VALUE_TAINTED, records[0].flags)
+        self.assertEqual(20, records[0].value)
+        self.assertEqual(trace.VALUE_SYMBOLIC | trace.VALUE_TAINTED, records[-1].flags)
+        self.assertEqual(21, records[-1].value)
+
+    def test_wide_values(self):
+        program = Program([Assign("A", Value(-1)), Assign("B", Value(BitVec64(2 ** 40))),
+                           Store(Value(BitVec64(2 ** 63 + 5)), Value(BitVec64(2 ** 64 - 1)))])
+        with trace.TraceRecorder(self.path) as recorder:
+            interpreter = Interpreter(DefaultTaintPolicy(), TaintCheckHandler())
+            interpreter.tracer = recorder
+            interpreter.run(a_context().with_program(program).build())
+        records = list(trace.read_trace(self.path))
+        self.assertEqual([-1, 2 ** 40, -1], [record.value for record in records])
+        self.assertEqual(5 - 2 ** 63, records[2].target)
+
+    def test_writer_errors_are_raised(self):
+        class BrokenStream(object):
+            closed = False
+
+            def write(self, data):
+                raise IOError("disk full")
+
+            def close(self):
+                self.closed = True
+
+        recorder = trace.TraceRecorder(self.path, capacity=1, segments=2)
+        recorder.stream.close()
+        recorder.stream = BrokenStream()
+
+        def record_many():
+            for pc in range(100):
+                recorder.goto(pc, Value(UInt32(pc)))
+
+        self.assertRaises(IOError, record_many)
+        self.assertRaises(IOError, recorder.close)
+        self.assertFalse(recorder.writer.is_alive())
+
+    def test_tracing_off(self):
+        interpreter = Interpreter(DefaultTaintPolicy(), DefaultTaintCheckHandler())
+        self.assertTrue(interpreter.tracer is None)
+        context = interpreter.run(a_context().with_program(traced_program()).build())
+        self.assertEqual(UInt32(21), context.resolve_name("Y").value)